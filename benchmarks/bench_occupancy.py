@@ -0,0 +1,80 @@
+# bench_occupancy.py – full‑yard scan vs. indexed occupancy
+# -------------------------------------------------
+# Compares the old "loop over every yard and every occupied slot"
+# lookup with the reverse index in occupancy.Occupancy at 10k slots.
+#
+#   python -m benchmarks.bench_occupancy [--slots 10000] [--yards 4]
+# -------------------------------------------------
+
+import argparse
+import random
+import timeit
+
+from occupancy import Occupancy, Occupant
+
+
+def _build(n_slots: int, n_yards: int):
+    per_yard = n_slots // n_yards
+    yards = {f"Y{i}": {"slots": range(1, per_yard + 1)}
+             for i in range(n_yards)}
+    legacy = {name: {"slots": {}} for name in yards}
+    occ = Occupancy(yards)
+    uid = 0
+    for name in yards:
+        for s in range(1, per_yard + 1):
+            uid += 1
+            legacy[name]["slots"][s] = {"user_id": uid}
+            occ.park(name, s, Occupant(uid, "x"))
+    return yards, legacy, occ, uid
+
+
+def _legacy_where(legacy: dict, uid: int):
+    for yard_name, yard in legacy.items():
+        for slot, info in yard["slots"].items():
+            if info["user_id"] == uid:
+                return yard_name, slot
+    return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--slots", type=int, default=10_000)
+    ap.add_argument("--yards", type=int, default=4)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    yards, legacy, occ, max_uid = _build(args.slots, args.yards)
+    rnd = random.Random(0)
+    # half hits (parked users), half misses (not parked → worst case scan)
+    uids = [rnd.randint(1, max_uid * 2) for _ in range(args.repeat)]
+
+    def legacy_run():
+        for u in uids:
+            _legacy_where(legacy, u)
+
+    def indexed_run():
+        for u in uids:
+            occ.where(u)
+
+    def indexed_leave_park():
+        for u in uids[:50]:
+            left = occ.leave(u)
+            if left:
+                occ.park(left[0], left[1], left[2])
+
+    def best(fn, ops: int) -> float:
+        return min(timeit.repeat(fn, number=1, repeat=3)) / ops
+
+    results = {
+        "legacy scan": best(legacy_run, len(uids)),
+        "indexed where": best(indexed_run, len(uids)),
+        "indexed leave+park": best(indexed_leave_park, len(uids[:50])),
+    }
+    print(f"{args.slots} slots in {args.yards} yards, {args.repeat} lookups")
+    for name, t in results.items():
+        print(f"  {name:<20} {t * 1e6:10.2f} µs/op")
+    print(f"  speed‑up (where)     {results['legacy scan'] / results['indexed where']:10.0f}×")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# loadtest.py – morning‑rush load test against the real handlers
+# -------------------------------------------------
+# Replays synthetic Telegram updates for N users (share phone → choose
+# yard → park anywhere → status → leave, several rounds) either through
+# the FastAPI webhook route (ingest queue included) or straight into
+# ``application.process_update``.  The Telegram API is replaced by a
+# local fake with configurable latency, so nothing leaves the box.
+# Each simulated user waits for the bot to finish handling a message
+# before sending the next one, like a person waiting for the reply.
+#
+#   python -m benchmarks.loadtest [--users 200] [--rounds 3]
+#       [--mode webhook|direct] [--api-latency-ms 40] [--backend memory]
+#       [--webhook-reply] [--out benchmarks/results/loadtest-<time>.json]
+#
+# --webhook-reply turns on WEBHOOK_REPLY: updates are handled inside the
+# webhook request and lone replies come back in its response (counted
+# under "webhook_replies" – calls that never hit the fake API).
+#
+# Writes throughput and p50/p95/p99 per handler as JSON; a one‑line
+# summary per handler goes to stdout.
+# -------------------------------------------------
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from telegram.request import BaseRequest, RequestData
+
+API_METHODS_WITH_MESSAGE = {"sendMessage", "editMessageText", "editMessageReplyMarkup"}
+
+
+# ── fake Telegram API ──────────────────────────────────────────────────────────
+class FakeRequest(BaseRequest):
+    """Answers every Bot API call locally after ``latency`` ± 50 % seconds."""
+
+    def __init__(self, latency: float, seed: int = 0):
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        self._rnd = random.Random(seed)
+        self._message_id = 0
+        self.last_message: dict[int, int] = {}     # chat_id -> id of the last message sent
+        self.webhook_url = ""
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> tuple[int, bytes]:
+        api = url.rsplit("/", 1)[-1]
+        self.calls[api] = self.calls.get(api, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self._rnd.uniform(0.5, 1.5))
+        params = request_data.parameters if request_data else {}
+        if api == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Load", "username": "loadtest_bot"}
+        elif api == "getWebhookInfo":
+            result = {"url": self.webhook_url, "has_custom_certificate": False,
+                      "pending_update_count": 0}
+        elif api == "setWebhook":
+            self.webhook_url = params.get("url", "")
+            result = True
+        elif api in API_METHODS_WITH_MESSAGE:
+            self._message_id += 1
+            if api == "sendMessage":
+                self.last_message[int(params.get("chat_id", 0))] = self._message_id
+            result = {"message_id": self._message_id, "date": int(time.time()),
+                      "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                      "text": params.get("text", "")}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+# ── synthetic updates ──────────────────────────────────────────────────────────
+class Updates:
+    """Builds Telegram ``Update`` payloads with increasing ids."""
+
+    def __init__(self):
+        self.update_id = 0
+
+    def _base(self, uid: int) -> dict:
+        self.update_id += 1
+        return {"update_id": self.update_id,
+                "message": {"message_id": self.update_id, "date": int(time.time()),
+                            "chat": {"id": uid, "type": "private"},
+                            "from": {"id": uid, "is_bot": False, "first_name": f"User{uid}"}}}
+
+    def text(self, uid: int, text: str) -> dict:
+        upd = self._base(uid)
+        upd["message"]["text"] = text
+        return upd
+
+    def contact(self, uid: int, phone: str) -> dict:
+        upd = self._base(uid)
+        upd["message"]["contact"] = {"phone_number": phone, "first_name": f"User{uid}",
+                                     "user_id": uid}
+        return upd
+
+    def callback(self, uid: int, data: str, message_id: int = 0) -> dict:
+        """A tap on an inline button under the bot's message *message_id*."""
+        upd = self._base(uid)
+        message = upd.pop("message")
+        sender = message.pop("from")
+        message["message_id"] = message_id
+        message["from"] = {"id": 1, "is_bot": True, "first_name": "Load"}
+        upd["callback_query"] = {"id": str(upd["update_id"]), "from": sender, "chat_instance": str(uid),
+                                 "data": data, "message": message}
+        return upd
+
+
+def user_script(uid: int, phone: str, yard: str, rounds: int, statuses: int):
+    """(handler label, kind, payload) steps one user goes through."""
+    yield "receive_phone", "contact", phone
+    yield "choose_yard", "text", "🏢 Choose Yard"
+    yield "set_yard", "text", yard
+    for _ in range(rounds):
+        yield "ask_parking_slot", "text", "🅿️ Park"
+        yield "handle_parking_slot", "callback", f"park:{yard}:any"
+        for _ in range(statuses):
+            yield "status", "text", "📋 Status"
+        yield "leave", "text", "🚶 Leave"
+
+
+# ── stats ──────────────────────────────────────────────────────────────────────
+def percentile(sorted_ms: list[float], q: float) -> float:
+    """Nearest‑rank percentile of an already sorted list."""
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, round(q / 100 * len(sorted_ms) + 0.5) - 1))
+    return sorted_ms[k]
+
+
+def summarise(samples: dict[str, list[float]], wall: float) -> dict[str, dict]:
+    out = {}
+    for label, ms in sorted(samples.items()):
+        ms.sort()
+        out[label] = {"count": len(ms),
+                      "per_s": round(len(ms) / wall, 1),
+                      "mean_ms": round(sum(ms) / len(ms), 3),
+                      "p50_ms": round(percentile(ms, 50), 3),
+                      "p95_ms": round(percentile(ms, 95), 3),
+                      "p99_ms": round(percentile(ms, 99), 3),
+                      "max_ms": round(ms[-1], 3)}
+    return out
+
+
+def _quiet(verbose: bool):
+    """Silence the bot's per‑update prints unless --verbose."""
+    if verbose:
+        return contextlib.nullcontext()
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ── run ────────────────────────────────────────────────────────────────────────
+async def run(args) -> dict:
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:LOADTEST")
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="parkingbot-load-")
+    os.environ["STATE_BACKEND"] = args.backend
+    os.environ.setdefault("INGEST_QUEUE_SIZE", str(max(1000, args.users * 2)))
+    os.environ["WEBHOOK_REPLY"] = "1" if args.webhook_reply else "0"
+    with _quiet(args.verbose):
+        bot = importlib.import_module("bot")
+    from webhook_reply import ReplyingRequest
+
+    fake = FakeRequest(args.api_latency_ms / 1000, seed=args.seed)
+    # never talk to api.telegram.org
+    bot.application.bot._request = (fake, ReplyingRequest(fake) if bot.WEBHOOK_REPLY else fake)
+    bot.BACKGROUND_BOT._request = (fake, fake)
+    rnd = random.Random(args.seed)
+    yards = list(bot.PARKING_YARDS)
+    users = [(10_000 + i, f"+97250{i:07d}", rnd.choice(yards)) for i in range(args.users)]
+
+    samples: dict[str, list[float]] = {}
+    done: dict[int, asyncio.Future] = {}
+    replies: dict[str, int] = {}
+    updates = Updates()
+
+    async def timed_process(update: dict):
+        try:
+            await process(update)
+        finally:
+            fut = done.pop(update["update_id"], None)
+            if fut is not None and not fut.done():
+                fut.set_result(None)
+
+    if args.mode == "webhook":
+        import httpx
+        from fastapi import FastAPI
+
+        process = bot.INGEST.process
+        bot.INGEST.process = timed_process
+        app = FastAPI()
+        app.include_router(bot.router)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+        async def deliver(update: dict):
+            if bot.WEBHOOK_REPLY:                    # handled within the request
+                t0 = time.perf_counter()
+                resp = await client.post(bot.WEBHOOK_PATH, json=update)
+                samples.setdefault("webhook_ack", []).append((time.perf_counter() - t0) * 1000)
+                body = resp.json() if resp.status_code == 200 else None
+                if body:
+                    replies[body["method"]] = replies.get(body["method"], 0) + 1
+                return resp.status_code == 200
+            fut = done[update["update_id"]] = asyncio.get_running_loop().create_future()
+            t0 = time.perf_counter()
+            resp = await client.post(bot.WEBHOOK_PATH, json=update)
+            samples.setdefault("webhook_ack", []).append((time.perf_counter() - t0) * 1000)
+            if resp.status_code != 200:
+                done.pop(update["update_id"], None)
+                return False
+            await fut
+            return True
+    else:
+        from telegram import Update
+
+        async def deliver(update: dict):
+            bot.STATE.refresh()
+            await bot.application.process_update(Update.de_json(update, bot.application.bot))
+            return True
+
+    rejected = 0
+
+    async def simulate(uid: int, phone: str, yard: str):
+        nonlocal rejected
+        await asyncio.sleep(rnd.uniform(0, args.ramp))
+        for label, kind, payload in user_script(uid, phone, yard, args.rounds, args.statuses):
+            if kind == "callback":                   # tap under the picker just sent
+                update = updates.callback(uid, payload, fake.last_message.get(uid, 0))
+            else:
+                update = getattr(updates, kind)(uid, payload)
+            t0 = time.perf_counter()
+            if await deliver(update):
+                samples.setdefault(label, []).append((time.perf_counter() - t0) * 1000)
+            else:
+                rejected += 1
+            if args.think:
+                await asyncio.sleep(rnd.expovariate(1 / args.think))
+
+    with _quiet(args.verbose):
+        bot.load_persistent()
+        for _uid, phone, _yard in users:
+            await bot.STATE.allow(phone)
+        await bot.application.initialize()
+        await bot.NOTIFIER.start()
+        if args.mode == "webhook":
+            await bot.INGEST.start()
+        bot.READY.set()
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(simulate(*u) for u in users))
+        wall = time.perf_counter() - t0
+
+        if args.mode == "webhook":
+            await client.aclose()
+        await bot.shutdown()
+
+    handled = sum(len(v) for k, v in samples.items() if k != "webhook_ack")
+    return {
+        "bench": "loadtest",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_rev": _git_rev(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "verbose")},
+        "wall_s": round(wall, 3),
+        "updates": handled,
+        "updates_per_s": round(handled / wall, 1),
+        "rejected": rejected,
+        "handlers": summarise(samples, wall),
+        "api_calls": dict(sorted(fake.calls.items())),
+        "webhook_replies": dict(sorted(replies.items())),
+        "notifier": {k: getattr(bot.NOTIFIER, k) for k in ("sent", "coalesced", "retried", "failed")},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--rounds", type=int, default=3, help="park/leave cycles per user")
+    ap.add_argument("--statuses", type=int, default=2, help="status checks per round")
+    ap.add_argument("--mode", choices=("webhook", "direct"), default="webhook")
+    ap.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    ap.add_argument("--webhook-reply", action="store_true",
+                    help="answer lone replies in the webhook response (WEBHOOK_REPLY=1)")
+    ap.add_argument("--api-latency-ms", type=float, default=40.0)
+    ap.add_argument("--ramp", type=float, default=2.0, help="seconds over which users arrive")
+    ap.add_argument("--think", type=float, default=0.05, help="mean pause between messages (s)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path,
+                    default=Path("benchmarks/results") / time.strftime("loadtest-%Y%m%d-%H%M%S.json"))
+    ap.add_argument("--verbose", action="store_true", help="keep the bot's own log output")
+    args = ap.parse_args()
+
+    result = asyncio.run(run(args))
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+    print(f"{result['updates']} updates in {result['wall_s']} s "
+          f"({result['updates_per_s']}/s, {result['rejected']} rejected, {args.mode}, {args.backend})")
+    print(f"  {'handler':<22}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}  ms")
+    for label, h in result["handlers"].items():
+        print(f"  {label:<22}{h['count']:>7}{h['p50_ms']:>10.2f}{h['p95_ms']:>10.2f}{h['p99_ms']:>10.2f}")
+    print(f"  api calls {sum(result['api_calls'].values())}, "
+          f"in webhook responses {sum(result['webhook_replies'].values())}")
+    print(f"→ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
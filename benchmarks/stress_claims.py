@@ -0,0 +1,207 @@
+# stress_claims.py – no double booking under concurrent updates
+# -------------------------------------------------
+# Many more users than slots hammer the same yards at once through the
+# real handlers: "🅿️ Park", then a tap on a hot slot or "Park anywhere"
+# in the inline picker, then "🚶 Leave".  Updates go through the webhook path
+# (``_process_raw`` → concurrent_updates processor); with --dup a share
+# of park / leave taps is delivered twice at the same moment,
+# bypassing the per‑user ordering, as two workers would.
+# The Telegram API is faked (see loadtest.py) with a few ms latency so
+# handlers interleave on every await.
+#
+#   python -m benchmarks.stress_claims [--users 120] [--rounds 20]
+#       [--backend memory|sqlite] [--dup 0.2] [--hot 4]
+#
+# Checked afterwards (exit status 1 on any violation):
+# * every "✅ Parked in slot N" reply matches exactly one park in the
+#   occupancy event log, for that user and slot
+# * replaying the event log, no slot is ever held twice and no user
+#   ever holds two slots
+# * the persisted state (journal / SQLite) equals the in‑process mirror
+# * before the run, "Park anywhere" in each (empty) yard parks –
+#   including yards with only charging slots
+# -------------------------------------------------
+
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.loadtest import FakeRequest, Updates, _quiet
+from occupancy import Occupancy
+from reservations import Reservations
+from state import MemoryBackend
+
+PARKED = re.compile(r"^✅ Parked in slot (\d+)")
+
+
+class RecordingRequest(FakeRequest):
+    """FakeRequest that also keeps every message text sent (or edited in) per chat."""
+
+    def __init__(self, latency: float, seed: int = 0):
+        super().__init__(latency, seed)
+        self.sent: list[tuple[int, str]] = []
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        if url.endswith(("/sendMessage", "/editMessageText")) and request_data is not None:
+            params = request_data.parameters
+            self.sent.append((int(params["chat_id"]), params.get("text", "")))
+        return await super().do_request(url, method, request_data, *args, **kwargs)
+
+
+def check(events: list[tuple], replies: list[tuple[int, str]]) -> list[str]:
+    """Violations found in the occupancy event log and the bot's replies."""
+    problems = []
+    holder: dict[tuple[str, int], int] = {}
+    where: dict[int, tuple[str, int]] = {}
+    parks: dict[int, list[int]] = {}
+    for event, yard, slot, uid in events:
+        if event == "park":
+            if (yard, slot) in holder:
+                problems.append(f"slot {yard}/{slot} double booked: {holder[yard, slot]} and {uid}")
+            if uid in where:
+                problems.append(f"user {uid} parked twice: {where[uid]} and {(yard, slot)}")
+            holder[yard, slot] = uid
+            where[uid] = (yard, slot)
+            parks.setdefault(uid, []).append(slot)
+        elif event == "leave":
+            holder.pop((yard, slot), None)
+            where.pop(uid, None)
+        else:
+            for key in [k for k in holder if k[0] == yard]:
+                where.pop(holder.pop(key), None)
+    told: dict[int, list[int]] = {}
+    for uid, text in replies:
+        m = PARKED.match(text)
+        if m:
+            told.setdefault(uid, []).append(int(m.group(1)))
+    for uid in set(told) | set(parks):
+        if sorted(told.get(uid, [])) != sorted(parks.get(uid, [])):
+            problems.append(f"user {uid} was told {told.get(uid, [])} but parked {parks.get(uid, [])}")
+    return problems
+
+
+def persisted(bot) -> dict[int, tuple[str, int]]:
+    """user → (yard, slot) as the state backend has it on disk."""
+    if bot.STATE_BACKEND == "sqlite":
+        with sqlite3.connect(bot.STATE.path) as db:
+            return {uid: (yard, slot) for yard, slot, uid in
+                    db.execute("SELECT yard, slot, user_id FROM slots")}
+    occ = Occupancy(bot.PARKING_YARDS)
+    fresh = MemoryBackend(occ, {}, set(), {}, Reservations({}), data_dir=bot.DATA_DIR)
+    fresh.load(dict)                        # snapshot + journal replay
+    fresh.journal.close()
+    return dict(occ.by_user)
+
+
+async def run(args) -> list[str]:
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:STRESS")
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="parkingbot-stress-")
+    os.environ["STATE_BACKEND"] = args.backend
+    with _quiet(args.verbose):
+        bot = importlib.import_module("bot")
+    from telegram import Update
+
+    fake = RecordingRequest(args.api_latency_ms / 1000, seed=args.seed)
+    bot.application.bot._request = (fake, fake)
+    bot.BACKGROUND_BOT._request = (fake, fake)
+    rnd = random.Random(args.seed)
+    yards = list(bot.PARKING_YARDS)
+    users = [(10_000 + i, f"+97250{i:07d}", rnd.choice(yards)) for i in range(args.users)]
+    events: list[tuple] = []
+    bot.OCCUPANCY.listeners.append(
+        lambda event, yard, slot, occ: events.append((event, yard, slot, occ and occ.user_id)))
+    updates = Updates()
+
+    async def twice(payload: dict):
+        """The same tap, delivered by two workers at the same moment."""
+        again = dict(payload, update_id=payload["update_id"] + 1_000_000)
+        await asyncio.gather(*(bot.application.process_update(Update.de_json(p, bot.application.bot))
+                               for p in (payload, again)))
+
+    async def send(uid: int, text: str, dup: bool = False, kind: str = "text"):
+        if kind == "callback":
+            payload = updates.callback(uid, text, fake.last_message.get(uid, 0))
+        else:
+            payload = updates.text(uid, text)
+        await (twice(payload) if dup else bot._process_raw(payload))
+
+    async def simulate(uid: int, yard: str):
+        hot = sorted(bot.OCCUPANCY.yards[yard].ids)[:args.hot]
+        for _ in range(args.rounds):
+            await send(uid, "🅿️ Park")
+            choice = "any" if rnd.random() < 0.5 else rnd.choice(hot)
+            await send(uid, f"park:{yard}:{choice}", dup=rnd.random() < args.dup, kind="callback")
+            await asyncio.sleep(rnd.uniform(0, 0.01))
+            await send(uid, "🚶 Leave", dup=rnd.random() < args.dup)
+
+    async def anywhere_parks() -> list[str]:
+        """One tap on "Park anywhere" per empty yard must park the user."""
+        problems = []
+        for i, yard in enumerate(yards):
+            uid, phone = 9_000 + i, f"+97252{i:07d}"
+            await bot.STATE.allow(phone)
+            await bot.STATE.set_phone(uid, phone)
+            await bot.STATE.set_yard(uid, yard)
+            await send(uid, "🅿️ Park")
+            await send(uid, f"park:{yard}:any", kind="callback")
+            if bot.OCCUPANCY.where(uid) is None:
+                problems.append(f"'Park anywhere' in empty yard {yard} did not park")
+            await send(uid, "🚶 Leave")
+        return problems
+
+    with _quiet(args.verbose):
+        bot.load_persistent()
+        for uid, phone, yard in users:
+            await bot.STATE.allow(phone)
+            await bot.STATE.set_phone(uid, phone)
+            await bot.STATE.set_yard(uid, yard)
+        await bot.application.initialize()
+        await bot.NOTIFIER.start()
+        bot.READY.set()
+        early = await anywhere_parks()
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(simulate(uid, yard) for uid, _phone, yard in users))
+        wall = time.perf_counter() - t0
+
+        problems = early + check(events, fake.sent)
+        mirror = dict(bot.OCCUPANCY.by_user)
+        await bot.shutdown()                # state is flushed and closed
+        on_disk = persisted(bot)
+    if on_disk != mirror:
+        problems.append(f"persisted state differs from the mirror: {on_disk} vs {mirror}")
+
+    parks = sum(1 for e in events if e[0] == "park")
+    print(f"{len(users)} users × {args.rounds} rounds in {wall:.2f} s ({args.backend}, "
+          f"dup {args.dup:g}): {parks} parks, {len(fake.sent)} messages, "
+          f"{len(problems)} violation(s)")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=120)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    ap.add_argument("--dup", type=float, default=0.2, help="share of taps delivered twice at once")
+    ap.add_argument("--hot", type=int, default=4, help="slot numbers users type (the first N)")
+    ap.add_argument("--api-latency-ms", type=float, default=3.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--verbose", action="store_true", help="keep the bot's own log output")
+    args = ap.parse_args()
+
+    problems = asyncio.run(run(args))
+    for p in problems[:20]:
+        print("  ✗", p)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
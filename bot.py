@@ -8,29 +8,36 @@
 
 
 # ── Standard Library ────────────────────────────────────────────────────────────
+import asyncio
+import io
 import json
 import os
-import tempfile
-from contextlib import suppress
-from datetime import datetime, timedelta
+import re
+import signal
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from threading import Lock
 
 
 # ── 3rd‑party ──────────────────────────────────────────────────────────────────
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from dotenv import load_dotenv
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 from pytz import timezone
 from telegram import (
     Bot,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
     KeyboardButton,
     ReplyKeyboardMarkup,
     Update,
+    User,
 )
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
@@ -38,6 +45,28 @@ from telegram.ext import (
     filters,
 )
 
+# ── Local ──────────────────────────────────────────────────────────────────────
+from blocking import compile_yards, resync, track
+from history import ENDED_EXPIRE, ENDED_LEAVE, ENDED_RESET, HistoryStore
+from ingest import DUPLICATES, PerUserProcessor, SeenUpdates, UpdateQueue
+from live_keyboards import LiveKeyboards
+from locks import KeyedLocks
+from loop_watchdog import Watchdog
+from metrics import REGISTRY, instrument
+from notify import Notifier
+from occupancy import Occupancy, Occupant
+from persistence import SQLitePersistence
+from phones import export_csv, normalise, parse_bulk
+from reservations import VISITOR, Booking, Reservations
+from slot_picker import SlotPicker
+from state import make_backend
+from status_cache import StatusCache
+from timers import Timers
+from transport import pools
+from waitlist import Waitlist
+from webhook_reply import ReplyingRequest, handle_with_reply, send_directly
+from yards import load_yards
+
 # ── Environment / Globals ──────────────────────────────────────────────────────
 load_dotenv()                                          # read .env file
 
@@ -45,32 +74,76 @@ TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
 WEBHOOK_HOST: str = os.getenv("WEBHOOK_URL", "")  # without /webhook suffix
 WEBHOOK_PATH = "/webhook"
 WEBHOOK_URL = WEBHOOK_HOST + WEBHOOK_PATH
-_JSON_LOCK = Lock()  # protect concurrent writes
 DATA_DIR = Path(os.getenv("DATA_DIR", "/data"))
 PHONES_FILE = DATA_DIR / "user_phones.json"   # persisted phone numbers
 ALLOW_FILE = DATA_DIR / "allowed_phones.json"
+TZ = timezone("Asia/Jerusalem")               # yards' local time (reset, analytics)
+# where shared state lives: "memory" (+ journal, single worker) or "sqlite"
+# (WAL database, safe with several uvicorn workers)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB = os.getenv("STATE_DB", str(DATA_DIR / "state.db"))
+# records between compacted snapshots of the write‑ahead journal
+JOURNAL_SNAPSHOT_EVERY = int(os.getenv("JOURNAL_SNAPSHOT_EVERY", "1000"))
+# updates handled at once (one at a time per user); claims are atomic, see STATE
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+# webhook ingestion: worker pool size, total queue bound, full‑queue policy
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(CONCURRENT_UPDATES)))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "1000"))
+INGEST_OVERFLOW = os.getenv("INGEST_OVERFLOW", "reject")   # reject | block | drop_oldest
+# recent update_ids remembered so Telegram's re‑deliveries are dropped
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", "4096"))
+# opt‑in: handle each update inside its webhook request and return a
+# lone reply as the response body (one outbound call less, see
+# webhook_reply.py); a handler still busy after the wait replies normally
+WEBHOOK_REPLY = os.getenv("WEBHOOK_REPLY", "0") == "1"
+WEBHOOK_REPLY_WAIT = float(os.getenv("WEBHOOK_REPLY_WAIT", "2"))
+# Bot API transport (see transport.py): connections per pool – replies
+# and edits vs. notifications and picker refreshes – idle keep‑alive,
+# HTTP/2 (needs the h2 package) and timeouts in seconds
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "256"))
+API_BACKGROUND_POOL_SIZE = int(os.getenv("API_BACKGROUND_POOL_SIZE", "16"))
+API_KEEPALIVE = float(os.getenv("API_KEEPALIVE", "60"))
+API_HTTP2 = os.getenv("API_HTTP2", "0") == "1"
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "10"))            # read / write
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_POOL_TIMEOUT = float(os.getenv("API_POOL_TIMEOUT", "5"))   # waiting for a free connection
+# conversation states (and chosen yards) are written behind, every N seconds
+PERSIST_INTERVAL = float(os.getenv("PERSIST_INTERVAL", "30"))
+# warm‑up steps (state load, getMe, setWebhook) are retried this often,
+# with exponential backoff, before the process gives up and exits
+WARMUP_ATTEMPTS = int(os.getenv("WARMUP_ATTEMPTS", "5"))
+# how long a freed slot is held for the waitlisted user it was offered to
+WAITLIST_HOLD_SECONDS = int(os.getenv("WAITLIST_HOLD_SECONDS", "120"))
+# loop blocked longer than this / handlers running longer than that get
+# their stacks sampled (collapsed stacks via /profile, see loop_watchdog.py)
+WATCHDOG_LAG_MS = float(os.getenv("WATCHDOG_LAG_MS", "100"))
+SLOW_HANDLER_MS = float(os.getenv("SLOW_HANDLER_MS", "2000"))
+PROFILE_DIR = DATA_DIR / "profiles"
+# bookings: how many days ahead, and how early before its start a booked
+# slot is kept for the booker (and can no longer be booked while taken)
+RESERVE_MAX_DAYS = int(os.getenv("RESERVE_MAX_DAYS", "14"))
+RESERVE_LEAD_MIN = int(os.getenv("RESERVE_LEAD_MIN", "30"))
 # Telegram user‑IDs allowed to run /reset_all and /addphone <number>
 ADMIN_IDS = {1997945569, 444100640}
 
 # ── Yard / slot configuration ──────────────────────────────────────────────────
-PARKING_YARDS: dict[str, dict] = {
-    "Hamasger50": {
-        "slots": {},                                 # runtime: {slot:int: info_dict}
-        "blocks": {                                 # which slots block which others
-            1: [], 2: [1], 3: [], 4: [3], 5: [], 6: [5], 7: [], 8: [7],
-            9: [], 10: [9], 11: [10, 9], 12: [], 13: [12], 14: [], 15: [],
-            16: [], 17: [], 18: [], 19: [], 20: [], 21: [], 22: [23, 24],
-            23: [24], 24: [], 25: [26], 26: [], 27: [28], 28: [], 29: [30],
-            30: [], 31: [],
-        },
-        "charging_slots": [],                        # specify charging‑only slots
-    },
-    "BeitNip": {
-        "slots": {},
-        "blocks": {1: [], 2: []},
-        "charging_slots": [1, 2],
-    },
-}
+# yards live in a JSON file so new structures don't need a redeploy (see yards.py)
+YARDS_FILE = Path(os.getenv("YARDS_FILE", Path(__file__).with_name("yards.json")))
+PARKING_YARDS: dict[str, dict] = load_yards(YARDS_FILE)
+
+# compiled blocking graphs (validated at import – a bad config fails fast)
+GRAPHS = compile_yards(PARKING_YARDS)
+# Runtime occupancy (who is parked where) – bitset per yard, indexed per user
+OCCUPANCY = Occupancy(PARKING_YARDS)
+# pre‑rendered /status text per yard, patched on every park/leave
+STATUS_CACHE = StatusCache(OCCUPANCY)
+track(GRAPHS, OCCUPANCY)
+# best free slot per yard for "Park anywhere"
+PICKER = SlotPicker(GRAPHS, OCCUPANCY)
+# serialise park / leave (+ the blocked‑car notifications around them) per yard
+YARD_LOCKS = KeyedLocks()
+# advance bookings per slot – survive the midnight reset (see reservations.py)
+RESERVATIONS = Reservations(GRAPHS)
 
 # These dicts are populated at runtime
 USER_PHONES: dict[int, str] = {}   # telegram_id -> phone
@@ -78,15 +151,34 @@ USER_YARD: dict[int, str] = {}     # telegram_id -> chosen yard name
 ALLOWED_PHONES: set[str] = set()  # phone strings loaded from JSON
 
 # ── Telegram Application ───────────────────────────────────────────────────────
+# in‑flight conversations survive restarts; with the memory backend the
+# chosen yards ride along (the SQLite backend already stores them)
+PERSISTENCE = SQLitePersistence(DATA_DIR / "conversations.db",
+                                user_yard=USER_YARD if STATE_BACKEND == "memory" else None,
+                                update_interval=PERSIST_INTERVAL)
+# the two Bot API pools, timed per pool for /metrics and /api; webhook
+# mode never polls, so getUpdates shares a pool instead of building a
+# third client at import
+_REQUEST, _BACKGROUND_REQUEST = pools(API_POOL_SIZE, API_BACKGROUND_POOL_SIZE, API_KEEPALIVE,
+                                      API_HTTP2, API_TIMEOUT, API_CONNECT_TIMEOUT,
+                                      API_POOL_TIMEOUT)
 application = (
     Application.builder()
     .token(TOKEN)
+    .request(ReplyingRequest(_REQUEST) if WEBHOOK_REPLY else _REQUEST)
+    .get_updates_request(_REQUEST)
+    .persistence(PERSISTENCE)
+    .concurrent_updates(PerUserProcessor(CONCURRENT_UPDATES))
     # make sure job_queue knows about the Application instance
     .post_init(lambda app: app.job_queue.set_application(app))
     .build()
 )
+# same token, own pool: what nobody is waiting on can't starve the replies
+BACKGROUND_BOT = Bot(TOKEN, request=_BACKGROUND_REQUEST, get_updates_request=_BACKGROUND_REQUEST)
+# outbound notifications (blocked / freed / reminders) go through this queue
+NOTIFIER = Notifier(BACKGROUND_BOT)
 
-# ── JSON helpers (atomic write) ─────────────────────────────────────────────
+# ── JSON helpers ──────────────────────────────────────────────────────────────
 
 
 def _read_json(path: str | Path, default):
@@ -101,42 +193,45 @@ def _read_json(path: str | Path, default):
     except (FileNotFoundError, json.JSONDecodeError):
         return default
 
-
-def _atomic_write(path: str | Path, data):
-    """
-    Atomically write *data* as JSON to *path* (str or Path).
-    Uses a temp file + replace so readers never see a half‐written file.
-    """
-    path = Path(path)             # accept either a str or Path
-    with _JSON_LOCK:              # prevent concurrent writers
-        tmp_dir = path.parent
-        with tempfile.NamedTemporaryFile(
-            "w", delete=False, dir=tmp_dir, encoding="utf-8"
-        ) as tmp:
-            json.dump(data, tmp, ensure_ascii=False, indent=2)
-        Path(tmp.name).replace(path)
-
 # ── Persistent load / save ─────────────────────────────────────────────────
 
 
-def load_persistent():
-    global USER_PHONES, ALLOWED_PHONES
-    USER_PHONES = {int(k): v for k, v in _read_json(PHONES_FILE, {}).items()}
+# Handlers read the in‑process mirrors (OCCUPANCY, USER_PHONES, …) and write
+# through STATE, which persists the change (journal or SQLite, see state.py).
+STATE = make_backend(
+    STATE_BACKEND, OCCUPANCY, USER_PHONES, ALLOWED_PHONES, USER_YARD, RESERVATIONS,
+    data_dir=DATA_DIR, snapshot_every=JOURNAL_SNAPSHOT_EVERY, db_path=STATE_DB,
+)
+# every finished stay, for the admin analytics commands
+HISTORY = HistoryStore(DATA_DIR / "history", TZ)
 
-    # normalise every entry read from JSON just in case it was saved “bare”
-    ALLOWED_PHONES_RAW = _read_json(ALLOW_FILE, [])
-    ALLOWED_PHONES = {_normalise(p) for p in ALLOWED_PHONES_RAW}
 
-    print("✅ phones", USER_PHONES)
-    print("✅ allow-list", ALLOWED_PHONES)
+def _record_stay(yard_name: str, slot: int, occ: Occupant, ended: int):
+    HISTORY.record(yard_name, slot, occ.user_id, occ.since,
+                   charging=OCCUPANCY.is_charging(yard_name, slot),
+                   ended=ended)
 
 
-def save_phones():
-    _atomic_write(PHONES_FILE, USER_PHONES)
+async def _reset_slots():
+    """Empty every yard, recording the stays this worker's reset ended (once across workers)."""
+    for name, slot, occ in await STATE.reset():
+        _record_stay(name, slot, occ, ENDED_RESET)
 
 
-def save_allow():
-    _atomic_write(ALLOW_FILE, list(ALLOWED_PHONES))
+def load_persistent():
+    """Fill phones, allow‑list and occupancy from the configured state backend."""
+    def legacy() -> dict:
+        # brand‑new store – migrate the legacy JSON files
+        return {
+            "phones": _read_json(PHONES_FILE, {}),
+            # normalise every entry read from JSON just in case it was saved “bare”
+            "allow": [p for p in map(normalise, _read_json(ALLOW_FILE, [])) if p],
+        }
+
+    STATE.load(legacy)
+    PERSISTENCE.load_user_yards()
+    print(f"✅ state: {len(USER_PHONES)} phones, {len(ALLOWED_PHONES)} allowed, "
+          f"{len(OCCUPANCY.by_user)} parked, {len(RESERVATIONS)} bookings")
 
 # ── HELPERS : AUTHORISATION & MENUS ─────────────────────────────────────────
 
@@ -159,27 +254,12 @@ def main_menu(user_id: int | None = None) -> ReplyKeyboardMarkup:
 async def ensure_yard(update: Update, _ctx: ContextTypes.DEFAULT_TYPE) -> str | None:
     """Ask user to pick a yard if they haven’t yet; return yard name or None."""
     uid = update.effective_user.id
-    if uid not in USER_YARD:
+    if USER_YARD.get(uid) not in PARKING_YARDS:      # unset, or removed by a reload
         await update.message.reply_text("⚠️ Please choose a yard first.", reply_markup=main_menu(uid))
         return None
     return USER_YARD[uid]
 
 
-def _normalise(raw: str) -> str:
-    """
-    Normalise Israeli phone numbers.
-    * “+9725….”  ->  unchanged
-    *  "9725…."  ->  "+9725…."
-    *   "0586…"  ->  "+972586…"
-    """
-    raw = raw.strip()
-    if raw.startswith("+"):
-        return raw                       # already international
-
-    if raw.startswith("972"):
-        return f"+{raw}"                # add '+' only
-    # local number like 05xxxxxxxx
-    return f"+972{raw.lstrip('0')}"
 # ─────────────────────────────── Handlers ─────────────────────────────────────
 
 # ADMIN COMMANDS
@@ -190,8 +270,7 @@ async def clear_phones(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS:
         return                                  # ignore non-admins
 
-    USER_PHONES.clear()                         # empty the dict
-    save_phones()                               # persist the change
+    await STATE.clear_phones()                  # empty and persist
     await update.message.reply_text("🗑️ All saved phone numbers were cleared.")
     print("🗑️ USER_PHONES cleared by admin")
 
@@ -202,12 +281,14 @@ async def add_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await update.message.reply_text("Usage: /addphone <digits>")
         return
-    phone = _normalise(context.args[0])
+    phone = normalise(context.args[0])
+    if phone is None:
+        await update.message.reply_text("❌ Not a valid phone number.")
+        return
     if phone in ALLOWED_PHONES:
         await update.message.reply_text("ℹ️ Already in allow‑list.")
         return
-    ALLOWED_PHONES.add(phone)
-    save_allow()
+    await STATE.allow(phone)
     await update.message.reply_text(f"✅ {phone} added.")
     print(f"✅ {phone} added to allow‑list.")
 
@@ -231,12 +312,15 @@ async def del_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await update.message.reply_text("Usage: /delphone <digits>")
         return
-    phone = _normalise(context.args[0])
+    phone = normalise(context.args[0])
+    if phone not in ALLOWED_PHONES:
+        # entries stored before E.164 validation may not normalise any more –
+        # remove them as listed by /listallowedphones
+        phone = context.args[0].strip()
     if phone not in ALLOWED_PHONES:
         await update.message.reply_text("ℹ️ Not found in allow‑list.")
         return
-    ALLOWED_PHONES.remove(phone)
-    save_allow()
+    await STATE.disallow(phone)
     await update.message.reply_text(f"🗑️ {phone} removed from allow‑list.")
     print(f"🗑️ {phone} removed from allow‑list.")
 
@@ -251,14 +335,151 @@ async def list_phones(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"📄 Allowed phones:\n{text}")
 
 
+MAX_IMPORT_BYTES = 5 * 1024 * 1024      # ~400k numbers; Telegram allows 20 MB
+
+
+async def import_phones(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin uploads a CSV / text file → every valid number joins the allow‑list."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    doc = update.message.document
+    if doc.file_size and doc.file_size > MAX_IMPORT_BYTES:
+        await update.message.reply_text(f"❌ File too large (max {MAX_IMPORT_BYTES // 2**20} MB).")
+        return
+    data = await (await doc.get_file()).download_as_bytearray()
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", errors="replace", newline="")
+    valid, invalid = await asyncio.to_thread(parse_bulk, lines)   # keep the loop free
+    new = valid - ALLOWED_PHONES
+    await STATE.allow_many(new)                  # one journal record / transaction
+    text = (f"📥 Import of {doc.file_name or 'file'}:\n"
+            f"✅ {len(new)} added\nℹ️ {len(valid) - len(new)} already allowed\n"
+            f"❌ {len(invalid)} invalid")
+    if invalid:
+        text += "\n" + "\n".join(invalid[:10]) + ("\n…" if len(invalid) > 10 else "")
+    await update.message.reply_text(text)
+    print(f"📥 {len(new)} phones imported to allow‑list ({len(invalid)} invalid)")
+
+
+async def export_phones(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send the allow‑list back as a CSV that the document import reads back."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    await update.message.reply_document(
+        document=export_csv(ALLOWED_PHONES), filename="allowed_phones.csv",
+        caption=f"📤 {len(ALLOWED_PHONES)} allowed phones")
+
+
 async def reset_all_slots(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS:
         return
-    for yard in PARKING_YARDS.values():
-        yard["slots"].clear()
+    async with YARD_LOCKS.hold(*OCCUPANCY.yards):
+        await _reset_slots()
     await update.message.reply_text("🧹 All yards reset.")
     print("🧹 All yards reset.")
 
+
+def _analytics_args(update: Update, context) -> tuple[str, float, float, int]:
+    """``/cmd [days] [yard]`` → (yard, since, until, days); yard defaults to the admin's."""
+    args = list(context.args or [])
+    # at least one day: an empty range has no utilisation to divide by
+    days = max(1, int(args.pop(0))) if args and args[0].isdigit() else 30
+    yard = args[0] if args and args[0] in PARKING_YARDS else (
+        USER_YARD.get(update.effective_user.id) or next(iter(PARKING_YARDS)))
+    until = time.time()
+    return yard, until - days * 86400, until, days
+
+
+async def usage_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Utilisation per slot and per hour of day."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    yard_name, since, until, days = _analytics_args(update, context)
+    per_slot, per_hour = HISTORY.utilisation(
+        yard_name, list(PARKING_YARDS[yard_name]["slots"]), since, until)
+    used = {s: u for s, u in per_slot.items() if u}
+    slots_txt = "\n".join(f"{s}: {u:.0%}" for s, u in used.items())
+    if used and len(used) < len(per_slot):
+        slots_txt += f"\n({len(per_slot) - len(used)} slots unused)"
+    hours_txt = "\n".join(f"{h:02d}:00 {'▇' * round(u * 10):<10} {u:.0%}"
+                          for h, u in enumerate(per_hour) if u)
+    await update.message.reply_text(
+        f"📊 {yard_name} utilisation, last {days} days\n\n"
+        f"By slot:\n{slots_txt or 'no data'}\n\nBy hour:\n{hours_txt or 'no data'}")
+
+
+async def dwell_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Average time a car stays, overall and per slot."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    yard_name, since, until, days = _analytics_args(update, context)
+    mean, per_slot, n = HISTORY.dwell(yard_name, since, until)
+
+    def hm(sec: float) -> str:
+        minutes = int(sec // 60)
+        return f"{minutes//60}h {minutes % 60}m"
+
+    rows = "\n".join(f"{s}: {hm(v)}" for s, v in per_slot.items())
+    await update.message.reply_text(
+        f"⏱️ {yard_name} dwell time, last {days} days ({n} stays)\n"
+        f"Average: {hm(mean)}\n\n{rows or 'no data'}")
+
+
+async def overstay_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Charging‑slot stays longer than the yard's reminder threshold."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    yard_name, since, until, days = _analytics_args(update, context)
+    limit = PARKING_YARDS[yard_name].get("reminder_after_min")
+    if not limit:
+        await update.message.reply_text(f"ℹ️ {yard_name} has no charging reminder threshold.")
+        return
+    counts = HISTORY.overstays(yard_name, limit * 60, since, until)
+    rows = "\n".join(f"⚡ {s}: {c}" for s, c in counts.items())
+    await update.message.reply_text(
+        f"🔌 {yard_name} charging overstays (> {limit} min), last {days} days\n\n"
+        f"{rows or 'none'}")
+
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [reset] – stack samples of loop stalls and slow handlers (collapsed format)."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    if context.args and context.args[0] == "reset":
+        WATCHDOG.reset()
+        await update.message.reply_text("🧹 Profile samples cleared.")
+        return
+    path = WATCHDOG.dump(PROFILE_DIR)
+    caption = (f"🔥 max loop lag {WATCHDOG.max_lag * 1000:.0f} ms, "
+               f"{sum(WATCHDOG.stacks.values())} samples – open in speedscope or flamegraph.pl")
+    if path is None:
+        await update.message.reply_text(f"✅ No samples yet (max loop lag {WATCHDOG.max_lag * 1000:.0f} ms).")
+        return
+    await update.message.reply_document(document=path.read_bytes(), filename=path.name, caption=caption)
+
+
+async def api_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/api – Bot API timings of the recent calls, per pool and method."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    lines = []
+    for req in (_REQUEST, _BACKGROUND_REQUEST):
+        open_, idle = req.connections()
+        lines.append(f"🔌 {req.pool}: {open_}/{req.size} connections ({idle} idle), "
+                     f"HTTP/{'2' if req.http2 else '1.1'}, last {len(req.recent)} calls")
+        by_api: dict[str, list[float]] = {}
+        failed: dict[str, int] = {}
+        for api, took, code in req.recent:
+            by_api.setdefault(api, []).append(took)
+            if not 200 <= code < 300:
+                failed[api] = failed.get(api, 0) + 1
+        for api, times in sorted(by_api.items(), key=lambda kv: -len(kv[1])):
+            times.sort()
+            p50, p95 = times[len(times) // 2], times[int(len(times) * 0.95)]
+            lines.append(f"  {api}: {len(times)} × p50 {p50 * 1000:.0f} / p95 {p95 * 1000:.0f} / "
+                         f"max {times[-1] * 1000:.0f} ms"
+                         + (f", {failed[api]} failed" if api in failed else ""))
+    await update.message.reply_text("\n".join(lines))
+
 # register admin handlers
 action_admins = [
     ("addphone", add_phone),
@@ -266,10 +487,18 @@ action_admins = [
     ("listallowedphones", list_phones),
     ("listuserphones", list_user_phones),
     ("reset_all_slots", reset_all_slots),
+    ("usage", usage_stats),
+    ("dwell", dwell_stats),
+    ("overstays", overstay_stats),
     ("clearphones", clear_phones),
+    ("exportphones", export_phones),
+    ("profile", profile),
+    ("api", api_stats),
 ]
 for cmd, fn in action_admins:
     application.add_handler(CommandHandler(cmd, fn))
+# bulk allow‑list import: an admin sends a .csv / .txt document
+application.add_handler(MessageHandler(filters.Document.ALL, import_phones))
 
 
 # /start -------------------------------------------------------------------
@@ -303,7 +532,7 @@ async def set_yard(update: Update, _ctx):
     uid = update.effective_user.id
     chosen = update.message.text.strip()
     if chosen in PARKING_YARDS:
-        USER_YARD[uid] = chosen
+        await STATE.set_yard(uid, chosen)
         await update.message.reply_text(
             f"✅ You’re now using *{chosen}*.",
             parse_mode="Markdown",
@@ -328,6 +557,8 @@ application.add_handler(
         fallbacks=[
             MessageHandler(filters.Regex(r"^❌ Cancel$"), set_yard)
         ],
+        name="choose_yard",
+        persistent=True,
     )
 )
 
@@ -341,29 +572,9 @@ async def status(update: Update, ctx):
     if yard_name is None:
         return
 
-    yard = PARKING_YARDS[yard_name]
-    total_slots = sorted(yard["blocks"])
-    taken_slots = sorted(yard["slots"])
-    free_slots = [s for s in total_slots if s not in taken_slots]
-
-    now = datetime.now()
-    lines: list[str] = []
-    for s in taken_slots:
-        info = yard["slots"][s]
-        prefix = "⚡ " if s in yard["charging_slots"] else ""
-        t_str = ""
-        if s in yard["charging_slots"]:
-            minutes = int(
-                (now - datetime.fromisoformat(info["time"])).total_seconds() // 60)
-            t_str = f" ({minutes//60}h {minutes % 60}m)"
-        lines.append(f"{prefix}{s} - {info['name']}{t_str}")
-
-    taken_txt = "\n".join(lines) or "None"
-    free_txt = ", ".join(map(str, free_slots)) or "None"
-
-    msg = (f"📋 *{yard_name} Parking Status:*\n\n"
-           f"🟢 Available slots: {free_txt}\n\n"
-           f"🔴 Taken slots:\n{taken_txt}")
+    msg = STATUS_CACHE.render(yard_name)
+    if OCCUPANCY.yards[yard_name].free_count() == 0 and WAITLIST_ENABLED:
+        msg += "\n\n🔔 Full – /waitlist and I’ll message you when a slot frees up."
     await update.message.reply_text(msg, parse_mode="Markdown", reply_markup=main_menu(uid))
 
 application.add_handler(CommandHandler("status", status))
@@ -389,9 +600,8 @@ async def receive_phone(update: Update, _ctx):
         return ConversationHandler.END
     uid = update.message.contact.user_id
     raw = update.message.contact.phone_number          # Telegram gives 9725…
-    phone = _normalise(raw)                        # >>> +9725…
-    USER_PHONES[uid] = phone
-    save_phones()
+    phone = normalise(raw, region=None) or raw         # >>> +9725…
+    await STATE.set_phone(uid, phone)
     kb = main_menu(uid)
     await update.message.reply_text(
         "✅ Phone saved!  You’ll get access as soon as the admin approves it.",
@@ -406,99 +616,560 @@ application.add_handler(ConversationHandler(
         filters.Regex("^📱 Share Phone$"), ask_for_phone)],
     states={SHARE_PHONE: [MessageHandler(filters.CONTACT, receive_phone)]},
     fallbacks=[MessageHandler(filters.Regex("^❌ Cancel$"), receive_phone)],
+    name="share_phone",
+    persistent=True,
 ))
 
 # Parking workflow ----------------------------------------------------------------
-PARKING_INPUT = 1
+# "🅿️ Park" answers with an inline keyboard of the yard's free slots;
+# one tap parks (callback "park:<yard>:<slot | any | charging | cancel>")
+PARK_ANYWHERE = "🎯 Park anywhere"
+PARK_CHARGING = "⚡ Anywhere (charging)"
+PICKER_COLUMNS = 5
+PICKER_MAX_SLOTS = 90                 # Telegram allows 100 buttons per keyboard
+
+
+def _slot_keyboard(yard_name: str, uid: int) -> InlineKeyboardMarkup:
+    """Free slots of *yard_name* as buttons, ⚡ = charging, 🚧 = you'd be blocked in."""
+    kept = _kept(yard_name, uid)
+    free = [s for s in OCCUPANCY.free_slots(yard_name) if s not in kept]
+    if not free:
+        return InlineKeyboardMarkup(_waitlist_rows(yard_name)
+                                    + [[InlineKeyboardButton("✖ Close", callback_data=f"park:{yard_name}:cancel")]])
+    buttons = [InlineKeyboardButton(
+        f"{'⚡' if OCCUPANCY.is_charging(yard_name, s) else ''}{s}"
+        f"{'🚧' if PICKER.blocked_in(yard_name, s) else ''}",
+        callback_data=f"park:{yard_name}:{s}") for s in free[:PICKER_MAX_SLOTS]]
+    quick = [InlineKeyboardButton(PARK_ANYWHERE, callback_data=f"park:{yard_name}:any")]
+    if PICKER.has_charging(yard_name):
+        quick.append(InlineKeyboardButton(PARK_CHARGING, callback_data=f"park:{yard_name}:charging"))
+    return InlineKeyboardMarkup(
+        [quick]
+        + [buttons[i:i + PICKER_COLUMNS] for i in range(0, len(buttons), PICKER_COLUMNS)]
+        + [[InlineKeyboardButton("✖ Cancel", callback_data=f"park:{yard_name}:cancel")]])
+
+
+# open pickers are edited in place as their yard fills and empties
+LIVE_PICKERS = LiveKeyboards(BACKGROUND_BOT, OCCUPANCY, _slot_keyboard)
 
 
 async def ask_parking_slot(update: Update, ctx):
-    if await ensure_yard(update, ctx) is None:
+    uid = update.effective_user.id
+    yard_name = await ensure_yard(update, ctx)
+    if yard_name is None:
         return
-    await update.message.reply_text("📝 Enter parking slot #:", reply_markup=ReplyKeyboardMarkup([["❌ Cancel"]], one_time_keyboard=True))
-    return PARKING_INPUT
+    parked = OCCUPANCY.where(uid)
+    if parked:
+        await update.message.reply_text(f"❌ You’re already parked in slot {parked[1]} ({parked[0]}).\n"
+                                        "Use /leave first.")
+        return
+    markup = _slot_keyboard(yard_name, uid)
+    send_directly()                         # the live picker needs the real message id
+    msg = await update.message.reply_text(
+        f"🅿️ {yard_name} – tap a free slot (⚡ charging, 🚧 you'd be blocked in):", reply_markup=markup)
+    LIVE_PICKERS.open(yard_name, msg.chat_id, msg.message_id, uid, markup)
+
 
+def _still_parked(yard_name: str, slot: int, uid: int) -> bool:
+    STATE.refresh()
+    current = yard_name in PARKING_YARDS and OCCUPANCY.occupant(yard_name, slot)
+    return bool(current) and current.user_id == uid
 
-async def send_charging_reminder(ctx: ContextTypes.DEFAULT_TYPE):
-    """Job‑queue callback: remind user only if still occupying the slot."""
-    data = ctx.job.data  # {'user_id', 'slot', 'yard'}
-    yard = PARKING_YARDS.get(data["yard"])
-    current = yard and yard["slots"].get(data["slot"])
-    if not current or current["user_id"] != data["user_id"]:
+
+async def send_charging_reminder(yard_name: str, slot: int, uid: int):
+    """Timer callback: remind user only if still occupying the charging slot."""
+    if not _still_parked(yard_name, slot, uid):
         return  # user moved / slot is free – do nothing
-    await ctx.bot.send_message(data["user_id"],
-                               f"⚡ Reminder: You've been in charging slot {data['slot']} ({data['yard']}) for 1.5 h. Please free it if you're done.")
+    minutes = PARKING_YARDS.get(yard_name, {}).get("reminder_after_min")
+    if not minutes or not OCCUPANCY.is_charging(yard_name, slot):
+        return  # policy dropped / slot no longer charging after a reload
+    if not await STATE.claim_reminder(yard_name, slot, uid):
+        return  # another worker (or this one, before a restart) already sent it
+    NOTIFIER.send(uid,
+                  f"⚡ Reminder: You've been in charging slot {slot} ({yard_name}) for {minutes//60}h {minutes % 60}m. Please free it if you're done.")
+
+
+async def expire_parking(yard_name: str, slot: int, uid: int):
+    """Timer callback: release a park the user forgot about."""
+    if not _still_parked(yard_name, slot, uid):
+        return
+    minutes = PARKING_YARDS.get(yard_name, {}).get("expire_after_min")
+    if not minutes:
+        return                                  # policy dropped by a reload
+    if await _release(uid, ended=ENDED_EXPIRE, expect=(yard_name, slot)) is None:
+        return                                  # left / moved meanwhile
+    hours = minutes / 60
+    NOTIFIER.send(uid, f"⌛ Slot {slot} ({yard_name}) was released automatically after {hours:g} h.")
+    print(f"⌛ {USER_PHONES.get(uid, uid)} auto‑released from slot {slot} ({yard_name})")
+
+
+# per‑(yard, slot, user) reminder / expiry timers, following OCCUPANCY
+TIMERS = Timers(application.job_queue, PARKING_YARDS,
+                on_reminder=send_charging_reminder, on_expire=expire_parking)
+TIMERS.track(OCCUPANCY)
+
+
+async def handle_parking_slot(update: Update, _ctx):
+    """A tap on the slot picker."""
+    query = update.callback_query
+    uid = query.from_user.id
+    try:
+        yard_name, choice = query.data.split(":", 1)[1].rsplit(":", 1)
+        picked_slot = None if choice in ("any", "charging", "cancel") else int(choice)
+    except ValueError:
+        return await query.answer()             # not ours / mangled – ignore
+    chat_id, message_id = query.message.chat_id, query.message.message_id
+
+    async def done(text: str, markup: InlineKeyboardMarkup | None = None):
+        LIVE_PICKERS.close(yard_name, chat_id, message_id)
+        await asyncio.gather(query.answer(), query.edit_message_text(text, reply_markup=markup))
+
+    if choice == "cancel":
+        return await done("❌ Cancelled.")
+    if yard_name not in PARKING_YARDS:
+        return await done("❌ This yard no longer exists.")
+    anywhere = choice in ("any", "charging")
+    slot = await _park(query.from_user, yard_name, picked_slot, charging=choice == "charging")
+    if slot is not None:
+        picked = " – picked for you" if anywhere else ""
+        return await done(f"✅ Parked in slot {slot} ({yard_name}){picked}.")
+    parked = OCCUPANCY.where(uid)
+    if parked:                                  # parked already (or a double tap won)
+        return await done(f"❌ You’re already parked in slot {parked[1]} ({parked[0]}).\n"
+                          "Use /leave first.")
+    if anywhere:
+        rows = _waitlist_rows(yard_name)
+        return await done("❌ No free slot in this yard.", InlineKeyboardMarkup(rows) if rows else None)
+    # the slot went between render and tap – say so and show what's left
+    await asyncio.gather(query.answer(f"❌ Slot {choice} was just taken – pick another."),
+                         LIVE_PICKERS.refresh_one(yard_name, chat_id, message_id, uid))
+
+
+async def _park(user: User, yard_name: str, slot: int | None, charging: bool = False) -> int | None:
+    """
+    Park *user* in *slot* (None = their booked slot if it's time, else
+    the best free one), skipping slots held for waitlisted users or
+    booked by others; tell whoever the car now blocks.  Returns the
+    slot, or None if nothing was claimed.
+    """
+    uid = user.id
+    occ = Occupant(uid, user.full_name, USER_PHONES.get(uid, "unknown"), int(time.time()))
+    # claim and read whom we now block under the yard lock, so a
+    # concurrent park / leave in this yard can't slip in between
+    async with YARD_LOCKS.hold(yard_name):
+        kept = _kept(yard_name, uid)
+        if slot is None:
+            slot = await _claim_best(yard_name, occ, charging, kept)
+        elif slot in kept or not await STATE.claim(yard_name, slot, occ):
+            slot = None
+        if slot is None:
+            return None
+        blocked = [OCCUPANCY.occupant(yard_name, b).user_id for b in GRAPHS[yard_name].blocked(slot)]
+    print(f"✅ {USER_PHONES.get(uid, uid)} parked in slot {slot} ({yard_name})")
 
+    blocker_phone = USER_PHONES.get(uid, "no phone shared")
+    # notify every parked car this slot now blocks, directly or down the row
+    for blocked_uid in blocked:
+        NOTIFIER.send(blocked_uid, (
+            "🚧 *You're blocked*\n"
+            f"• By: {user.full_name}\n"
+            f"• Slot: {slot}\n"
+            f"• Phone: {blocker_phone}"
+        ))
+    return slot
+
+
+async def _claim_best(yard_name: str, occ: Occupant, charging: bool, kept: set[int]) -> int | None:
+    """Claim the user's booked slot, else the picker's best; re‑pick if another worker won the race."""
+    mine = _my_booking(yard_name, occ.user_id)
+    if mine is not None and await STATE.claim(yard_name, mine.slot, occ):
+        return mine.slot
+    for _ in range(3):
+        slot = PICKER.best(yard_name, charging, skip=kept)
+        if slot is None:
+            return None
+        if await STATE.claim(yard_name, slot, occ):
+            return slot
+        if OCCUPANCY.where(occ.user_id):        # we're parked already – don't retry
+            return None
+    return None
+
+application.add_handler(MessageHandler(filters.Regex("^🅿️ Park$"), ask_parking_slot))
+application.add_handler(CallbackQueryHandler(handle_parking_slot, pattern=r"^park:"))
+
+# Waitlist – the next free slot is pushed instead of users polling /status ----------
+
+
+def _offer_slot(uid: int, yard_name: str, slot: int, hold: int):
+    kb = InlineKeyboardMarkup([[
+        InlineKeyboardButton(f"✅ Take slot {slot}", callback_data=f"take:{yard_name}:{slot}"),
+        InlineKeyboardButton("✖ Pass", callback_data=f"pass:{yard_name}:{slot}"),
+    ]])
+    NOTIFIER.send(uid, f"🔔 Slot {slot} in {yard_name} just freed up – it's held for you "
+                       f"for {hold / 60:g} min.", reply_markup=kb)
+    print(f"🔔 slot {slot} ({yard_name}) offered to {USER_PHONES.get(uid, uid)}")
+
+
+def _offer_lapsed(uid: int, yard_name: str, slot: int):
+    NOTIFIER.send(uid, f"⌛ Your hold on slot {slot} ({yard_name}) lapsed. /waitlist to queue again.")
+
+
+# FIFO per yard (regular / charging); follows OCCUPANCY, so leave, expiry
+# and resets all hand freed slots to the next in line.  Queues and holds
+# live in this process, so with the shared SQLite backend (several
+# workers) a hold would not bind the other workers – no waitlist there.
+WAITLIST_ENABLED = STATE_BACKEND == "memory"
+WAITLIST_OFF = "ℹ️ The waitlist is not available on this deployment – check 📋 Status."
+WAITLIST = Waitlist(application.job_queue, OCCUPANCY, on_offer=_offer_slot,
+                    on_lapse=_offer_lapsed, hold_seconds=WAITLIST_HOLD_SECONDS,
+                    kept=lambda yard_name, slot: slot in _reserved(yard_name))
+
+
+def _waitlist_rows(yard_name: str) -> list[list[InlineKeyboardButton]]:
+    """The "🔔 Notify me" row offered when nothing is free (none without a waitlist)."""
+    if not WAITLIST_ENABLED:
+        return []
+    row = []
+    if PICKER.has_regular(yard_name):
+        row.append(InlineKeyboardButton("🔔 Notify me", callback_data="wait:0"))
+    if PICKER.has_charging(yard_name):
+        row.append(InlineKeyboardButton("⚡ Notify me (charging)", callback_data="wait:1"))
+    return [row] if row else []
+
+
+def _join_waitlist(uid: int, yard_name: str, charging: bool) -> str:
+    if not WAITLIST_ENABLED:
+        return WAITLIST_OFF
+    parked = OCCUPANCY.where(uid)
+    if parked:
+        return f"❌ You’re already parked in slot {parked[1]}."
+    if not (PICKER.has_charging if charging else PICKER.has_regular)(yard_name):
+        charging = not charging                 # the yard only has the other kind
+        if not (PICKER.has_charging if charging else PICKER.has_regular)(yard_name):
+            return f"❌ {yard_name} has no slots to wait for."
+    kept = _kept(yard_name, uid)
+    if any(s not in kept and OCCUPANCY.is_charging(yard_name, s) == charging
+           for s in OCCUPANCY.free_slots(yard_name)):
+        return "✅ There is a free slot right now – tap 🅿️ Park."
+    pos = WAITLIST.join(uid, yard_name, charging)
+    pool = " charging" if charging else ""
+    return (f"🔔 You’re #{pos} on the {yard_name}{pool} waitlist – I’ll message you "
+            "as soon as a slot frees up. /unwait to leave the list.")
+
+
+async def waitlist_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/waitlist [charging] – queue for the next free slot in my yard."""
+    uid = update.effective_user.id
+    yard_name = await ensure_yard(update, ctx)
+    if yard_name is None:
+        return
+    charging = bool(ctx.args) and ctx.args[0].lower().startswith("charg")
+    await update.message.reply_text(_join_waitlist(uid, yard_name, charging), reply_markup=main_menu(uid))
 
-async def handle_parking_slot(update: Update, ctx):
+
+async def unwait_cmd(update: Update, _ctx):
+    uid = update.effective_user.id
+    text = "👌 Removed from the waitlist." if WAITLIST.cancel(uid) else "❌ You are not on a waitlist."
+    await update.message.reply_text(text, reply_markup=main_menu(uid))
+
+
+async def waitlist_button(update: Update, _ctx):
+    """🔔 Notify me under a "no free slot" reply."""
+    query = update.callback_query
+    uid = query.from_user.id
+    yard_name = USER_YARD.get(uid)
+    if yard_name not in PARKING_YARDS:
+        await query.answer("⚠️ Please choose a yard first.")
+        return
+    LIVE_PICKERS.close(yard_name, query.message.chat_id, query.message.message_id)
+    await query.answer()
+    await query.edit_message_text(_join_waitlist(uid, yard_name, query.data == "wait:1"))
+
+
+def _offer_of(query) -> tuple[str, int] | None:
+    """``take:`` / ``pass:`` data → (yard, slot); None if it doesn't parse."""
+    try:
+        yard_name, slot = query.data.split(":", 1)[1].rsplit(":", 1)
+        return yard_name, int(slot)
+    except ValueError:
+        return None
+
+
+async def take_offer(update: Update, _ctx):
+    query = update.callback_query
+    uid = query.from_user.id
+    offer = _offer_of(query)
+    if offer is None:
+        await query.answer()
+        return
+    yard_name, slot = offer
+    if WAITLIST.holder(yard_name, slot) != uid:
+        await query.answer("⌛ This offer has expired.")
+        await query.edit_message_reply_markup(None)
+        return
+    await query.answer()
+    if await _park(query.from_user, yard_name, slot) is None:
+        parked = OCCUPANCY.where(uid)
+        await query.edit_message_text(f"❌ You’re already parked in slot {parked[1]}." if parked
+                                      else f"❌ Slot {slot} was taken meanwhile, sorry.")
+        return
+    await query.edit_message_text(f"✅ Parked in slot {slot} ({yard_name}).")
+
+
+async def pass_offer(update: Update, _ctx):
+    query = update.callback_query
+    offer = _offer_of(query)
+    await query.answer()
+    if offer is None:
+        return
+    yard_name, slot = offer
+    if WAITLIST.decline(yard_name, slot, query.from_user.id):
+        await query.edit_message_text(f"👌 Passed – slot {slot} goes to the next in line.")
+    else:
+        await query.edit_message_reply_markup(None)
+
+application.add_handler(CommandHandler("waitlist", waitlist_cmd))
+application.add_handler(CommandHandler("unwait", unwait_cmd))
+application.add_handler(CallbackQueryHandler(waitlist_button, pattern=r"^wait:[01]$"))
+application.add_handler(CallbackQueryHandler(take_offer, pattern=r"^take:"))
+application.add_handler(CallbackQueryHandler(pass_offer, pattern=r"^pass:"))
+
+# Bookings – a slot held for a time window ahead ("tomorrow 9:00-13:00") ----------
+# A walk‑in park lasts until it expires or the midnight reset, so a
+# walk‑in can't take a slot someone else has booked before then.  The
+# booker may use their slot from RESERVE_LEAD_MIN before the start.
+BOOK_USAGE = ("Usage: /book [today|tomorrow|YYYY-MM-DD|DD.MM] HH:MM-HH:MM [slot] [charging]\n"
+              "e.g. /book tomorrow 9:00-13:00")
+_WINDOW = re.compile(r"(\d{1,2})(?::(\d{2}))?-(\d{1,2})(?::(\d{2}))?")
+
+
+def _walk_in_until(yard_name: str, now: int) -> int:
+    tomorrow = datetime.fromtimestamp(now, TZ).date() + timedelta(days=1)
+    midnight = TZ.localize(datetime.combine(tomorrow, datetime.min.time())).timestamp()
+    expire = PARKING_YARDS[yard_name].get("expire_after_min")
+    return int(midnight if expire is None else min(midnight, now + expire * 60))
+
+
+def _my_booking(yard_name: str, uid: int) -> Booking | None:
+    """The user's booking in *yard_name* that has begun or is about to."""
+    now = int(time.time())
+    return RESERVATIONS.current(uid, yard_name, now, now + RESERVE_LEAD_MIN * 60)
+
+
+def _reserved(yard_name: str, uid: int | None = None) -> set[int]:
+    """Slots booked for anyone but *uid* between now and when a walk‑in parked now would be gone."""
+    now = int(time.time())
+    booked = RESERVATIONS.booked(yard_name, now, _walk_in_until(yard_name, now), other_than=uid)
+    mine = uid is not None and _my_booking(yard_name, uid)
+    if mine:
+        booked.discard(mine.slot)            # their time has come, whatever follows
+    return booked
+
+
+def _kept(yard_name: str, uid: int) -> set[int]:
+    """Free slots *uid* may not take: booked for someone else or held for a waitlisted user."""
+    kept = _reserved(yard_name, uid)
+    kept.update(s for s in WAITLIST.held(yard_name) if WAITLIST.holder(yard_name, s) != uid)
+    return kept
+
+
+def _parse_window(args: list[str]) -> tuple[int, int, list[str]]:
+    """``[day] HH:MM-HH:MM …`` → (start, end, remaining args); ValueError if malformed."""
+    args = list(args)
+    today = datetime.now(TZ).date()
+    day = today
+    word = args[0].lower() if args else ""
+    if word in ("today", "tomorrow"):
+        day += timedelta(days=word == "tomorrow")
+        args.pop(0)
+    elif re.fullmatch(r"\d{4}-\d{2}-\d{2}", word):
+        day = date.fromisoformat(args.pop(0))
+    elif m := re.fullmatch(r"(\d{1,2})[./](\d{1,2})", word):
+        args.pop(0)
+        day = date(today.year, int(m[2]), int(m[1]))
+        if day < today:
+            day = day.replace(year=today.year + 1)
+    m = _WINDOW.fullmatch(args.pop(0)) if args else None
+    if m is None:
+        raise ValueError("give a time window like 9:00-13:00")
+    h1, m1, h2, m2 = (int(g or 0) for g in m.groups())
+    if h1 > 23 or h2 > 24 or m1 > 59 or m2 > 59 or (h2 == 24 and m2):
+        raise ValueError("not a valid time")
+    midnight = datetime.combine(day, datetime.min.time())
+    start = int(TZ.localize(midnight + timedelta(hours=h1, minutes=m1)).timestamp())
+    end = int(TZ.localize(midnight + timedelta(hours=h2, minutes=m2)).timestamp())
+    now = int(time.time())
+    if end <= start:
+        raise ValueError("the end must be after the start")
+    if end <= now:
+        raise ValueError("that time has passed")
+    if start > now + RESERVE_MAX_DAYS * 86400:
+        raise ValueError(f"bookings open {RESERVE_MAX_DAYS} days ahead")
+    return max(start, now), end, args
+
+
+def _when(b: Booking) -> str:
+    start, end = (datetime.fromtimestamp(t, TZ) for t in (b.start, b.end))
+    return f"{start:%a %d.%m %H:%M}–{end:%H:%M}"
+
+
+async def _book(yard_name: str, uid: int, name: str, start: int, end: int,
+                slot: int | None = None, charging: bool = False) -> Booking | str:
+    """Book *slot* (None = the first that fits) for ``[start, end)``; the booking, or why not."""
+    y = OCCUPANCY.yards[yard_name]
+    if slot is not None and slot not in y:
+        return f"there is no slot {slot} in {yard_name}"
+    async with YARD_LOCKS.hold(yard_name):
+        soon = start < int(time.time()) + RESERVE_LEAD_MIN * 60
+
+        def taken(s: int) -> bool:               # parked in by someone else, booking starts soon
+            occ = y.taken.get(s)
+            return soon and occ is not None and occ.user_id != uid
+
+        if slot is not None:
+            candidates = [slot]
+        else:
+            # slots outside the blocking graph first, charging ones only if asked for
+            nodes = GRAPHS[yard_name].nodes
+            fits = RESERVATIONS.free_between(yard_name, y.ids, start, end)
+            candidates = sorted((s for s in fits if charging or not y.is_charging(s)),
+                                key=lambda s: (y.is_charging(s) != charging, s in nodes, s))
+            candidates = [s for s in candidates if not taken(s)][:3]
+        problem = "no slot is free for that whole time"
+        for s in candidates:
+            if taken(s):
+                return f"slot {s} is taken right now"
+            b = Booking(yard_name, s, start, end, uid, name)
+            problem = await STATE.book(b)
+            if problem is None:
+                break
+        else:
+            return problem
+    occ = y.taken.get(b.slot)
+    if occ is not None and occ.user_id != uid and b.start < _walk_in_until(yard_name, occ.since):
+        NOTIFIER.send(occ.user_id, f"📅 Slot {b.slot} ({yard_name}) is booked from "
+                                   f"{datetime.fromtimestamp(b.start, TZ):%H:%M} – please move before then.")
+    print(f"📅 slot {b.slot} ({yard_name}) booked for {name}, {_when(b)}")
+    return b
+
+
+async def book_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/book [day] HH:MM-HH:MM [slot] [charging]"""
     uid = update.effective_user.id
     yard_name = await ensure_yard(update, ctx)
     if yard_name is None:
         return
-    for other_yard_name, other_yard in PARKING_YARDS.items():
-        for other_slot, info in other_yard["slots"].items():
-            if info["user_id"] == uid:
-                await update.message.reply_text(
-                    f"❌ You’re already parked in slot {other_slot} "
-                    f"({'this yard' if other_yard_name == yard_name else other_yard_name}).\n"
-                    "Use /leave first.",
-                    reply_markup=main_menu(uid),
-                )
-                return ConversationHandler.END
-    txt = update.message.text.strip()
-    if txt == "❌ Cancel":
-        await update.message.reply_text("❌ Cancelled.", reply_markup=main_menu(uid))
-        return ConversationHandler.END
-    if not txt.isdigit():
-        await update.message.reply_text("❌ Please enter a number.")
-        return PARKING_INPUT
-
-    slot = int(txt)
-    yard = PARKING_YARDS[yard_name]
-    if slot not in yard["blocks"]:
-        await update.message.reply_text("❌ Invalid slot for this yard.")
-        return PARKING_INPUT
-    if slot in yard["slots"]:
-        await update.message.reply_text("❌ Slot taken, choose another.")
-        return PARKING_INPUT
-
-    # park user
-    yard["slots"][slot] = {
-        "user_id": uid,
-        "name": update.effective_user.full_name,
-        "phone": USER_PHONES.get(uid, "unknown"),
-        "time": datetime.now().isoformat(),
-    }
-    await update.message.reply_text(f"✅ Parked in slot {slot}.", reply_markup=main_menu(uid))
-    print(f"✅ {USER_PHONES[uid]} parked in slot {slot} ({yard_name})")
-
-    # charging reminder
-    if slot in yard["charging_slots"]:
-        ctx.job_queue.run_once(send_charging_reminder, when=datetime.now(
-        ) + timedelta(hours=1, minutes=30), data={"user_id": uid, "slot": slot, "yard": yard_name})
-    blocker_phone = USER_PHONES.get(uid, "no phone shared")
-    # notify blocked slots
-    for blocked in yard["blocks"].get(slot, []):
-        info = yard["slots"].get(blocked)
-        if info:
-            with suppress(Exception):
-                await ctx.bot.send_message(info["user_id"], (
-                    "🚧 *You're blocked*\n"
-                    f"• By: {update.effective_user.full_name}\n"
-                    f"• Slot: {slot}\n"
-                    f"• Phone: {blocker_phone}"
-                ))
+    try:
+        start, end, rest = _parse_window(ctx.args or [])
+        slot = int(rest[0]) if rest and rest[0].isdigit() else None
+    except ValueError as exc:
+        await update.message.reply_text(f"❌ {exc}.\n{BOOK_USAGE}")
+        return
+    charging = any(a.lower().startswith("charg") for a in rest)
+    result = await _book(yard_name, uid, update.effective_user.full_name, start, end, slot, charging)
+    if isinstance(result, str):
+        await update.message.reply_text(f"❌ Can't book: {result}.", reply_markup=main_menu(uid))
+        return
+    await update.message.reply_text(
+        f"📅 Slot {result.slot} ({yard_name}) is yours {_when(result)}.\n"
+        "Tap 🅿️ Park when you arrive – /bookings to see or cancel.", reply_markup=main_menu(uid))
 
-    return ConversationHandler.END
 
-application.add_handler(ConversationHandler(
-    entry_points=[MessageHandler(
-        filters.Regex("^🅿️ Park$"), ask_parking_slot)],
-    states={PARKING_INPUT: [MessageHandler(
-        ~filters.COMMAND, handle_parking_slot)]},
-    fallbacks=[MessageHandler(filters.Regex(
-        "^❌ Cancel$"), handle_parking_slot)],
-))
+async def book_visitor(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/bookvisitor [day] HH:MM-HH:MM <slot|any> <name> – pre‑allocate a visitor's bay (admin)."""
+    uid = update.effective_user.id
+    if uid not in ADMIN_IDS:
+        return
+    yard_name = await ensure_yard(update, ctx)
+    if yard_name is None:
+        return
+    try:
+        start, end, rest = _parse_window(ctx.args or [])
+        if len(rest) < 2 or not (rest[0].isdigit() or rest[0] == "any"):
+            raise ValueError("give a slot (or 'any') and the visitor's name")
+    except ValueError as exc:
+        await update.message.reply_text(f"❌ {exc}.\nUsage: /bookvisitor [day] HH:MM-HH:MM <slot|any> <name>")
+        return
+    slot = int(rest[0]) if rest[0].isdigit() else None
+    result = await _book(yard_name, VISITOR, "Visitor " + " ".join(rest[1:]), start, end, slot)
+    if isinstance(result, str):
+        await update.message.reply_text(f"❌ Can't book: {result}.")
+        return
+    await update.message.reply_text(f"📅 Slot {result.slot} ({yard_name}) held for {result.name}, {_when(result)}.")
+
+
+async def free_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/free [day] HH:MM-HH:MM – slots that can still be booked for that window."""
+    uid = update.effective_user.id
+    yard_name = await ensure_yard(update, ctx)
+    if yard_name is None:
+        return
+    try:
+        start, end, _rest = _parse_window(ctx.args or [])
+    except ValueError as exc:
+        await update.message.reply_text(f"❌ {exc}.\nUsage: /free [day] HH:MM-HH:MM")
+        return
+    free = RESERVATIONS.free_between(yard_name, OCCUPANCY.yards[yard_name].ids, start, end)
+    window = _when(Booking(yard_name, 0, start, end, uid, ""))
+    await update.message.reply_text(
+        f"📅 {yard_name}, {window}: "
+        + (f"{len(free)} slot(s) free – {', '.join(map(str, free))}" if free else "fully booked."),
+        reply_markup=main_menu(uid))
+
+
+async def bookings_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/bookings – my bookings, each with a cancel button (admins: /bookings all)."""
+    uid = update.effective_user.id
+    if uid in ADMIN_IDS and ctx.args and ctx.args[0] == "all":
+        yard_name = await ensure_yard(update, ctx)
+        if yard_name is None:
+            return
+        listed = sorted((b for b in RESERVATIONS if b.yard == yard_name), key=lambda b: b.start)
+    else:
+        listed = RESERVATIONS.of_user(uid)
+    if not listed:
+        await update.message.reply_text("📅 No bookings. /book to make one.", reply_markup=main_menu(uid))
+        return
+    shown = listed[:20]
+    lines = [f"• {b.yard} slot {b.slot}, {_when(b)}" + (f" – {b.name}" if b.user_id != uid else "")
+             for b in shown]
+    if len(listed) > len(shown):
+        lines.append(f"… and {len(listed) - len(shown)} more")
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton(
+        f"✖ Cancel {b.slot}, {datetime.fromtimestamp(b.start, TZ):%d.%m %H:%M}",
+        callback_data=f"unbook:{b.yard}:{b.slot}:{b.start}")] for b in shown])
+    await update.message.reply_text("📅 Bookings:\n" + "\n".join(lines), reply_markup=kb)
+
+
+async def unbook_button(update: Update, _ctx):
+    query = update.callback_query
+    uid = query.from_user.id
+    try:
+        yard_name, slot, start = query.data.split(":", 1)[1].rsplit(":", 2)
+        key = (yard_name, int(slot), int(start))
+    except ValueError:
+        await query.answer()
+        return
+    b = next((b for b in RESERVATIONS.of_user(uid) if b.key == key), None)
+    if b is None and uid in ADMIN_IDS:
+        b = next((b for b in RESERVATIONS if b.key == key), None)
+    markup = query.message.reply_markup
+    rows = [row for row in (markup.inline_keyboard if markup else ()) if row[0].callback_data != query.data]
+    if b is None or await STATE.unbook(*key) is None:
+        await asyncio.gather(query.answer("ℹ️ Already cancelled."),
+                             query.edit_message_reply_markup(InlineKeyboardMarkup(rows)))
+        return
+    await asyncio.gather(query.answer(f"👌 Slot {b.slot}, {_when(b)} cancelled."),
+                         query.edit_message_reply_markup(InlineKeyboardMarkup(rows)))
+    if b.user_id not in (uid, VISITOR):
+        NOTIFIER.send(b.user_id, f"📅 Your booking of slot {b.slot} ({b.yard}), {_when(b)}, was cancelled by an admin.")
+    print(f"📅 booking of slot {b.slot} ({b.yard}) {_when(b)} cancelled by {uid}")
+
+application.add_handler(CommandHandler("book", book_cmd))
+application.add_handler(CommandHandler("bookvisitor", book_visitor))
+application.add_handler(CommandHandler("free", free_cmd))
+application.add_handler(CommandHandler("bookings", bookings_cmd))
+application.add_handler(CallbackQueryHandler(unbook_button, pattern=r"^unbook:"))
 
 # 6. /Leave -------------------------------------------------------------------
 
@@ -508,24 +1179,83 @@ async def leave(update: Update, ctx):
     yard_name = await ensure_yard(update, ctx)
     if yard_name is None:
         return
-    for other_yard_name, other_yard in PARKING_YARDS.items():
-        for slot, info in list(other_yard["slots"].items()):
-            if info["user_id"] == uid:
-                del other_yard["slots"][slot]
-                await update.message.reply_text(f"👋 You left slot {slot}.", reply_markup=main_menu(uid))
-                print(
-                    f"👋 {USER_PHONES[uid]} left slot {slot} ({other_yard_name})")
-                # inform people who were blocked by that slot
-                for b in other_yard["blocks"].get(slot, []):
-                    blk_info = other_yard["slots"].get(b)
-                    if blk_info:
-                        with suppress(Exception):
-                            await ctx.bot.send_message(blk_info["user_id"], f"🚧 Slot {slot} is now free.")
-                return
-    await update.message.reply_text("❌ You are not parked.")
+    left = await _release(uid)
+    if left is None:
+        await update.message.reply_text("❌ You are not parked.")
+        return
+    other_yard_name, slot, _info = left
+    await update.message.reply_text(f"👋 You left slot {slot}.", reply_markup=main_menu(uid))
+    print(f"👋 {USER_PHONES.get(uid, uid)} left slot {slot} ({other_yard_name})")
+
+
+async def _release(uid: int, ended: int = ENDED_LEAVE,
+                   expect: tuple[str, int] | None = None) -> tuple[str, int, Occupant] | None:
+    """
+    Free the user's slot (only if it is still *expect*, when given), log
+    the stay and tell whoever it was blocking.
+    """
+    parked = expect or OCCUPANCY.where(uid)
+    if parked is None:
+        return None
+    async with YARD_LOCKS.hold(parked[0]):
+        return await _free(uid, parked, ended)
+
+
+async def _free(uid: int, parked: tuple[str, int], ended: int) -> tuple[str, int, Occupant] | None:
+    """:func:`_release` for callers already holding the yard lock."""
+    yard_name, slot = parked
+    graph = GRAPHS[yard_name]
+    was_blocking = set(graph.blocked(slot))
+    # compare‑and‑set against what we saw: if the user moved while we
+    # waited for the lock, nothing is released
+    left = await STATE.release(uid, expect=parked)
+    if left is None:
+        return None
+    _record_stay(*left, ended)
+    # inform people who were blocked by that slot (and whether they still are)
+    for b in was_blocking:
+        blk = OCCUPANCY.occupant(yard_name, b)
+        if blk is None:
+            continue
+        still = graph.blockers(b)
+        if still:
+            NOTIFIER.send(blk.user_id,
+                          f"🚧 Slot {slot} is now free, but slot(s) "
+                          f"{', '.join(map(str, sorted(still)))} still block you.")
+        else:
+            NOTIFIER.send(blk.user_id, f"🚧 Slot {slot} is now free.")
+    return left
 
 
 application.add_handler(CommandHandler("leave", leave))
+
+# /blockers – who is blocking me / whom am I blocking ---------------------------------
+
+
+async def who_blocks_me(update: Update, ctx):
+    uid = update.effective_user.id
+    parked = OCCUPANCY.where(uid)
+    if parked is None:
+        await update.message.reply_text("❌ You are not parked.", reply_markup=main_menu(uid))
+        return
+    yard_name, slot = parked
+    graph = GRAPHS[yard_name]
+
+    def describe(slots: set[int]) -> str:
+        rows = []
+        for s in sorted(slots):
+            occ = OCCUPANCY.occupant(yard_name, s)
+            rows.append(f"• Slot {s} – {occ.name} ({occ.phone or 'no phone'})")
+        return "\n".join(rows)
+
+    parts = [f"🚗 You're in slot {slot} ({yard_name})."]
+    front, behind = graph.blockers(slot), graph.blocked(slot)
+    parts.append(f"🚧 Blocking you:\n{describe(front)}" if front else "✅ Nobody is blocking you.")
+    if behind:
+        parts.append(f"↩️ You're blocking:\n{describe(behind)}")
+    await update.message.reply_text("\n\n".join(parts), reply_markup=main_menu(uid))
+
+application.add_handler(CommandHandler("blockers", who_blocks_me))
 application.add_handler(MessageHandler(filters.Regex("^🚶 Leave$"), leave))
 application.add_handler(
     MessageHandler(filters.CONTACT, receive_phone)
@@ -538,37 +1268,258 @@ async def fallback(update: Update, _):
 
 application.add_handler(MessageHandler(~filters.COMMAND, fallback))
 
+# ── Yard config hot reload ────────────────────────────────────────────────────
+
+_yards_mtime = YARDS_FILE.stat().st_mtime if YARDS_FILE.exists() else 0.0
+
+
+async def reload_yards() -> str:
+    """
+    Re‑read YARDS_FILE and swap the new layout in without a restart.
+    Cars in removed yards / slots are released (and told so); everyone
+    else keeps their slot.  A broken file leaves the running config alone.
+    """
+    global _yards_mtime
+    _yards_mtime = YARDS_FILE.stat().st_mtime if YARDS_FILE.exists() else 0.0
+    try:
+        new = load_yards(YARDS_FILE)
+        graphs = compile_yards(new)
+    except ValueError as exc:
+        print(f"⚠️ Yard reload rejected: {exc}")
+        return f"⚠️ Reload rejected – {exc}"
+
+    # no park may land in a doomed slot between the check‑outs and the swap
+    async with YARD_LOCKS.hold(*OCCUPANCY.yards):
+        for name in [n for n in OCCUPANCY.yards if n not in new]:
+            LIVE_PICKERS.drop_yard(name, f"🏗️ {name} no longer exists.")
+        gone = [(occ.user_id, name, slot)
+                for name in OCCUPANCY.yards for slot, occ in OCCUPANCY.taken(name).items()
+                if name not in new or slot not in new[name]["slots"]]
+        for uid, name, slot in gone:
+            await _free(uid, (name, slot), ENDED_RESET)
+            NOTIFIER.send(uid, f"🏗️ Slot {slot} in {name} no longer exists – you were checked out.")
+        for b in [b for b in RESERVATIONS if b.yard not in new or b.slot not in new[b.yard]["slots"]]:
+            await STATE.unbook(*b.key)
+            if b.user_id != VISITOR:
+                NOTIFIER.send(b.user_id, f"🏗️ Slot {b.slot} in {b.yard} no longer exists – "
+                                         f"your booking {_when(b)} was cancelled.")
+
+        PARKING_YARDS.clear()
+        PARKING_YARDS.update(new)
+        GRAPHS.clear()
+        GRAPHS.update(graphs)
+        OCCUPANCY.reconfigure(PARKING_YARDS)
+        resync(GRAPHS, OCCUPANCY)
+        STATUS_CACHE.rebuild()
+        PICKER.rebuild()
+        WAITLIST.prune()
+    summary = ", ".join(f"{n} ({len(OCCUPANCY.yards[n])} slots)" for n in PARKING_YARDS)
+    print(f"🏗️ Yards reloaded: {summary}; {len(gone)} car(s) checked out")
+    return f"🏗️ Yards reloaded: {summary}\n{len(gone)} car(s) checked out."
+
+
+async def reload_yards_cmd(update: Update, _ctx: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    await update.message.reply_text(await reload_yards())
+
+
+async def _poll_yards_file():
+    """Pick up edits to YARDS_FILE (checked once a minute)."""
+    mtime = YARDS_FILE.stat().st_mtime if YARDS_FILE.exists() else 0.0
+    if mtime != _yards_mtime:
+        await reload_yards()
+
+application.add_handler(CommandHandler("reloadyards", reload_yards_cmd))
+
 # ── Scheduled reset at midnight ───────────────────────────────────────────────
 
 
-def reset_parking():
-    for yard in PARKING_YARDS.values():
-        yard["slots"].clear()
-    USER_YARD.clear()
+async def reset_parking():
+    WAITLIST.clear()                   # nobody waits overnight for a fresh yard
+    async with YARD_LOCKS.hold(*OCCUPANCY.yards):
+        await _reset_slots()           # chosen yards and bookings survive the night
+        await STATE.prune_bookings(int(time.time()))
     print("🧹 Daily reset complete")
 
 # ── Webhook setup & FastAPI bridge ────────────────────────────────────────────
 
 
+# Startup is split so the port opens at once: set_webhook() (awaited by
+# the lifespan) only schedules _warm_up(), which loads state off the
+# loop while Telegram's getMe runs, sets the webhook only if it changed
+# and then starts the workers.  Updates arriving meanwhile just queue.
+# A failing step is retried with backoff; while it fails, /health and
+# the webhook answer 503 (Telegram re‑delivers), and when it keeps
+# failing the process exits so the platform restarts it.
+STARTUP: dict[str, float] = {}     # phase -> ms (main.py adds "import")
+STARTUP_ERRORS: dict[str, str] = {}   # phase -> last error, while it is failing
+READY = asyncio.Event()
+# event‑loop lag + slow‑handler sampler, running from warm‑up to shutdown
+WATCHDOG = Watchdog(lag_threshold=WATCHDOG_LAG_MS / 1000, slow_handler=SLOW_HANDLER_MS / 1000)
+_warmup: asyncio.Task | None = None
+
+
+@contextmanager
+def _phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+
 async def set_webhook():
-    load_persistent()             # reload phones & allow-list
-    bot = Bot(token=TOKEN)
-    await application.initialize()
-    await bot.set_webhook(url=WEBHOOK_URL)
-    print(f"✅ Webhook set to: {WEBHOOK_URL}")
-    await application.job_queue.start()
-    # Daily midnight reset
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(
-        reset_parking,
-        CronTrigger(hour=0, minute=0, timezone=timezone("Asia/Jerusalem"))
-    )
-    scheduler.start()
+    """Startup hook: kick off the warm‑up and return immediately."""
+    global _warmup
+    SEEN_UPDATES.load()                 # before the first webhook request
+    _warmup = asyncio.create_task(_warm_up(), name="warm-up")
+
+
+async def _retrying(name: str, step):
+    """Run warm‑up *step* as phase *name*, retrying with backoff; re‑raises the last failure."""
+    for attempt in range(1, WARMUP_ATTEMPTS + 1):
+        try:
+            with _phase(name):
+                await step()
+        except Exception as exc:
+            STARTUP_ERRORS[name] = repr(exc)
+            if attempt == WARMUP_ATTEMPTS:
+                raise
+            delay = min(2 ** (attempt - 1), 30)
+            print(f"⚠️ Startup {name} failed ({attempt}/{WARMUP_ATTEMPTS}): {exc!r} – retrying in {delay} s")
+            await asyncio.sleep(delay)
+        else:
+            STARTUP_ERRORS.pop(name, None)
+            return
+
+
+async def _warm_up():
+    t0 = time.perf_counter()
+    WATCHDOG.start()
+    try:
+        async def load():
+            await asyncio.to_thread(load_persistent)
+
+        async def initialize():
+            # getMe on both bots – also opens a kept‑alive connection per pool
+            await asyncio.gather(application.initialize(), BACKGROUND_BOT.initialize())
+
+        async def webhook():
+            info = await application.bot.get_webhook_info()
+            if info.url == WEBHOOK_URL:
+                print(f"✅ Webhook already set to: {WEBHOOK_URL}")
+            else:
+                await application.bot.set_webhook(url=WEBHOOK_URL)
+                print(f"✅ Webhook set to: {WEBHOOK_URL}")
+
+        await asyncio.gather(_retrying("state", load), _retrying("initialize", initialize))
+        await _retrying("webhook", webhook)
+        with _phase("services"):
+            await application.start()               # job queue + PTB persistence loop
+            # Daily midnight reset
+            scheduler = AsyncIOScheduler()
+            scheduler.add_job(
+                reset_parking,
+                CronTrigger(hour=0, minute=0, timezone=TZ)
+            )
+            scheduler.add_job(_poll_yards_file, "interval", seconds=60)
+            scheduler.add_job(PERSISTENCE.flush, "interval", seconds=PERSIST_INTERVAL)
+            scheduler.add_job(SEEN_UPDATES.save, "interval", seconds=PERSIST_INTERVAL)
+            scheduler.start()
+            await NOTIFIER.start()
+            await INGEST.start()
+    except Exception as exc:
+        STARTUP_ERRORS.setdefault("services", repr(exc))
+        print(f"❌ Startup failed: {exc!r} – exiting so the service is restarted")
+        os.kill(os.getpid(), signal.SIGTERM)        # uvicorn shuts down (see shutdown())
+        raise
+    STARTUP["warm_up"] = round((time.perf_counter() - t0) * 1000, 1)
+    READY.set()
+    print("🚀 Ready – " + " | ".join(f"{k} {v:g} ms" for k, v in STARTUP.items()))
+
+
+async def shutdown():
+    """Drain queued updates and notifications, then flush the state backend."""
+    if _warmup is not None:
+        await asyncio.gather(_warmup, return_exceptions=True)   # let boot settle
+    await WATCHDOG.stop()
+    WATCHDOG.dump(PROFILE_DIR)
+    if not READY.is_set():
+        print(f"⚠️ Shutting down before ready – {len(INGEST)} queued update(s) dropped")
+        HISTORY.close()
+        return
+    await INGEST.stop()
+    await SEEN_UPDATES.save()
+    await NOTIFIER.stop()
+    await BACKGROUND_BOT.shutdown()
+    if application.running:
+        await application.stop()
+    await application.shutdown()           # final persistence update + flush
+    PERSISTENCE.close()
+    await STATE.close()
+    HISTORY.close()
+
+
+async def _process_raw(update: dict):
+    STATE.refresh()               # pick up changes made by other workers
+    update_id = update.get("update_id")
+    if update_id is not None and not await STATE.see_update(update_id, UPDATE_DEDUP_WINDOW):
+        DUPLICATES.inc()          # re‑delivered to another worker, which had it first
+        return
+    upd = Update.de_json(update, bot=application.bot)
+    # through the concurrent_updates processor: global cap, one at a time per user
+    await application.update_processor.process_update(upd, application.process_update(upd))
+
+
+INGEST = UpdateQueue(_process_raw, workers=INGEST_WORKERS,
+                     maxsize=INGEST_QUEUE_SIZE, overflow=INGEST_OVERFLOW)
+# this worker's window, checked before queueing; with the SQLite backend
+# the shared one in the state DB (see _process_raw) is also the one that
+# survives restarts, so the local window is not saved per worker
+SEEN_UPDATES = SeenUpdates(DATA_DIR / "seen_updates.json" if STATE_BACKEND == "memory" else None,
+                           size=UPDATE_DEDUP_WINDOW)
+
+# ── Metrics (/metrics in main.py) ─────────────────────────────────────────────
+# every handler above gets a latency histogram; gauges are read at scrape time
+instrument(application)
+REGISTRY.gauge("occupied_slots", "Occupied slots per yard.", ("yard",),
+               lambda: {(n,): len(y.taken) for n, y in OCCUPANCY.yards.items()})
+REGISTRY.gauge("yard_slots", "Configured slots per yard.", ("yard",),
+               lambda: {(n,): len(y) for n, y in OCCUPANCY.yards.items()})
+REGISTRY.gauge("timer_jobs", "Pending reminder / expiry jobs.", ("kind",),
+               lambda: {(k,): v for k, v in TIMERS.counts().items()})
+REGISTRY.gauge("user_phones", "Users with a shared phone number.", (),
+               lambda: {(): len(USER_PHONES)})
+REGISTRY.gauge("allowed_phones", "Phone numbers on the allow‑list.", (),
+               lambda: {(): len(ALLOWED_PHONES)})
+REGISTRY.gauge("waitlist_users", "Users waiting for a free slot.", (),
+               lambda: {(): len(WAITLIST)})
+REGISTRY.gauge("bookings", "Bookings not yet pruned (current and upcoming).", (),
+               lambda: {(): len(RESERVATIONS)})
+REGISTRY.gauge("ingest_queue_depth", "Webhook updates waiting for a worker.", (),
+               lambda: {(): len(INGEST)})
 router = APIRouter()
 
 
 @router.post(WEBHOOK_PATH)
 async def telegram_webhook(update: dict):
-    await application.process_update(Update.de_json(update, bot=application.bot))
+    """
+    Enqueue the update and acknowledge at once; workers do the rest.
+    In reply mode the update is handled here and its lone reply returned.
+    """
+    if STARTUP_ERRORS:
+        # warm‑up is failing – no worker would ever run it; Telegram re‑delivers
+        return Response(status_code=503)
+    update_id = update.get("update_id")
+    if update_id is not None and not SEEN_UPDATES.add(update_id):
+        return                          # a re‑delivery – queued or handled already
+    if WEBHOOK_REPLY and READY.is_set():
+        # handled right here, so a single reply can ride on the response
+        return await handle_with_reply(_process_raw, update, WEBHOOK_REPLY_WAIT)
+    if not await INGEST.submit(update):
+        # queue full – a non‑2xx makes Telegram re‑deliver later
+        SEEN_UPDATES.forget(update_id)
+        return Response(status_code=503)
 
 bot_app = router
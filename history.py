@@ -0,0 +1,215 @@
+# history.py – Append‑only occupancy history with vectorised analytics
+# -------------------------------------------------
+# Every finished stay (park → leave / expiry / midnight reset) is one
+# fixed‑width 24‑byte record appended to a monthly partition file
+# ``history/YYYY-MM.bin``.  Queries memory‑map only the partitions in
+# range and aggregate with numpy (imported on the first query, so it
+# stays out of the bot's cold start), so months of history answer in
+# milliseconds:
+#   * utilisation per slot and per hour of day
+#   * average dwell time (overall / per slot)
+#   * charging‑slot overstays (stays longer than the reminder threshold)
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import fcntl
+import functools
+import json
+import os
+import struct
+import time
+from datetime import datetime, tzinfo
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# start, end (epoch s), user_id, yard id, slot, flags, padding
+_RECORD = struct.Struct("<IIqHHB3x")
+
+
+@functools.cache
+def record_dtype() -> "np.dtype":
+    """numpy view of one record (the import is deferred to the first query)."""
+    import numpy as np
+    return np.dtype({
+        "names": ["start", "end", "user", "yard", "slot", "flags"],
+        "formats": ["<u4", "<u4", "<i8", "<u2", "<u2", "u1"],
+        "offsets": [0, 4, 8, 16, 18, 20],
+        "itemsize": _RECORD.size,
+    })
+
+CHARGING = 0x01                       # flags bit 0: stay was in a charging slot
+ENDED_LEAVE, ENDED_EXPIRE, ENDED_RESET = 0, 1, 2   # flags bits 1‑2: how it ended
+
+
+class HistoryStore:
+    """Monthly‑partitioned, fixed‑width stay records under *root*."""
+
+    def __init__(self, root: str | Path, tz: tzinfo):
+        self.root = Path(root)
+        self.tz = tz
+        self._yard_ids: dict[str, int] | None = None
+        self._fh = None
+        self._fh_month = ""
+
+    # ── yard ids (names are stored once, records carry a u16) ──────────────
+    # Several workers share the directory: a name missing from the cache
+    # is looked up again on disk, and new ids are handed out under an
+    # exclusive lock on ``yards.lock`` and written atomically.
+    def _read_ids(self) -> dict[str, int]:
+        try:
+            return json.loads((self.root / "yards.json").read_text("utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @property
+    def yard_ids(self) -> dict[str, int]:
+        if self._yard_ids is None:
+            self._yard_ids = self._read_ids()
+        return self._yard_ids
+
+    def _known(self, name: str) -> int | None:
+        """Id of *name*, re‑reading the map once if another worker may have added it."""
+        if name not in self.yard_ids:
+            self._yard_ids = self._read_ids()
+        return self._yard_ids.get(name)
+
+    def _yard_id(self, name: str) -> int:
+        known = self._known(name)
+        if known is not None:
+            return known
+        self.root.mkdir(parents=True, exist_ok=True)
+        with (self.root / "yards.lock").open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            ids = self._read_ids()              # the truth, under the lock
+            if name not in ids:
+                ids[name] = max(ids.values(), default=-1) + 1
+                tmp = self.root / f"yards.json.{os.getpid()}.tmp"
+                tmp.write_text(json.dumps(ids), "utf-8")
+                os.replace(tmp, self.root / "yards.json")
+        self._yard_ids = ids
+        return ids[name]
+
+    # ── writing ────────────────────────────────────────────────────────────
+    def record(self, yard: str, slot: int, user_id: int, start: float,
+               end: float | None = None, charging: bool = False, ended: int = ENDED_LEAVE):
+        """Append one finished stay (partitioned by the month it ended)."""
+        end = time.time() if end is None else end
+        month = datetime.fromtimestamp(end, self.tz).strftime("%Y-%m")
+        if month != self._fh_month:
+            if self._fh:
+                self._fh.close()
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._fh = (self.root / f"{month}.bin").open("ab")
+            self._fh_month = month
+        flags = (CHARGING if charging else 0) | (ended << 1)
+        self._fh.write(_RECORD.pack(int(start), int(end), user_id,
+                                    self._yard_id(yard), slot, flags))
+        self._fh.flush()
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+            self._fh_month = ""
+
+    # ── reading ────────────────────────────────────────────────────────────
+    def load(self, since: float, until: float, yard: str | None = None) -> np.ndarray:
+        """All stays overlapping [since, until), optionally for one yard."""
+        import numpy as np
+        dtype = record_dtype()
+        # partitions hold stays by end month; no stay outlives the nightly reset
+        first = datetime.fromtimestamp(since, self.tz).strftime("%Y-%m")
+        last = datetime.fromtimestamp(until + 2 * 86400, self.tz).strftime("%Y-%m")
+        parts = []
+        for path in sorted(self.root.glob("*.bin")):
+            if first <= path.stem <= last and path.stat().st_size:
+                parts.append(np.memmap(path, dtype=dtype, mode="r",
+                                       shape=(path.stat().st_size // _RECORD.size,)))
+        if not parts:
+            return np.empty(0, dtype=dtype)
+        recs = np.concatenate(parts)
+        mask = (recs["end"] > since) & (recs["start"] < until)
+        if yard is not None:
+            yard_id = self._known(yard)
+            if yard_id is None:
+                return np.empty(0, dtype=dtype)
+            mask &= recs["yard"] == yard_id
+        return recs[mask]
+
+    # ── analytics ──────────────────────────────────────────────────────────
+    def utilisation(self, yard: str, slots: list[int], since: float, until: float
+                    ) -> tuple[dict[int, float], list[float]]:
+        """
+        ``(per_slot, per_hour)``: fraction of [since, until) each slot was
+        occupied, and the yard‑wide occupied fraction for each local hour 0‑23.
+        """
+        import numpy as np
+        since, until = int(since), int(until)
+        if until <= since:
+            return dict.fromkeys(slots, 0.0), [0.0] * 24
+        recs = self.load(since, until, yard)
+        base = since - since % 3600                  # hour‑aligned origin
+        start = np.clip(recs["start"].astype(np.int64), since, until) - base
+        end = np.clip(recs["end"].astype(np.int64), since, until) - base
+        dur = end - start
+
+        slot_arr = np.sort(np.asarray(slots))
+        lut = np.full(1 << 16, -1, dtype=np.int64)   # slot (u16) -> position
+        lut[slot_arr] = np.arange(len(slot_arr))
+        idx = lut[recs["slot"]]
+        known = idx >= 0
+        busy = np.bincount(idx[known], weights=dur[known], minlength=len(slot_arr))
+        per_slot = {int(s): float(b / (until - since)) for s, b in zip(slot_arr, busy)}
+
+        # seconds occupied inside each absolute hour of the range
+        n_hours = (until - base) // 3600 + 1
+        hs, he = start // 3600, end // 3600
+        size = n_hours + 1
+        same = hs == he
+        multi = ~same
+        hs_m, he_m = hs[multi], he[multi]
+        secs = (np.bincount(hs[same], weights=dur[same], minlength=size)
+                + np.bincount(hs_m, weights=(hs_m + 1) * 3600 - start[multi], minlength=size)
+                + np.bincount(he_m, weights=end[multi] - he_m * 3600, minlength=size))[:size]
+        # whole hours strictly between first and last hour: +1 / −1 difference array
+        full = (np.bincount(hs_m + 1, minlength=size + 1)
+                - np.bincount(he_m, minlength=size + 1))[:size]
+        secs += np.cumsum(full) * 3600
+
+        # fold absolute hours onto local hour of day
+        edges = np.arange(size) * 3600
+        avail = np.clip(np.minimum(edges + 3600, until - base)
+                        - np.maximum(edges, since - base), 0, None)
+        local = np.array([datetime.fromtimestamp(base + h * 3600, self.tz).hour
+                          for h in range(size)])
+        hour_busy = np.bincount(local, weights=secs, minlength=24)
+        hour_avail = np.bincount(local, weights=avail, minlength=24) * max(1, len(slots))
+        per_hour = [float(b / a) if a else 0.0 for b, a in zip(hour_busy, hour_avail)]
+        return per_slot, per_hour
+
+    def dwell(self, yard: str | None, since: float, until: float
+              ) -> tuple[float, dict[int, float], int]:
+        """``(mean_seconds, mean_seconds_per_slot, n_stays)`` for stays ending in range."""
+        import numpy as np
+        recs = self.load(since, until, yard)
+        recs = recs[recs["end"] < until]
+        if not len(recs):
+            return 0.0, {}, 0
+        dur = recs["end"].astype(np.int64) - recs["start"]
+        slots, idx = np.unique(recs["slot"], return_inverse=True)
+        per_slot = np.bincount(idx, weights=dur) / np.bincount(idx)
+        return float(dur.mean()), dict(zip(slots.tolist(), per_slot.tolist())), len(recs)
+
+    def overstays(self, yard: str | None, limit_s: float, since: float, until: float
+                  ) -> dict[int, int]:
+        """Charging‑slot stays longer than *limit_s*, counted per slot."""
+        import numpy as np
+        recs = self.load(since, until, yard)
+        dur = recs["end"].astype(np.int64) - recs["start"]
+        hit = recs[((recs["flags"] & CHARGING) != 0) & (dur > limit_s)]
+        slots, counts = np.unique(hit["slot"], return_counts=True)
+        return dict(zip(slots.tolist(), counts.tolist()))
@@ -0,0 +1,206 @@
+# ingest.py – Asynchronous webhook ingestion for the Parking‑Yard Bot
+# -------------------------------------------------
+# The webhook endpoint only enqueues the raw update and returns, so
+# Telegram gets its 200 immediately.  A pool of workers drains the
+# queues.  Each user is pinned to one worker shard, so updates from the
+# same user are processed strictly in order (ConversationHandler state
+# stays consistent) while different users run in parallel.
+# PerUserProcessor gives PTB's own ``concurrent_updates`` the same
+# guarantee: many updates in flight, one at a time per user.
+# Telegram re‑delivers an update whose 200 came too late; SeenUpdates
+# remembers the last few thousand update_ids taken in, so a repeat is
+# acknowledged without costing a handler run or an API call.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import tempfile
+from collections import deque
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from locks import KeyedLocks
+from metrics import REGISTRY
+
+# what to do when a shard's queue is full
+OVERFLOW_POLICIES = ("reject", "block", "drop_oldest")
+DUPLICATES = REGISTRY.counter("webhook_duplicates_total",
+                              "Re‑delivered updates acknowledged without processing.")
+
+
+def user_key(payload: dict) -> int:
+    """
+    Ordering key of a raw update dict: the sender's user id if there is
+    one (message, callback_query, …), else the chat id, else update_id.
+    """
+    for value in payload.values():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("user")
+            if sender:
+                return sender["id"]
+            chat = value.get("chat")
+            if chat:
+                return chat["id"]
+    return payload.get("update_id", 0)
+
+
+class PerUserProcessor(BaseUpdateProcessor):
+    """
+    ``concurrent_updates`` processor: up to *max_concurrent_updates*
+    updates run at once, but those of one user (or chat) are serialised
+    in arrival order – ConversationHandler relies on seeing a user's
+    messages one by one.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._users = KeyedLocks()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        key = None
+        if isinstance(update, Update):
+            who = update.effective_user or update.effective_chat
+            key = who.id if who else None
+        if key is None:
+            await coroutine
+            return
+        async with self._users.hold(key):
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class UpdateQueue:
+    """
+    Bounded, sharded update queue drained by *workers* tasks.
+
+    ``overflow`` decides what :meth:`submit` does when the user's shard is full:
+    * ``reject``      – return False; the endpoint answers 503 and Telegram retries
+    * ``block``       – wait for room (holds the HTTP response, but bounded)
+    * ``drop_oldest`` – discard the oldest queued update of that shard
+    """
+
+    def __init__(self, process: Callable[[dict], Awaitable[None]],
+                 workers: int = 4, maxsize: int = 1000, overflow: str = "reject"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        self.process = process
+        self.overflow = overflow
+        per_shard = max(1, maxsize // max(1, workers))
+        self._queues = [asyncio.Queue(per_shard) for _ in range(max(1, workers))]
+        self._tasks: list[asyncio.Task] = []
+        self.rejected = 0                  # updates refused/dropped due to backpressure
+
+    def __len__(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker(q), name=f"ingest-{i}")
+                       for i, q in enumerate(self._queues)]
+
+    async def stop(self):
+        """Let the workers drain what is queued, then cancel them."""
+        for q in self._queues:
+            await q.join()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, payload: dict) -> bool:
+        """Queue *payload*; False means it was refused and should be retried."""
+        q = self._queues[user_key(payload) % len(self._queues)]
+        if self.overflow == "block":
+            await q.put(payload)
+            return True
+        if q.full():
+            self.rejected += 1
+            if self.overflow == "reject":
+                return False
+            q.get_nowait()                 # drop_oldest
+            q.task_done()
+        q.put_nowait(payload)
+        return True
+
+    async def _worker(self, q: asyncio.Queue):
+        while True:
+            payload = await q.get()
+            try:
+                await self.process(payload)
+            except Exception as exc:       # never let one update kill the worker
+                print(f"❌ update {payload.get('update_id')} failed: {exc!r}")
+            finally:
+                q.task_done()
+
+
+class SeenUpdates:
+    """
+    The last *size* update_ids taken in (ring buffer + set, constant
+    memory).  Saved to *path* by :meth:`save` and read back by
+    :meth:`load`, so re‑deliveries straddling a restart are caught too.
+    The window is per process; several workers share theirs through the
+    state DB instead (``StateBackend.see_update``) and pass no *path*.
+    """
+
+    def __init__(self, path: str | Path | None, size: int = 4096):
+        self.path = Path(path) if path is not None else None   # None: not persisted
+        self.size = size
+        self._ring: deque[int] = deque()
+        self._set: set[int] = set()
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    def add(self, update_id: int) -> bool:
+        """Remember *update_id*; False (and counted) if it was seen already."""
+        if update_id in self._set:
+            DUPLICATES.inc()
+            return False
+        if len(self._ring) >= self.size:
+            self._set.discard(self._ring.popleft())
+        self._ring.append(update_id)
+        self._set.add(update_id)
+        self._dirty = True
+        return True
+
+    def forget(self, update_id: int):
+        """Undo :meth:`add` – the update was refused and Telegram will send it again."""
+        if update_id in self._set:
+            self._set.discard(update_id)
+            self._ring.remove(update_id)      # O(size), only on backpressure
+
+    def load(self):
+        if self.path is None:
+            return
+        try:
+            ids = json.loads(self.path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return
+        for update_id in ids[-self.size:]:
+            self.add(update_id)
+        self._dirty = False
+
+    async def save(self):
+        """Write the window if it changed (the file write runs off the loop)."""
+        if not self._dirty or self.path is None:
+            return
+        self._dirty = False
+        await asyncio.to_thread(self._write, list(self._ring))
+
+    def _write(self, ids: list[int]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".seen-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(ids, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
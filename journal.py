@@ -0,0 +1,169 @@
+# journal.py – Append‑only write‑ahead journal with group commit
+# -------------------------------------------------
+# Every state mutation (park / leave / phone / allow‑list) becomes
+# one JSON line appended to ``journal.log``.  A single writer thread
+# drains whatever has been appended since its last pass, writes it
+# and issues ONE fsync for the whole batch (group commit).  Every
+# ``snapshot_every`` records a compacted snapshot of the full state is
+# written and the journal is truncated, so startup = snapshot + tail.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import tempfile
+from concurrent.futures import Future
+from pathlib import Path
+from threading import Condition, Thread
+from typing import Callable, Iterator
+
+_DUMP = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+class Journal:
+    """
+    Write‑ahead journal living in *data_dir*.
+
+    ``state_fn`` must return a JSON‑serialisable copy of the full state;
+    it is called on the appending thread whenever a snapshot is due so the
+    writer thread never touches live dicts.
+    """
+
+    def __init__(self, data_dir: str | Path, state_fn: Callable[[], dict],
+                 snapshot_every: int = 1000):
+        self.dir = Path(data_dir)
+        self.log_path = self.dir / "journal.log"
+        self.snap_path = self.dir / "snapshot.json"
+        self.state_fn = state_fn
+        self.snapshot_every = snapshot_every
+
+        self.seq = 0                       # last sequence number handed out
+        self._since_snap = 0
+        self._pending: list[tuple[str, object]] = []
+        self._batch: Future = Future()     # resolved when pending is durable
+        self._cond = Condition()
+        self._closing = False
+        self._thread: Thread | None = None
+        self._fh = None
+
+    # ── startup ────────────────────────────────────────────────────────────
+    def load(self) -> tuple[dict | None, Iterator[dict]]:
+        """
+        Return ``(snapshot_state, tail_records)``.
+        *snapshot_state* is None if no snapshot exists yet; *tail_records*
+        yields only the records written after that snapshot.
+        """
+        snap = None
+        snap_seq = 0
+        try:
+            with self.snap_path.open(encoding="utf-8") as f:
+                snap = json.load(f)
+            snap_seq = snap.get("seq", 0)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        self.seq = snap_seq
+        return snap, self._tail(snap_seq)
+
+    def _tail(self, after: int) -> Iterator[dict]:
+        try:
+            f = self.log_path.open(encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    break                  # torn last write – stop here
+                if rec["seq"] > after:
+                    self.seq = rec["seq"]
+                    self._since_snap += 1
+                    yield rec
+
+    def open(self):
+        """Start the writer thread (call after :meth:`load`)."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._fh = self.log_path.open("a", encoding="utf-8")
+        self._thread = Thread(target=self._writer, name="journal", daemon=True)
+        self._thread.start()
+
+    # ── appending ──────────────────────────────────────────────────────────
+    def append(self, op: str, **fields) -> Future:
+        """
+        Queue one record; returns a Future resolved once it is fsynced.
+        Safe to call from any thread.
+        """
+        with self._cond:
+            self.seq += 1
+            self._pending.append(("rec", {"seq": self.seq, "op": op, **fields}))
+            self._since_snap += 1
+            if self._since_snap >= self.snapshot_every:
+                self._pending.append(("snap", {"seq": self.seq, **self.state_fn()}))
+                self._since_snap = 0
+            fut = self._batch
+            self._cond.notify()
+        return fut
+
+    async def commit(self, op: str, **fields):
+        """Append and wait until the record is durable."""
+        await asyncio.wrap_future(self.append(op, **fields))
+
+    def snapshot(self) -> Future:
+        """Force a compacted snapshot now (e.g. on shutdown)."""
+        with self._cond:
+            self._pending.append(("snap", {"seq": self.seq, **self.state_fn()}))
+            self._since_snap = 0
+            fut = self._batch
+            self._cond.notify()
+        return fut
+
+    def close(self):
+        """Flush everything still pending and stop the writer thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    # ── writer thread ──────────────────────────────────────────────────────
+    def _writer(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending and self._closing:
+                    break
+                batch, self._pending = self._pending, []
+                done, self._batch = self._batch, Future()
+            try:
+                for kind, item in batch:
+                    if kind == "rec":
+                        self._fh.write(_DUMP(item) + "\n")
+                    else:
+                        self._sync()
+                        self._write_snapshot(item)
+                        self._fh.close()           # compaction: start a fresh log
+                        self._fh = self.log_path.open("w", encoding="utf-8")
+                self._sync()
+            except Exception as exc:               # surface I/O errors to waiters
+                done.set_exception(exc)
+                print(f"❌ journal write failed: {exc}")
+            else:
+                done.set_result(None)
+        self._fh.close()
+
+    def _sync(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def _write_snapshot(self, state: dict):
+        with tempfile.NamedTemporaryFile(
+            "w", delete=False, dir=self.dir, encoding="utf-8"
+        ) as tmp:
+            tmp.write(_DUMP(state))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        Path(tmp.name).replace(self.snap_path)
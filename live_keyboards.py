@@ -0,0 +1,138 @@
+# live_keyboards.py – Inline slot pickers that follow occupancy
+# -------------------------------------------------
+# A slot picker is one message with an inline keyboard of the yard's
+# free slots.  While it is open, the keyboard is edited in place as
+# other cars park and leave, so a tap is always on a current slot
+# and nothing is re‑sent.  Changes to a yard are debounced: one edit
+# per open picker per ``delay`` seconds at most, and only if its
+# keyboard actually changed.  Pickers close when used, or stop being
+# followed after ``ttl`` seconds (their buttons still work – a stale
+# tap is simply re‑checked by the handler).  Pickers of a yard removed
+# by a config reload are closed and their buttons replaced by a note.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
+
+from occupancy import Occupancy, Occupant
+
+Render = Callable[[str, int], InlineKeyboardMarkup]   # fn(yard, user_id)
+MessageKey = tuple[int, int]                           # (chat_id, message_id)
+
+
+class _Open:
+    __slots__ = ("user_id", "expires", "markup")
+
+    def __init__(self, user_id: int, expires: float, markup: InlineKeyboardMarkup):
+        self.user_id = user_id
+        self.expires = expires
+        self.markup = markup
+
+
+class LiveKeyboards:
+    """Open picker messages per yard, re‑rendered when the yard changes."""
+
+    def __init__(self, bot: Bot, occupancy: Occupancy, render: Render,
+                 delay: float = 1.0, ttl: float = 120):
+        self.bot = bot
+        self.occupancy = occupancy
+        self.render = render
+        self.delay = delay
+        self.ttl = ttl
+        self._open: dict[str, dict[MessageKey, _Open]] = {}
+        self._due: set[str] = set()                     # yards with a refresh scheduled
+        self._tasks: set[asyncio.Task] = set()
+        self.edits = 0
+        occupancy.listeners.append(self._on_change)
+
+    def __len__(self) -> int:
+        return sum(len(msgs) for msgs in self._open.values())
+
+    def open(self, yard: str, chat_id: int, message_id: int, user_id: int,
+             markup: InlineKeyboardMarkup):
+        """Follow a picker just sent with *markup*."""
+        self._open.setdefault(yard, {})[(chat_id, message_id)] = _Open(
+            user_id, time.monotonic() + self.ttl, markup)
+
+    def close(self, yard: str, chat_id: int, message_id: int):
+        msgs = self._open.get(yard)
+        if msgs is not None:
+            msgs.pop((chat_id, message_id), None)
+            if not msgs:
+                del self._open[yard]
+
+    def drop_yard(self, yard: str, text: str):
+        """Stop following *yard*'s pickers (the yard is going away) and edit them to *text*."""
+        self._due.discard(yard)
+        for chat_id, message_id in self._open.pop(yard, {}):
+            self._track(self._retire(chat_id, message_id, text), f"picker-retire:{yard}")
+
+    async def refresh_one(self, yard: str, chat_id: int, message_id: int, user_id: int):
+        """Re‑render one picker now (after a tap on a slot that was just taken)."""
+        if yard not in self.occupancy.yards:
+            return                                      # removed by a reload
+        entry = self._open.get(yard, {}).get((chat_id, message_id))
+        markup = self.render(yard, user_id)
+        if entry is not None:
+            if markup == entry.markup:
+                return
+            entry.markup = markup
+        await self._edit(yard, (chat_id, message_id), markup)
+
+    # ── following occupancy ────────────────────────────────────────────────
+    def _on_change(self, _event: str, yard: str, _slot: int | None, _occ: Occupant | None):
+        if yard in self._open and yard not in self._due:
+            self._due.add(yard)
+            asyncio.get_running_loop().call_later(self.delay, self._spawn, yard)
+
+    def _spawn(self, yard: str):
+        self._track(self._refresh(yard), f"picker-refresh:{yard}")
+
+    def _track(self, coro, name: str):
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, yard: str):
+        self._due.discard(yard)
+        if yard not in self.occupancy.yards:
+            self._open.pop(yard, None)                  # removed by a reload
+            return
+        msgs = self._open.get(yard, {})
+        now = time.monotonic()
+        edits = []
+        for key, entry in list(msgs.items()):
+            if entry.expires < now:
+                del msgs[key]
+                continue
+            markup = self.render(yard, entry.user_id)
+            if markup != entry.markup:
+                entry.markup = markup
+                edits.append(self._edit(yard, key, markup))
+        if not msgs:
+            self._open.pop(yard, None)
+        await asyncio.gather(*edits)
+
+    async def _retire(self, chat_id: int, message_id: int, text: str):
+        try:
+            await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        except TelegramError as exc:                    # deleted / too old – nothing to do
+            print(f"⚠️ picker retire {chat_id}/{message_id} failed: {exc}")
+
+    async def _edit(self, yard: str, key: MessageKey, markup: InlineKeyboardMarkup):
+        chat_id, message_id = key
+        try:
+            await self.bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id,
+                                                     reply_markup=markup)
+            self.edits += 1
+        except BadRequest as exc:
+            if "not modified" not in str(exc):
+                self.close(yard, chat_id, message_id)   # deleted / too old – stop following
+        except TelegramError as exc:
+            print(f"⚠️ picker refresh {chat_id}/{message_id} failed: {exc}")
@@ -0,0 +1,47 @@
+# locks.py – Per‑key asyncio locks for compound state changes
+# -------------------------------------------------
+# Claims and releases are atomic compare‑and‑sets in the state
+# backends, but a handler does more than one step around them (claim,
+# then work out whom the car now blocks; compute whom a car was
+# blocking, release, then tell them).  With updates processed
+# concurrently those steps must not interleave with another park /
+# leave in the same yard, so each yard gets its own lock; different
+# yards never wait on each other.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Hashable
+
+
+class KeyedLocks:
+    """One lazily created :class:`asyncio.Lock` per key."""
+
+    def __init__(self):
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+
+    def __getitem__(self, key: Hashable) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    @asynccontextmanager
+    async def hold(self, *keys: Hashable) -> AsyncIterator[None]:
+        """
+        Hold the locks of every key in *keys*.  They are always taken in
+        sorted order, so two callers holding overlapping sets cannot deadlock.
+        """
+        locks = [self[k] for k in sorted(set(keys))]
+        taken: list[asyncio.Lock] = []
+        try:
+            for lock in locks:
+                await lock.acquire()
+                taken.append(lock)
+            yield
+        finally:
+            for lock in reversed(taken):
+                lock.release()
+
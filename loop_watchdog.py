@@ -0,0 +1,166 @@
+# loop_watchdog.py – Event‑loop lag watchdog and slow‑handler sampling profiler
+# -------------------------------------------------
+# Tells "the loop is blocked" apart from "a handler is slow":
+# * a heartbeat task sleeps ``interval`` seconds and records how late it
+#   woke up (event_loop_lag_seconds)
+# * a daemon thread watches the heartbeat; once it is more than
+#   ``lag_threshold`` overdue, the loop thread is stuck in synchronous
+#   code and its Python stack is sampled every ``sample_every`` seconds
+#   until the loop comes back
+# * on every heartbeat, handlers running longer than ``slow_handler``
+#   (see metrics.RUNNING) have their await chain sampled – where they
+#   are waiting (Bot API call, lock, database …)
+# Samples are aggregated as collapsed stacks ("root;frame;leaf count"),
+# the input format of flamegraph.pl / speedscope / inferno, rooted at
+# ``loop-blocked`` or ``slow-handler:<name>``.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from types import FrameType
+
+from metrics import REGISTRY, RUNNING
+
+MAX_STACKS = 5000                   # distinct stacks kept; the rest count as "(other)"
+MAX_DEPTH = 64
+
+LOOP_LAG = REGISTRY.histogram("event_loop_lag_seconds", "How late the loop heartbeat woke up.",
+                              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+STALLS = REGISTRY.counter("event_loop_stalls_total", "Times the loop was blocked past the threshold.")
+SAMPLES = REGISTRY.counter("profile_samples_total", "Stack samples taken, by cause.", ("cause",))
+
+
+def _frame_name(f: FrameType) -> str:
+    code = f.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{f.f_lineno})".replace(";", ":")
+
+
+def _thread_stack(f: FrameType | None) -> list[str]:
+    """Frames of a running thread, outermost first."""
+    names = []
+    while f is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(f))
+        f = f.f_back
+    names.reverse()
+    return names
+
+
+def _await_stack(coro) -> list[str]:
+    """Where a suspended coroutine is waiting: its ``await`` chain, outermost first."""
+    names = []
+    while coro is not None and len(names) < MAX_DEPTH:
+        f = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if f is None:
+            break
+        names.append(_frame_name(f))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    if coro is not None:
+        names.append(type(coro).__name__)         # e.g. a Future / Task we wait on
+    return names
+
+
+class Watchdog:
+    """Loop‑lag monitor plus collapsed‑stack sampler (start on the loop)."""
+
+    def __init__(self, interval: float = 0.1, lag_threshold: float = 0.1,
+                 slow_handler: float = 2.0, sample_every: float = 0.005):
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.slow_handler = slow_handler
+        self.sample_every = sample_every
+        self.stacks: dict[str, int] = {}
+        self.max_lag = 0.0
+        self._lock = threading.Lock()
+        self._beat_at = time.monotonic()
+        self._loop_thread = 0
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._series = LOOP_LAG.child()
+
+    # ── lifecycle ──────────────────────────────────────────────────────────
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._beat_at = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name="watchdog")
+        self._thread = threading.Thread(target=self._watch, name="watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # ── aggregation ────────────────────────────────────────────────────────
+    def _add(self, cause: str, frames: list[str]):
+        key = ";".join([cause, *frames])
+        with self._lock:
+            if key not in self.stacks and len(self.stacks) >= MAX_STACKS:
+                key = f"{cause};(other)"
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        SAMPLES.inc(cause.split(":", 1)[0])
+
+    def collapsed(self) -> str:
+        """All samples so far in collapsed‑stack format, heaviest first."""
+        with self._lock:
+            items = sorted(self.stacks.items(), key=lambda kv: -kv[1])
+        return "".join(f"{stack} {n}\n" for stack, n in items)
+
+    def dump(self, directory: Path) -> Path | None:
+        """Write the samples to *directory*/stacks-<time>.folded (None if there are none)."""
+        text = self.collapsed()
+        if not text:
+            return None
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / time.strftime("stacks-%Y%m%d-%H%M%S.folded")
+        path.write_text(text, encoding="utf-8")
+        return path
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+        self.max_lag = 0.0
+
+    # ── loop side ──────────────────────────────────────────────────────────
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - t0 - self.interval)
+            self._beat_at = time.monotonic()
+            LOOP_LAG.observe(self._series, lag)
+            self.max_lag = max(self.max_lag, lag)
+            now = time.perf_counter()
+            for task, (label, started) in list(RUNNING.items()):
+                if now - started > self.slow_handler and not task.done():
+                    self._add(f"slow-handler:{label}", _await_stack(task.get_coro()))
+
+    # ── watcher thread ─────────────────────────────────────────────────────
+    def _watch(self):
+        stalled = False
+        while not self._stop.is_set():
+            overdue = time.monotonic() - self._beat_at - self.interval
+            if overdue > self.lag_threshold:
+                if not stalled:
+                    stalled = True
+                    STALLS.inc()
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._add("loop-blocked", _thread_stack(frame))
+                del frame
+                time.sleep(self.sample_every)
+            else:
+                stalled = False
+                time.sleep(self.lag_threshold / 2)
@@ -1,5 +1,11 @@
-from fastapi import FastAPI
-from bot import router, set_webhook
+import os
+import time
+
+_T0 = time.perf_counter()          # before the heavy imports – timed as "import"
+
+from fastapi import FastAPI, Response
+from bot import READY, STARTUP, STARTUP_ERRORS, router, set_webhook, shutdown
+from metrics import CONTENT_TYPE, REGISTRY
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
@@ -8,9 +14,12 @@ load_dotenv()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await set_webhook()  # runs on startup
+    STARTUP["import"] = round((time.perf_counter() - _T0) * 1000, 1)
+    await set_webhook()  # returns at once; state and webhook warm up in the background
     yield
-    # Optional: cleanup logic here
+    await shutdown()  # flush the journal on exit
+    if STARTUP_ERRORS:
+        os._exit(1)   # warm‑up gave up – a failed exit gets the service restarted
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
@@ -22,5 +31,15 @@ def read_root():
 
 
 @app.get("/health")
-async def health_check():
-    return {"ok": True}
+async def health_check(response: Response):
+    """Readiness: 503 until warm‑up has finished (or while it is failing)."""
+    ready = READY.is_set()
+    if not ready:
+        response.status_code = 503
+    return {"ok": ready, "ready": ready, "startup_ms": STARTUP, "errors": STARTUP_ERRORS}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape target (text exposition format)."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
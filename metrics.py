@@ -0,0 +1,245 @@
+# metrics.py – Prometheus text‑format metrics without extra dependencies
+# -------------------------------------------------
+# A deliberately small registry: counters, histograms and gauges
+# rendered in the Prometheus text exposition format (v0.0.4).
+# * every handler callback on the Application is wrapped with a timer
+#   (latency histogram, error counter, in‑flight gauge per handler)
+# * every outbound Bot API call is timed by InstrumentedRequest, per
+#   connection pool (see transport.py)
+# * state gauges (occupied slots, timers, phones …) are read at scrape
+#   time from callbacks, so they cost nothing on the hot path
+# Recording is a perf_counter pair, a bisect over ~12 buckets and a
+# few integer adds on pre‑resolved label children – cheap enough to
+# leave on in production.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import functools
+import time
+from collections import deque
+from typing import Callable, Iterable
+
+from telegram.ext import Application, BaseHandler, ConversationHandler
+from telegram.request import HTTPXRequest
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# seconds; Telegram round trips sit in the 50 ms – 1 s range
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Labels = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, by: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + by
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        out += [f"{self.name}{_fmt_labels(self.labels, k)} {_num(v)}"
+                for k, v in self.values.items()]
+        return out
+
+
+class Gauge:
+    """Value set by callers, or pulled from *collect* (``{labels: value}``) at scrape time."""
+
+    def __init__(self, name: str, help: str, labels: Labels = (),
+                 collect: Callable[[], dict[Labels, float]] | None = None):
+        self.name, self.help, self.labels = name, help, labels
+        self.collect = collect
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, by: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + by
+
+    def dec(self, *labels: str, by: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - by
+
+    def render(self) -> list[str]:
+        values = self.collect() if self.collect else self.values
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        out += [f"{self.name}{_fmt_labels(self.labels, k)} {_num(v)}" for k, v in values.items()]
+        return out
+
+
+class _Series:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, n: int):
+        self.counts = [0] * (n + 1)          # last bucket is +Inf
+        self.sum = 0.0
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Labels = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = buckets
+        self.series: dict[Labels, _Series] = {}
+
+    def child(self, *labels: str) -> _Series:
+        s = self.series.get(labels)
+        if s is None:
+            s = self.series[labels] = _Series(len(self.buckets))
+        return s
+
+    def observe(self, series: _Series, seconds: float):
+        series.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        series.sum += seconds
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for k, s in self.series.items():
+            acc = 0
+            for le, c in zip((*map(_num, self.buckets), "+Inf"), s.counts):
+                acc += c
+                le_label = f'le="{le}"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, le_label)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {repr(s.sum)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {acc}")
+        return out
+
+
+class Registry:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.metrics: list[Counter | Gauge | Histogram] = []
+
+    def _add(self, m):
+        self.metrics.append(m)
+        return m
+
+    def counter(self, name: str, help: str, labels: Labels = ()) -> Counter:
+        return self._add(Counter(f"{self.prefix}_{name}", help, labels))
+
+    def gauge(self, name: str, help: str, labels: Labels = (),
+              collect: Callable[[], dict[Labels, float]] | None = None) -> Gauge:
+        return self._add(Gauge(f"{self.prefix}_{name}", help, labels, collect))
+
+    def histogram(self, name: str, help: str, labels: Labels = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(f"{self.prefix}_{name}", help, labels, buckets))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for m in self.metrics:
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+# ── the bot's metrics ──────────────────────────────────────────────────────────
+REGISTRY = Registry("parkingbot")
+HANDLER_SECONDS = REGISTRY.histogram("handler_seconds", "Handler callback latency.", ("handler",))
+HANDLER_ERRORS = REGISTRY.counter("handler_errors_total", "Handler callbacks that raised.", ("handler",))
+HANDLER_IN_FLIGHT = REGISTRY.gauge("handler_in_flight", "Handler callbacks currently running.", ("handler",))
+API_SECONDS = REGISTRY.histogram("bot_api_seconds", "Outbound Bot API call latency.",
+                                 ("pool", "method"))
+API_ERRORS = REGISTRY.counter("bot_api_errors_total",
+                              "Bot API calls that failed (transport error or HTTP >= 400).",
+                              ("pool", "method"))
+API_IN_FLIGHT = REGISTRY.gauge("bot_api_in_flight", "Bot API calls currently in flight.",
+                               ("pool", "method"))
+# handler callbacks running right now: task -> (handler, perf_counter at start);
+# loop_watchdog.py samples the ones that run too long
+RUNNING: dict[asyncio.Task, tuple[str, float]] = {}
+
+
+def timed(fn, name: str | None = None):
+    """Wrap an async handler callback with latency / error / in‑flight tracking."""
+    label = name or getattr(fn, "__name__", "handler")
+    series = HANDLER_SECONDS.child(label)
+    key = (label,)
+    in_flight = HANDLER_IN_FLIGHT.values
+    in_flight.setdefault(key, 0)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        in_flight[key] += 1
+        task = asyncio.current_task()
+        t0 = time.perf_counter()
+        RUNNING[task] = (label, t0)
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(label)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(series, time.perf_counter() - t0)
+            in_flight[key] -= 1
+            RUNNING.pop(task, None)
+
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+
+def _handlers(handlers: Iterable[BaseHandler]) -> Iterable[BaseHandler]:
+    for h in handlers:
+        if isinstance(h, ConversationHandler):
+            yield from _handlers(h.entry_points)
+            for state_handlers in h.states.values():
+                yield from _handlers(state_handlers)
+            yield from _handlers(h.fallbacks)
+        else:
+            yield h
+
+
+def instrument(application: Application):
+    """Wrap every handler registered on *application* (call after registration)."""
+    for group in application.handlers.values():
+        for h in _handlers(group):
+            if not getattr(h.callback, "__metrics_wrapped__", False):
+                h.callback = timed(h.callback)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """
+    HTTPXRequest that times every Bot API call by pool and method name,
+    and keeps the last *recent* calls as (method, seconds, status) for
+    diagnostics (status 0 = transport error).
+    """
+
+    def __init__(self, *args, pool: str = "default", recent: int = 512, **kwargs):
+        self.pool = pool
+        self.recent: deque[tuple[str, float, int]] = deque(maxlen=recent)
+        super().__init__(*args, **kwargs)
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> tuple[int, bytes]:
+        api = url.rsplit("/", 1)[-1]
+        API_IN_FLIGHT.inc(self.pool, api)
+        code = 0
+        t0 = time.perf_counter()
+        try:
+            code, body = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            API_ERRORS.inc(self.pool, api)
+            raise
+        finally:
+            took = time.perf_counter() - t0
+            API_SECONDS.observe(API_SECONDS.child(self.pool, api), took)
+            API_IN_FLIGHT.dec(self.pool, api)
+            self.recent.append((api, took, code))
+        if code >= 400:
+            API_ERRORS.inc(self.pool, api)
+        return code, body
@@ -0,0 +1,174 @@
+# notify.py – Rate‑limited outbound notification dispatcher
+# -------------------------------------------------
+# Handlers call ``NOTIFIER.send(chat_id, text)`` and return at once.
+# A small pool of workers delivers the messages concurrently while
+# respecting Telegram's flood limits (one global and one per‑chat
+# token bucket), retrying on 429 / 5xx / network errors, and merging
+# several pending notifications for the same chat into one message.
+# Messages with buttons (``reply_markup``) are never merged.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+MAX_TEXT = 4096                 # Telegram's message length limit
+
+
+class TokenBucket:
+    """Classic token bucket; :meth:`reserve` returns how long to wait."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def reserve(self) -> float:
+        """Take one token (possibly on credit) and return the delay in seconds."""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+class Notifier:
+    """
+    Background sender for *bot*.
+    Defaults follow Telegram's documented limits: ~30 msg/s overall and
+    about one message per second to the same chat.
+    """
+
+    def __init__(self, bot: Bot, workers: int = 8,
+                 global_rate: float = 25, global_burst: float = 30,
+                 chat_rate: float = 1, chat_burst: float = 3,
+                 max_retries: int = 5):
+        self.bot = bot
+        self.workers = workers
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: dict[int, TokenBucket] = {}
+        # chat_id -> texts to merge; (text, markup) entries go out on their own
+        self._pending: dict[int, list[str | tuple[str, InlineKeyboardMarkup]]] = {}
+        self._queued: set[int] = set()              # chats queued or in flight
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        # counters (exposed for diagnostics)
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+
+    def send(self, chat_id: int, text: str, reply_markup: InlineKeyboardMarkup | None = None):
+        """
+        Enqueue *text* for *chat_id*; merged with anything still pending
+        unless it carries *reply_markup*.
+        """
+        texts = self._pending.setdefault(chat_id, [])
+        if texts and reply_markup is None:
+            self.coalesced += 1
+        texts.append(text if reply_markup is None else (text, reply_markup))
+        if chat_id not in self._queued:
+            self._queued.add(chat_id)
+            self._queue.put_nowait(chat_id)
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker(), name=f"notify-{i}")
+                       for i in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """Give queued notifications *timeout* seconds to go out, then stop."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ notifier stopped with {len(self._pending)} chats pending")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ── workers ────────────────────────────────────────────────────────────
+    async def _worker(self):
+        while True:
+            chat_id = await self._queue.get()
+            try:
+                await self._deliver(chat_id)
+            except Exception as exc:
+                print(f"❌ notifier crashed on chat {chat_id}: {exc!r}")
+            finally:
+                if self._pending.get(chat_id):
+                    self._queue.put_nowait(chat_id)   # more arrived meanwhile
+                else:
+                    self._pending.pop(chat_id, None)
+                    self._queued.discard(chat_id)
+                self._queue.task_done()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1024:               # forget idle chats
+                self._chats = {c: b for c, b in self._chats.items() if not b.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    def _take(self, chat_id: int) -> tuple[str, InlineKeyboardMarkup | None]:
+        """Pop as many pending texts for *chat_id* as fit in one message."""
+        texts = self._pending.get(chat_id, [])
+        if texts and isinstance(texts[0], tuple):
+            text, markup = texts.pop(0)
+            return text[:MAX_TEXT], markup
+        size, n = 0, 0
+        for t in texts:
+            if isinstance(t, tuple):
+                break
+            size += len(t) + 2
+            if n and size > MAX_TEXT:
+                break
+            n += 1
+        merged = "\n\n".join(texts[:n])
+        del texts[:n]
+        return merged[:MAX_TEXT], None
+
+    async def _deliver(self, chat_id: int):
+        # wait for the per‑chat budget first so more messages can pile up and merge
+        await asyncio.sleep(self._chat_bucket(chat_id).reserve())
+        await asyncio.sleep(self._global.reserve())
+        text, markup = self._take(chat_id)
+        if not text:
+            return
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.bot.send_message(chat_id, text, reply_markup=markup)
+                self.sent += 1
+                return
+            except RetryAfter as exc:                 # 429 – Telegram tells us when
+                delay = exc.retry_after
+                delay = delay.total_seconds() if hasattr(delay, "total_seconds") else delay
+            except BadRequest as exc:                 # bad chat / text – retrying won't help
+                print(f"❌ notify {chat_id} rejected: {exc}")
+                break
+            except NetworkError as exc:               # 5xx, timeouts, connection errors
+                delay = min(30, 2 ** attempt)
+                print(f"⚠️ notify {chat_id} failed ({exc}), retry in {delay}s")
+            except Exception as exc:                  # Forbidden (user blocked bot) etc.
+                print(f"❌ notify {chat_id} failed: {exc!r}")
+                break
+            if attempt < self.max_retries:
+                self.retried += 1
+                await asyncio.sleep(delay)
+        self.failed += 1
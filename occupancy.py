@@ -0,0 +1,185 @@
+# occupancy.py – Indexed slot occupancy for the Parking‑Yard Bot
+# -------------------------------------------------
+# Replaces the raw per‑yard ``slots`` dicts with an engine that
+# keeps per‑yard free / charging bitsets plus a user_id → (yard, slot)
+# reverse index, so "am I parked?", park, leave and "free slots"
+# are all O(1) instead of a scan over every occupied slot.
+# Slot ids map to bit positions (arithmetically for contiguous
+# ranges), so an empty yard costs a few machine words however many
+# slots it has, and free‑slot enumeration is a bit scan.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Callable, Iterable
+
+# listener(event, yard, slot, occupant) with event in "park" | "leave" | "clear"
+Listener = Callable[[str, str, "int | None", "Occupant | None"], None]
+
+
+class Occupant:
+    """Who is parked in a slot; ``since`` is epoch seconds."""
+
+    __slots__ = ("user_id", "name", "phone", "since")
+
+    def __init__(self, user_id: int, name: str, phone: str = "unknown", since: int = 0):
+        self.user_id = user_id
+        self.name = name
+        self.phone = phone
+        self.since = since
+
+    def to_dict(self) -> dict:
+        return {"user_id": self.user_id, "name": self.name,
+                "phone": self.phone, "since": self.since}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Occupant":
+        """Inverse of :meth:`to_dict`; also reads legacy ``time`` ISO strings."""
+        since = d.get("since")
+        if since is None:
+            since = datetime.fromisoformat(d["time"]).timestamp()
+        return cls(d["user_id"], d["name"], d.get("phone", "unknown"), int(since))
+
+
+class YardOccupancy:
+    """Free / charging bitsets and occupants of a single yard."""
+
+    __slots__ = ("name", "ids", "_pos", "free_mask", "charging_mask", "taken")
+
+    def __init__(self, name: str, slot_ids: Iterable[int], charging: Iterable[int] = ()):
+        self.name = name
+        ids = sorted(slot_ids) if not isinstance(slot_ids, range) else slot_ids
+        if isinstance(ids, list) and ids and ids[-1] - ids[0] + 1 == len(ids):
+            ids = range(ids[0], ids[-1] + 1)      # contiguous → no per‑slot index
+        self.ids: range | list[int] = ids
+        self._pos: dict[int, int] | None = (
+            None if isinstance(ids, range) else {s: i for i, s in enumerate(ids)})
+        self.free_mask = (1 << len(ids)) - 1       # bit i set ⇔ ids[i] is free
+        self.charging_mask = 0
+        for s in charging:
+            self.charging_mask |= 1 << self.pos(s)
+        self.taken: dict[int, Occupant] = {}      # slot -> occupant
+
+    def pos(self, slot: int) -> int:
+        """Bit position of *slot*, or -1 if the yard has no such slot."""
+        if self._pos is not None:
+            return self._pos.get(slot, -1)
+        p = slot - self.ids.start
+        return p if 0 <= p < len(self.ids) else -1
+
+    def __contains__(self, slot: int) -> bool:
+        return self.pos(slot) >= 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def is_free(self, slot: int) -> bool:
+        p = self.pos(slot)
+        return p >= 0 and (self.free_mask >> p) & 1 == 1
+
+    def is_charging(self, slot: int) -> bool:
+        p = self.pos(slot)
+        return p >= 0 and (self.charging_mask >> p) & 1 == 1
+
+    def free_count(self) -> int:
+        return self.free_mask.bit_count()
+
+    def free_slots(self) -> list[int]:
+        """Free slot ids in ascending order (bit scan)."""
+        bits = bin(self.free_mask)[:1:-1]             # LSB first
+        ids = self.ids
+        return [ids[i] for i, b in enumerate(bits) if b == "1"]
+
+    def clear(self):
+        self.free_mask = (1 << len(self.ids)) - 1
+        self.taken.clear()
+
+
+class Occupancy:
+    """
+    Occupancy of every yard in *yards* (the ``PARKING_YARDS`` config).
+    Derived views (status cache, blocking graphs, timers) subscribe via
+    ``listeners``.
+    """
+
+    def __init__(self, yards: dict[str, dict]):
+        self.yards: dict[str, YardOccupancy] = {}
+        self.by_user: dict[int, tuple[str, int]] = {}   # user_id -> (yard, slot)
+        self.listeners: list[Listener] = []
+        self.reconfigure(yards)
+
+    def _emit(self, event: str, yard: str, slot: int | None, occ: Occupant | None):
+        for fn in self.listeners:
+            fn(event, yard, slot, occ)
+
+    def reconfigure(self, yards: dict[str, dict]):
+        """
+        Adopt a new yard config, keeping everyone whose slot still exists.
+        Callers must release occupants of removed slots first.
+        """
+        old, self.yards = self.yards, {}
+        for name, cfg in yards.items():
+            self.yards[name] = YardOccupancy(name, cfg["slots"], cfg.get("charging_slots", ()))
+        for name, prev in old.items():
+            y = self.yards.get(name)
+            for slot, occ in prev.taken.items():
+                p = y.pos(slot) if y is not None else -1
+                if p < 0:                              # slot vanished – forget it
+                    self.by_user.pop(occ.user_id, None)
+                    continue
+                y.free_mask &= ~(1 << p)
+                y.taken[slot] = occ
+
+    # ── queries ────────────────────────────────────────────────────────────
+    def where(self, user_id: int) -> tuple[str, int] | None:
+        """Return ``(yard, slot)`` the user is parked in, or None."""
+        return self.by_user.get(user_id)
+
+    def occupant(self, yard: str, slot: int) -> Occupant | None:
+        """Whoever occupies *slot* in *yard*, or None."""
+        return self.yards[yard].taken.get(slot)
+
+    def taken(self, yard: str) -> dict[int, Occupant]:
+        return self.yards[yard].taken
+
+    def free_slots(self, yard: str) -> list[int]:
+        return self.yards[yard].free_slots()
+
+    def is_charging(self, yard: str, slot: int) -> bool:
+        return self.yards[yard].is_charging(slot)
+
+    # ── mutations ──────────────────────────────────────────────────────────
+    def park(self, yard: str, slot: int, occ: Occupant) -> bool:
+        """
+        Put *occ* in *slot*.
+        Returns False if the slot is taken/unknown or the user is already parked.
+        """
+        y = self.yards[yard]
+        p = y.pos(slot)
+        if p < 0 or not (y.free_mask >> p) & 1 or occ.user_id in self.by_user:
+            return False
+        y.free_mask &= ~(1 << p)
+        y.taken[slot] = occ
+        self.by_user[occ.user_id] = (yard, slot)
+        self._emit("park", yard, slot, occ)
+        return True
+
+    def leave(self, user_id: int) -> tuple[str, int, Occupant] | None:
+        """Free whatever slot the user holds; return ``(yard, slot, occupant)`` or None."""
+        where = self.by_user.pop(user_id, None)
+        if where is None:
+            return None
+        yard, slot = where
+        y = self.yards[yard]
+        occ = y.taken.pop(slot)
+        y.free_mask |= 1 << y.pos(slot)
+        self._emit("leave", yard, slot, occ)
+        return yard, slot, occ
+
+    def clear(self):
+        """Empty every yard (midnight reset / admin reset)."""
+        for y in self.yards.values():
+            y.clear()
+            self._emit("clear", y.name, None, None)
+        self.by_user.clear()
@@ -0,0 +1,147 @@
+# persistence.py – Durable conversations and chosen yards, written behind
+# -------------------------------------------------
+# A python‑telegram‑bot ``BasePersistence`` on a small SQLite file, so
+# a restart mid‑conversation ("🏢 Choose a parking yard:") picks up where
+# the user left off, and (with the memory state backend) USER_YARD
+# survives restarts too.
+# Nothing is written per update: PTB hands over changed conversation
+# keys once per ``update_interval`` and they are only buffered here;
+# ``flush`` – run on an interval and on shutdown – writes every dirty
+# key plus the USER_YARD diff in one transaction.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (name TEXT, key TEXT, state TEXT NOT NULL,
+                                          PRIMARY KEY (name, key));
+CREATE TABLE IF NOT EXISTS user_yard (user_id INTEGER PRIMARY KEY, yard TEXT NOT NULL);
+"""
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Conversation states (and optionally the *user_yard* mirror) in *path*.
+    PTB's user / chat / bot / callback data are not used by the bot and
+    are not stored.
+    """
+
+    def __init__(self, path: str | Path, user_yard: dict[int, str] | None = None,
+                 update_interval: float = 30):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False,
+                                                     user_data=False, callback_data=False),
+                         update_interval=update_interval)
+        self.path = Path(path)
+        self.user_yard = user_yard
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()           # yards load off the loop at startup
+        self._dirty: dict[tuple[str, str], object] = {}   # (name, key) -> state | None
+        self._saved_yards: dict[int, str] = {}  # USER_YARD as last written
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    # ── chosen yards ───────────────────────────────────────────────────────
+    def load_user_yards(self):
+        """Fill the *user_yard* mirror from disk (no‑op without one)."""
+        if self.user_yard is None:
+            return
+        with self._lock:
+            rows = self._conn().execute("SELECT user_id, yard FROM user_yard").fetchall()
+        self._saved_yards = dict(rows)
+        self.user_yard.update(self._saved_yards)
+
+    # ── conversations ──────────────────────────────────────────────────────
+    async def get_conversations(self, name: str) -> dict:
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        return {tuple(json.loads(k)): json.loads(s) for k, s in rows}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None):
+        self._dirty[(name, json.dumps(list(key)))] = new_state
+
+    # ── write‑behind ───────────────────────────────────────────────────────
+    async def flush(self):
+        """Write every buffered change in one transaction."""
+        dirty, self._dirty = self._dirty, {}
+        yards = dict(self.user_yard) if self.user_yard is not None else self._saved_yards
+        changed = [(u, y) for u, y in yards.items() if self._saved_yards.get(u) != y]
+        gone = [(u,) for u in self._saved_yards if u not in yards]
+        if not (dirty or changed or gone):
+            return
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN")
+            try:
+                db.executemany("INSERT OR REPLACE INTO conversations VALUES (?, ?, ?)",
+                               [(n, k, json.dumps(s)) for (n, k), s in dirty.items() if s is not None])
+                db.executemany("DELETE FROM conversations WHERE name = ? AND key = ?",
+                               [nk for nk, s in dirty.items() if s is None])
+                db.executemany("INSERT OR REPLACE INTO user_yard VALUES (?, ?)", changed)
+                db.executemany("DELETE FROM user_yard WHERE user_id = ?", gone)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                for nk, s in dirty.items():            # retry on the next flush
+                    self._dirty.setdefault(nk, s)
+                raise
+        self._saved_yards = yards
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # ── data PTB would store – unused by this bot ──────────────────────────
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_user_data(self, user_id, data):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,70 @@
+# phones.py – E.164 phone normalisation and bulk allow‑list parsing
+# -------------------------------------------------
+# Every phone number the bot stores or compares (shared contacts,
+# /addphone, /delphone, bulk imports) goes through ``normalise`` so
+# the allow‑list and USER_PHONES always agree on one E.164 spelling.
+# Parsing is done by ``phonenumbers`` (local numbers default to
+# Israel) and memoised – the same numbers come back again and again.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import csv
+import functools
+import io
+from typing import Iterable
+
+import phonenumbers
+
+DEFAULT_REGION = "IL"               # how to read numbers without a country code
+MIN_DIGITS = 5                      # fewer digits than this → not meant as a number
+
+
+@functools.lru_cache(maxsize=65536)
+def normalise(raw: str, region: str | None = DEFAULT_REGION) -> str | None:
+    """
+    ``"058-612-3456"`` / ``"972586123456"`` / ``"+972586123456"`` →
+    ``"+972586123456"``; None if it isn't a valid phone number.
+    Pass ``region=None`` for numbers known to be international
+    (Telegram contacts), which may lack the leading ``+``.
+    """
+    raw = raw.strip()
+    if region is None and not raw.startswith("+"):
+        raw = "+" + raw
+    try:
+        number = phonenumbers.parse(raw, region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(number):
+        return None
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+def parse_bulk(lines: Iterable[str]) -> tuple[set[str], list[str]]:
+    """
+    Stream CSV / plain‑text lines into ``(valid E.164 numbers, invalid cells)``.
+    Every cell is tried, so ``name,phone`` exports work as well as one
+    number per line; cells with fewer than MIN_DIGITS digits (headers,
+    names, ids) are skipped rather than reported.
+    """
+    valid: set[str] = set()
+    invalid: list[str] = []
+    for row in csv.reader(lines):
+        for cell in row:
+            if sum(c.isdigit() for c in cell) < MIN_DIGITS:
+                continue
+            phone = normalise(cell)
+            if phone:
+                valid.add(phone)
+            else:
+                invalid.append(cell.strip())
+    return valid, invalid
+
+
+def export_csv(phones: Iterable[str]) -> bytes:
+    """The allow‑list as a one‑column CSV that :func:`parse_bulk` reads back."""
+    buf = io.StringIO()
+    buf.write("phone\n")
+    for p in sorted(phones):
+        buf.write(p + "\n")
+    return buf.getvalue().encode("utf-8")
@@ -0,0 +1,227 @@
+# reservations.py – Advance bookings with a per‑slot interval index
+# -------------------------------------------------
+# A booking holds one slot for a time window ("tomorrow 9:00–13:00"),
+# independent of the live occupancy that the midnight reset wipes.
+# Bookings of a slot never overlap, so each slot keeps them as one
+# sorted list – and because they are disjoint, their ends are sorted
+# too.  Every question the bot asks is then a single bisect:
+#
+# * does [a, b) overlap a booking of this slot?
+# * is this slot booked across instant t (someone must still be there)?
+# * does a booking of this slot end inside (a, b)?
+#
+# The last two make bookings respect ``blocks``: a booking may not end
+# while a slot in front of it is booked across that moment (the car
+# would be blocked in), nor be booked across the end of a booking
+# behind it.  Bookings for visitors carry ``user_id`` VISITOR (0), so
+# no Telegram user can park in them.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import bisect
+from typing import Iterable, Iterator
+
+from blocking import BlockingGraph
+
+VISITOR = 0                          # user_id of bookings made for visitors
+Key = tuple[str, int, int]           # (yard, slot, start) – unique per booking
+
+
+class Booking:
+    """One slot held for ``[start, end)`` (epoch seconds)."""
+
+    __slots__ = ("yard", "slot", "start", "end", "user_id", "name")
+
+    def __init__(self, yard: str, slot: int, start: int, end: int, user_id: int, name: str):
+        self.yard = yard
+        self.slot = slot
+        self.start = start
+        self.end = end
+        self.user_id = user_id
+        self.name = name
+
+    @property
+    def key(self) -> Key:
+        return self.yard, self.slot, self.start
+
+    def to_dict(self) -> dict:
+        return {"yard": self.yard, "slot": self.slot, "start": self.start, "end": self.end,
+                "user_id": self.user_id, "name": self.name}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Booking":
+        return cls(d["yard"], int(d["slot"]), int(d["start"]), int(d["end"]),
+                   int(d["user_id"]), d["name"])
+
+
+class SlotBookings:
+    """Disjoint bookings of one slot, sorted by start (and therefore by end)."""
+
+    __slots__ = ("starts", "ends", "items")
+
+    def __init__(self):
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        self.items: list[Booking] = []
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _after(self, t: int) -> int:
+        """Index of the first booking ending after *t*."""
+        return bisect.bisect_right(self.ends, t)
+
+    def overlapping(self, a: int, b: int) -> Booking | None:
+        """First booking sharing time with ``[a, b)``."""
+        i = self._after(a)
+        return self.items[i] if i < len(self.items) and self.starts[i] < b else None
+
+    def across(self, t: int) -> Booking | None:
+        """Booking that has begun before *t* and ends after it."""
+        i = self._after(t)
+        return self.items[i] if i < len(self.items) and self.starts[i] < t else None
+
+    def ending_within(self, a: int, b: int) -> Booking | None:
+        """First booking that ends strictly inside ``(a, b)``."""
+        i = self._after(a)
+        return self.items[i] if i < len(self.items) and self.ends[i] < b else None
+
+    def add(self, b: Booking):
+        i = bisect.bisect_left(self.starts, b.start)
+        self.starts.insert(i, b.start)
+        self.ends.insert(i, b.end)
+        self.items.insert(i, b)
+
+    def remove(self, start: int) -> Booking | None:
+        i = bisect.bisect_left(self.starts, start)
+        if i == len(self.starts) or self.starts[i] != start:
+            return None
+        del self.starts[i], self.ends[i]
+        return self.items.pop(i)
+
+    def prune(self, before: int) -> list[Booking]:
+        """Drop (and return) the bookings that ended by *before*."""
+        i = bisect.bisect_right(self.ends, before)
+        gone = self.items[:i]
+        del self.starts[:i], self.ends[:i], self.items[:i]
+        return gone
+
+
+class Reservations:
+    """
+    Bookings per yard and slot, plus the user → bookings index.
+    *graphs* may be updated in place (yard reload); conflicts always use
+    the current ``blocks``.
+    """
+
+    def __init__(self, graphs: dict[str, BlockingGraph]):
+        self.graphs = graphs
+        self.slots: dict[str, dict[int, SlotBookings]] = {}
+        self.by_user: dict[int, dict[Key, Booking]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(b) for b in self.by_user.values())
+
+    def __iter__(self) -> Iterator[Booking]:
+        for yard in self.slots.values():
+            for bookings in yard.values():
+                yield from bookings.items
+
+    def _of(self, yard: str, slot: int) -> SlotBookings | None:
+        return self.slots.get(yard, {}).get(slot)
+
+    # ── mutations (called by the state backends) ───────────────────────────
+    def add(self, b: Booking):
+        self.slots.setdefault(b.yard, {}).setdefault(b.slot, SlotBookings()).add(b)
+        self.by_user.setdefault(b.user_id, {})[b.key] = b
+
+    def remove(self, yard: str, slot: int, start: int) -> Booking | None:
+        bookings = self._of(yard, slot)
+        b = bookings.remove(start) if bookings is not None else None
+        if b is not None:
+            self._forget(b)
+            if not bookings:
+                del self.slots[yard][slot]
+        return b
+
+    def prune(self, before: int) -> int:
+        """Forget every booking that ended by *before*; returns how many."""
+        n = 0
+        for yard in self.slots.values():
+            for slot, bookings in list(yard.items()):
+                for b in bookings.prune(before):
+                    self._forget(b)
+                    n += 1
+                if not bookings:
+                    del yard[slot]
+        return n
+
+    def _forget(self, b: Booking):
+        mine = self.by_user.get(b.user_id)
+        if mine is not None:
+            mine.pop(b.key, None)
+            if not mine:
+                del self.by_user[b.user_id]
+
+    def clear(self):
+        self.slots.clear()
+        self.by_user.clear()
+
+    def load(self, bookings: Iterable[Booking]):
+        self.clear()
+        for b in bookings:
+            self.add(b)
+
+    # ── queries ────────────────────────────────────────────────────────────
+    def conflict(self, b: Booking) -> str | None:
+        """Why *b* can't be booked, or None if it fits."""
+        same = self._of(b.yard, b.slot)
+        other = same and same.overlapping(b.start, b.end)
+        if other:
+            return f"slot {b.slot} is already booked by {other.name}"
+        if b.user_id != VISITOR:
+            for mine in self.by_user.get(b.user_id, {}).values():
+                if mine.start < b.end and b.start < mine.end:
+                    return f"you already have slot {mine.slot} ({mine.yard}) booked then"
+        graph = self.graphs.get(b.yard)
+        if graph is None:
+            return None
+        for front in graph.blocked_by_all.get(b.slot, ()):
+            bookings = self._of(b.yard, front)
+            other = bookings and bookings.across(b.end)
+            if other:
+                return f"slot {front} in front is booked until past your end time"
+        for behind in graph.blocks_all.get(b.slot, ()):
+            bookings = self._of(b.yard, behind)
+            other = bookings and bookings.ending_within(b.start, b.end)
+            if other:
+                return f"you'd block in slot {behind}, booked until before your end time"
+        return None
+
+    def free_between(self, yard: str, slots: Iterable[int], start: int, end: int) -> list[int]:
+        """Slots of *slots* that a booking for ``[start, end)`` would fit."""
+        return [s for s in slots
+                if self.conflict(Booking(yard, s, start, end, VISITOR, "")) is None]
+
+    def booked(self, yard: str, start: int, end: int, other_than: int | None = None) -> set[int]:
+        """Slots with a booking overlapping ``[start, end)`` (not counting *other_than*'s)."""
+        out = set()
+        for slot, bookings in self.slots.get(yard, {}).items():
+            b = bookings.overlapping(start, end)
+            # the user's own booking may hide another one later in the window
+            while b is not None and b.user_id == other_than:
+                b = bookings.overlapping(b.end, end)
+            if b is not None:
+                out.add(slot)
+        return out
+
+    def current(self, user_id: int, yard: str, start: int, end: int) -> Booking | None:
+        """The user's booking in *yard* overlapping ``[start, end)``, if any."""
+        for b in self.by_user.get(user_id, {}).values():
+            if b.yard == yard and b.start < end and start < b.end:
+                return b
+        return None
+
+    def of_user(self, user_id: int) -> list[Booking]:
+        return sorted(self.by_user.get(user_id, {}).values(), key=lambda b: b.start)
@@ -0,0 +1,170 @@
+# slot_picker.py – "Park anywhere": best free slot from a priority index
+# -------------------------------------------------
+# Typing a slot number costs a round trip per taken / invalid guess.
+# The picker answers "which free slot should I take?" at once.
+# Slots outside the blocking graph are always ideal and come straight
+# off the free bitset (lowest set bit).  Graph slots sit in a lazy
+# min‑heap keyed by
+#
+#   (parked cars it would block, parked cars blocking it,
+#    free slots in front that could block it later,
+#    free slots behind it that it could block later, slot)
+#
+# and only the slots around a park / leave are re‑scored, so picking
+# never walks ``blocks``.  Charging slots form a separate pool: users
+# who ask for charging get one first, everyone else only once no
+# regular slot is free (and each falls back to the other pool).
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import heapq
+
+from blocking import BlockingGraph
+from occupancy import Occupancy, Occupant, YardOccupancy
+
+Score = tuple[int, int, int, int]
+_IDEAL: Score = (0, 0, 0, 0)
+
+
+class YardPicker:
+    """Priority index over the free slots of one yard."""
+
+    def __init__(self, yard: YardOccupancy, graph: BlockingGraph):
+        self.yard = yard
+        self.graph = graph
+        node_mask = 0
+        for s in graph.nodes:
+            node_mask |= 1 << yard.pos(s)
+        everything = (1 << len(yard)) - 1
+        # slots outside the graph, by pool (True = charging)
+        self.plain = {True: yard.charging_mask & ~node_mask,
+                      False: everything & ~yard.charging_mask & ~node_mask}
+        self.behind = dict.fromkeys(graph.nodes, 0)    # parked cars a slot would block
+        self.front = dict.fromkeys(graph.nodes, 0)     # parked cars that block a slot
+        for slot in yard.taken:
+            self._count(slot, +1)
+        self.score: dict[int, Score] = {}              # free graph slot -> score
+        self.heaps: dict[bool, list[tuple[Score, int]]] = {True: [], False: []}
+        for s in graph.nodes:
+            if yard.is_free(s):
+                self._push(s)
+
+    # ── maintenance ────────────────────────────────────────────────────────
+    def _count(self, slot: int, delta: int) -> list[int]:
+        touched = []
+        for t in self.graph.blocked_by_all.get(slot, ()):
+            self.behind[t] += delta
+            touched.append(t)
+        for t in self.graph.blocks_all.get(slot, ()):
+            self.front[t] += delta
+            touched.append(t)
+        return touched
+
+    def _push(self, slot: int):
+        behind, front = self.behind[slot], self.front[slot]
+        score = (behind, front,
+                 len(self.graph.blocked_by_all.get(slot, ())) - front,
+                 len(self.graph.blocks_all.get(slot, ())) - behind)
+        self.score[slot] = score
+        heap = self.heaps[self.yard.is_charging(slot)]
+        heapq.heappush(heap, (score, slot))
+        if len(heap) > 2 * len(self.behind) + 16:      # too many stale entries
+            self._compact(heap)
+
+    def _compact(self, heap: list[tuple[Score, int]]):
+        live = [(sc, s) for sc, s in heap if self.score.get(s) == sc]
+        heapq.heapify(live)
+        heap[:] = live
+
+    def park(self, slot: int):
+        if slot not in self.behind:
+            return
+        self.score.pop(slot, None)
+        for t in self._count(slot, +1):
+            if t in self.score:
+                self._push(t)
+
+    def leave(self, slot: int):
+        if slot not in self.behind:
+            return
+        for t in self._count(slot, -1):
+            if t in self.score:
+                self._push(t)
+        self._push(slot)
+
+    # ── query ──────────────────────────────────────────────────────────────
+    def _top(self, charging: bool, skip: set[int] = frozenset()) -> tuple[Score, int] | None:
+        heap = self.heaps[charging]
+        aside = []                                     # live but skipped (held) entries
+        while heap:
+            if self.score.get(heap[0][1]) != heap[0][0]:
+                heapq.heappop(heap)
+            elif heap[0][1] in skip:
+                aside.append(heapq.heappop(heap))
+            else:
+                break
+        top = heap[0] if heap else None
+        for entry in aside:
+            heapq.heappush(heap, entry)
+        return top
+
+    def best(self, charging: bool = False, skip: set[int] = frozenset()) -> int | None:
+        """
+        Best free slot not in *skip*, or None if the yard is full.
+        Charging users get a charging slot when one is free and fall back
+        to regular ones; everyone else gets a regular slot and falls back
+        to charging ones (a yard may have nothing else).
+        """
+        skip_mask = 0
+        for s in skip:
+            skip_mask |= 1 << self.yard.pos(s)
+        for pool in ((True, False) if charging else (False, True)):
+            candidates = []
+            mask = self.yard.free_mask & self.plain[pool] & ~skip_mask
+            if mask:
+                candidates.append((_IDEAL, self.yard.ids[(mask & -mask).bit_length() - 1]))
+            top = self._top(pool, skip)
+            if top is not None:
+                candidates.append(top)
+            if candidates:
+                return min(candidates)[1]
+        return None
+
+
+class SlotPicker:
+    """One :class:`YardPicker` per yard, kept in sync with *occupancy*."""
+
+    def __init__(self, graphs: dict[str, BlockingGraph], occupancy: Occupancy):
+        self.graphs = graphs
+        self.occupancy = occupancy
+        self.yards: dict[str, YardPicker] = {}
+        self.rebuild()
+        occupancy.listeners.append(self._on_change)
+
+    def rebuild(self):
+        """Re‑index every yard (startup, reset, yard config reload)."""
+        self.yards = {name: YardPicker(y, self.graphs[name])
+                      for name, y in self.occupancy.yards.items()}
+
+    def _on_change(self, event: str, yard: str, slot: int | None, _occ: Occupant | None):
+        if event == "park":
+            self.yards[yard].park(slot)
+        elif event == "leave":
+            self.yards[yard].leave(slot)
+        else:
+            self.yards[yard] = YardPicker(self.occupancy.yards[yard], self.graphs[yard])
+
+    def best(self, yard: str, charging: bool = False, skip: set[int] = frozenset()) -> int | None:
+        return self.yards[yard].best(charging, skip)
+
+    def blocked_in(self, yard: str, slot: int) -> bool:
+        """Would a car parked in *slot* be blocked by one already parked?"""
+        return self.yards[yard].front.get(slot, 0) > 0
+
+    def has_charging(self, yard: str) -> bool:
+        return self.occupancy.yards[yard].charging_mask != 0
+
+    def has_regular(self, yard: str) -> bool:
+        y = self.occupancy.yards[yard]
+        return y.charging_mask.bit_count() < len(y)
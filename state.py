@@ -0,0 +1,574 @@
+# state.py – Pluggable state backends for the Parking‑Yard Bot
+# -------------------------------------------------
+# Handlers READ from in‑process mirrors (the Occupancy engine, the
+# USER_PHONES / ALLOWED_PHONES / USER_YARD collections and the
+# Reservations index) and WRITE only through a StateBackend, which owns
+# persistence:
+#
+# * MemoryBackend – the default; mirrors are the truth, every mutation
+#   goes to the write‑ahead journal (single process).
+# * SQLiteBackend – a WAL‑mode SQLite file is the truth; slot claims are
+#   transactional so several uvicorn workers can share one yard state.
+#   Writes run on a writer thread, off the event loop.  Each process
+#   refreshes its mirrors when another process commits (detected
+#   cheaply via ``PRAGMA data_version``), re‑reading only the tables
+#   whose trigger‑kept version moved.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable
+
+from journal import Journal
+from occupancy import Occupancy, Occupant
+from reservations import Booking, Reservations
+
+
+class StateBackend(ABC):
+    """Mutations of the shared bot state; reads go to the mirrors."""
+
+    def __init__(self, occupancy: Occupancy, phones: dict[int, str],
+                 allowed: set[str], user_yard: dict[int, str], reservations: Reservations):
+        self.occupancy = occupancy
+        self.phones = phones
+        self.allowed = allowed
+        self.user_yard = user_yard
+        self.reservations = reservations
+
+    # ── lifecycle ──────────────────────────────────────────────────────────
+    @abstractmethod
+    def load(self, seed: Callable[[], dict]):
+        """Fill the mirrors; *seed()* supplies initial data for a brand‑new store."""
+
+    def refresh(self):
+        """Pull changes made by other processes into the mirrors (cheap when none)."""
+
+    async def close(self):
+        """Flush and release resources."""
+
+    async def claim_reminder(self, yard: str, slot: int, user_id: int) -> bool:
+        """
+        Claim the one reminder of the user's current park in *slot*: True
+        for exactly one caller (one process), False if already sent.
+        Every worker arms the timer; only the claimant sends it.
+        """
+        return True                   # single process: the timer fires once
+
+    async def see_update(self, update_id: int, window: int) -> bool:
+        """
+        Record a webhook update as processed; False if any worker already
+        processed it (the last *window* update_ids are remembered).  A
+        single process has ingest.SeenUpdates in front of it already.
+        """
+        return True
+
+    # ── slots ──────────────────────────────────────────────────────────────
+    @abstractmethod
+    async def claim(self, yard: str, slot: int, occ: Occupant) -> bool:
+        """Atomically park *occ* in *slot*; False if taken / already parked."""
+
+    @abstractmethod
+    async def release(self, user_id: int,
+                      expect: tuple[str, int] | None = None) -> tuple[str, int, Occupant] | None:
+        """
+        Atomically free the user's slot; returns ``(yard, slot, occupant)``
+        or None.  With *expect* the slot is only freed if the user still
+        holds exactly that ``(yard, slot)`` (compare‑and‑set), so a stale
+        timer or a late duplicate can't release a newer park.
+        """
+
+    @abstractmethod
+    async def reset(self) -> list[tuple[str, int, Occupant]]:
+        """
+        Empty every yard (bookings are kept); returns the ``(yard, slot,
+        occupant)`` stays this call ended – none for a worker whose reset
+        came second.
+        """
+
+    # ── bookings ───────────────────────────────────────────────────────────
+    @abstractmethod
+    async def book(self, b: Booking) -> str | None:
+        """
+        Atomically add *b* unless it conflicts with another booking
+        (see :meth:`Reservations.conflict`); returns the conflict, or None
+        once booked.
+        """
+
+    @abstractmethod
+    async def unbook(self, yard: str, slot: int, start: int) -> Booking | None:
+        """Cancel a booking; returns it, or None if there was none."""
+
+    @abstractmethod
+    async def prune_bookings(self, before: int):
+        """Drop bookings that ended by *before*."""
+
+    # ── users ──────────────────────────────────────────────────────────────
+    @abstractmethod
+    async def set_phone(self, user_id: int, phone: str): ...
+
+    @abstractmethod
+    async def clear_phones(self): ...
+
+    @abstractmethod
+    async def allow(self, phone: str): ...
+
+    @abstractmethod
+    async def allow_many(self, phones: Iterable[str]):
+        """Add many numbers in a single write (bulk import)."""
+
+    @abstractmethod
+    async def disallow(self, phone: str): ...
+
+    @abstractmethod
+    async def set_yard(self, user_id: int, yard: str): ...
+
+    @abstractmethod
+    async def clear_yards(self): ...
+
+    # ── shared helpers ─────────────────────────────────────────────────────
+    def _restore(self, state: dict):
+        """Replace the mirrors with a JSON‑shaped state dict."""
+        self.phones.clear()
+        self.phones.update({int(k): v for k, v in state.get("phones", {}).items()})
+        self.allowed.clear()
+        self.allowed.update(state.get("allow", []))
+        self.occupancy.clear()
+        for name, slots in state.get("slots", {}).items():
+            if name in self.occupancy.yards:
+                for s, d in slots.items():
+                    self.occupancy.park(name, int(s), Occupant.from_dict(d))
+        self.reservations.load(map(Booking.from_dict, state.get("bookings", [])))
+
+
+# ── In‑memory + journal ──────────────────────────────────────────────────────
+
+
+class MemoryBackend(StateBackend):
+    """Single‑process state persisted through :class:`journal.Journal`."""
+
+    def __init__(self, *mirrors, data_dir: str | Path, snapshot_every: int = 1000):
+        super().__init__(*mirrors)
+        self.journal = Journal(data_dir, self._state, snapshot_every=snapshot_every)
+
+    def _state(self) -> dict:
+        """JSON‑ready copy of everything the journal persists."""
+        return {
+            "phones": {str(uid): p for uid, p in self.phones.items()},
+            "allow": sorted(self.allowed),
+            "slots": {name: {str(s): occ.to_dict() for s, occ in self.occupancy.taken(name).items()}
+                      for name in self.occupancy.yards},
+            "bookings": [b.to_dict() for b in self.reservations],
+        }
+
+    def _replay(self, rec: dict):
+        """Re‑apply one journal record (idempotent)."""
+        op = rec["op"]
+        occ = self.occupancy
+        if op == "park":
+            if rec["yard"] in occ.yards:
+                occupant = Occupant.from_dict(rec["info"])
+                occ.leave(occupant.user_id)
+                occ.park(rec["yard"], rec["slot"], occupant)
+        elif op == "leave":
+            occ.leave(rec["user_id"])
+        elif op == "reset":
+            occ.clear()
+        elif op == "phone":
+            self.phones[rec["user_id"]] = rec["phone"]
+        elif op == "phones_clear":
+            self.phones.clear()
+        elif op == "allow_add":
+            self.allowed.add(rec["phone"])
+        elif op == "allow_add_many":
+            self.allowed.update(rec["phones"])
+        elif op == "allow_del":
+            self.allowed.discard(rec["phone"])
+        elif op == "book":
+            b = Booking.from_dict(rec["info"])
+            self.reservations.remove(*b.key)
+            self.reservations.add(b)
+        elif op == "unbook":
+            self.reservations.remove(rec["yard"], rec["slot"], rec["start"])
+        elif op == "bookings_prune":
+            self.reservations.prune(rec["before"])
+
+    def load(self, seed: Callable[[], dict]):
+        snap, tail = self.journal.load()
+        self._restore(seed() if snap is None else snap)
+        replayed = 0
+        for rec in tail:
+            self._replay(rec)
+            replayed += 1
+        self.journal.open()
+        if snap is None:
+            self.journal.snapshot()
+        print(f"✅ journal: {replayed} records replayed")
+
+    async def close(self):
+        await asyncio.wrap_future(self.journal.snapshot())
+        self.journal.close()
+
+    async def claim(self, yard, slot, occ):
+        # test‑and‑set happens before the first await, so it is atomic on the loop
+        if not self.occupancy.park(yard, slot, occ):
+            return False
+        await self.journal.commit("park", yard=yard, slot=slot, info=occ.to_dict())
+        return True
+
+    async def release(self, user_id, expect=None):
+        if expect is not None and self.occupancy.where(user_id) != expect:
+            return None
+        left = self.occupancy.leave(user_id)
+        if left is not None:
+            await self.journal.commit("leave", user_id=user_id)
+        return left
+
+    async def reset(self):
+        ended = [(name, slot, occ) for name in self.occupancy.yards
+                 for slot, occ in self.occupancy.taken(name).items()]
+        self.occupancy.clear()
+        await self.journal.commit("reset")
+        return ended
+
+    async def book(self, b):
+        # checked and added before the first await, so atomic on the loop
+        problem = self.reservations.conflict(b)
+        if problem is None:
+            self.reservations.add(b)
+            await self.journal.commit("book", info=b.to_dict())
+        return problem
+
+    async def unbook(self, yard, slot, start):
+        b = self.reservations.remove(yard, slot, start)
+        if b is not None:
+            await self.journal.commit("unbook", yard=yard, slot=slot, start=start)
+        return b
+
+    async def prune_bookings(self, before):
+        if self.reservations.prune(before):
+            await self.journal.commit("bookings_prune", before=before)
+
+    async def set_phone(self, user_id, phone):
+        self.phones[user_id] = phone
+        await self.journal.commit("phone", user_id=user_id, phone=phone)
+
+    async def clear_phones(self):
+        self.phones.clear()
+        await self.journal.commit("phones_clear")
+
+    async def allow(self, phone):
+        self.allowed.add(phone)
+        await self.journal.commit("allow_add", phone=phone)
+
+    async def allow_many(self, phones):
+        phones = sorted(set(phones) - self.allowed)
+        if phones:
+            self.allowed.update(phones)
+            await self.journal.commit("allow_add_many", phones=phones)
+
+    async def disallow(self, phone):
+        self.allowed.discard(phone)
+        await self.journal.commit("allow_del", phone=phone)
+
+    async def set_yard(self, user_id, yard):
+        self.user_yard[user_id] = yard               # persisted write‑behind (persistence.py)
+
+    async def clear_yards(self):
+        self.user_yard.clear()
+
+
+# ── SQLite (WAL) ─────────────────────────────────────────────────────────────
+
+_TABLES = ("slots", "phones", "allowed", "user_yard", "bookings")
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+    yard    TEXT    NOT NULL,
+    slot    INTEGER NOT NULL,
+    user_id INTEGER NOT NULL UNIQUE,      -- one slot per user, enforced by the DB
+    info    TEXT    NOT NULL,
+    reminded INTEGER NOT NULL DEFAULT 0,  -- charging reminder sent (by any worker)
+    PRIMARY KEY (yard, slot)
+);
+CREATE TABLE IF NOT EXISTS phones    (user_id INTEGER PRIMARY KEY, phone TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS allowed   (phone TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS user_yard (user_id INTEGER PRIMARY KEY, yard TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS bookings (
+    yard    TEXT    NOT NULL,
+    slot    INTEGER NOT NULL,
+    start   INTEGER NOT NULL,
+    "end"   INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    name    TEXT    NOT NULL,
+    PRIMARY KEY (yard, slot, start)
+);
+-- webhook update_ids processed by any worker (bounded window, see see_update)
+CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY);
+-- bumped by triggers on every write, so a refresh re‑reads only what changed
+CREATE TABLE IF NOT EXISTS versions  (tbl TEXT PRIMARY KEY, v INTEGER NOT NULL DEFAULT 0);
+""" + "".join(
+    f"INSERT OR IGNORE INTO versions (tbl) VALUES ('{t}');\n"
+    + "".join(f"CREATE TRIGGER IF NOT EXISTS {t}_{op.lower()} AFTER {op} ON {t} "
+              f"BEGIN UPDATE versions SET v = v + 1 WHERE tbl = '{t}'; END;\n"
+              for op in ("INSERT", "UPDATE", "DELETE"))
+    for t in _TABLES)
+
+
+class SQLiteBackend(StateBackend):
+    """
+    Multi‑process state in one SQLite file (WAL mode).
+    Every write is its own short transaction; uniqueness constraints make
+    a slot claim an atomic compare‑and‑set across processes.  Writes run
+    on one writer thread (its own connection), so waiting for another
+    worker's write lock never stalls the event loop; the loop thread
+    only reads, which WAL never blocks.
+    """
+
+    def __init__(self, *mirrors, path: str | Path):
+        super().__init__(*mirrors)
+        self.path = Path(path)
+        self.db: sqlite3.Connection | None = None       # reads, loop thread
+        self._wdb: sqlite3.Connection | None = None     # writes, writer thread
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._data_version = -1
+        self._versions: dict[str, int] = {}             # table -> version the mirror has
+
+    def _connect(self, timeout: float) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, isolation_level=None, timeout=timeout,
+                               check_same_thread=False)
+
+    def load(self, seed: Callable[[], dict]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # loaded off the event loop at startup; then writes happen on the
+        # writer thread and reads on the loop thread
+        self._wdb = self._connect(timeout=5)
+        self._wdb.execute("PRAGMA journal_mode=WAL")
+        self._wdb.execute("PRAGMA synchronous=NORMAL")
+        self._wdb.executescript(_SCHEMA)
+        if "reminded" not in {c[1] for c in self._wdb.execute("PRAGMA table_info(slots)")}:
+            self._wdb.execute("ALTER TABLE slots ADD COLUMN reminded INTEGER NOT NULL DEFAULT 0")
+        with _Immediate(self._wdb) as db:
+            empty = not any(db.execute(
+                f"SELECT 1 FROM {t} LIMIT 1").fetchone()
+                for t in ("slots", "phones", "allowed"))
+            if empty:
+                state = seed()
+                db.executemany("INSERT OR IGNORE INTO phones VALUES (?, ?)",
+                               [(int(k), v) for k, v in state.get("phones", {}).items()])
+                db.executemany("INSERT OR IGNORE INTO allowed VALUES (?)",
+                               [(p,) for p in state.get("allow", [])])
+        self.db = self._connect(timeout=1)
+        self._versions.clear()
+        self._data_version = -1
+        self.refresh()
+        print(f"✅ sqlite state: {self.path}")
+
+    async def close(self):
+        await asyncio.to_thread(self._writer.shutdown)
+        for conn in (self.db, self._wdb):
+            if conn is not None:
+                conn.close()
+        self.db = self._wdb = None
+
+    # ── syncing the mirrors ────────────────────────────────────────────────
+    def refresh(self):
+        version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        for tbl, v in self.db.execute("SELECT tbl, v FROM versions").fetchall():
+            if self._versions.get(tbl) != v:
+                self._versions[tbl] = v             # a commit meanwhile just means another pull
+                getattr(self, f"_pull_{tbl}")()
+
+    def _pull_slots(self):
+        rows = {uid: (yard, slot, info) for yard, slot, uid, info in
+                self.db.execute("SELECT yard, slot, user_id, info FROM slots")}
+        occ = self.occupancy
+        for uid, (yard, slot) in list(occ.by_user.items()):
+            row = rows.get(uid)
+            if row is None or row[:2] != (yard, slot):
+                occ.leave(uid)
+        for uid, (yard, slot, info) in rows.items():
+            if uid not in occ.by_user and yard in occ.yards:
+                occ.park(yard, slot, Occupant.from_dict(json.loads(info)))
+
+    def _pull_phones(self):
+        self.phones.clear()
+        self.phones.update(self.db.execute("SELECT user_id, phone FROM phones"))
+
+    def _pull_allowed(self):
+        self.allowed.clear()
+        self.allowed.update(p for (p,) in self.db.execute("SELECT phone FROM allowed"))
+
+    def _pull_user_yard(self):
+        self.user_yard.clear()
+        self.user_yard.update(self.db.execute("SELECT user_id, yard FROM user_yard"))
+
+    def _pull_bookings(self):
+        self.reservations.load(Booking(*row) for row in self.db.execute(
+            'SELECT yard, slot, start, "end", user_id, name FROM bookings'))
+
+    # ── the writer thread ──────────────────────────────────────────────────
+    def _in_tx(self, fn: Callable[[sqlite3.Connection], object]):
+        with _Immediate(self._wdb) as db:
+            before = dict(db.execute("SELECT tbl, v FROM versions"))
+            result = fn(db)
+            after = dict(db.execute("SELECT tbl, v FROM versions"))
+        return result, before, after
+
+    async def _write(self, fn: Callable[[sqlite3.Connection], object]):
+        """Run ``fn(db)`` in its own transaction on the writer thread; returns its result."""
+        result, before, after = await asyncio.get_running_loop().run_in_executor(
+            self._writer, self._in_tx, fn)
+        # the caller patches the mirror with its own change right away; tables
+        # someone else changed first are left behind, for refresh() to pull
+        for tbl, v in after.items():
+            if self._versions.get(tbl) == before.get(tbl):
+                self._versions[tbl] = v
+        return result
+
+    # ── writes ─────────────────────────────────────────────────────────────
+    async def claim(self, yard, slot, occ):
+        self.refresh()
+        try:
+            await self._write(lambda db: db.execute(
+                "INSERT INTO slots (yard, slot, user_id, info) VALUES (?, ?, ?, ?)",
+                (yard, slot, occ.user_id, json.dumps(occ.to_dict()))))
+        except sqlite3.IntegrityError:
+            self.refresh()                  # someone else won – resync
+            return False
+        if (not self.occupancy.park(yard, slot, occ)
+                and self.occupancy.where(occ.user_id) != (yard, slot)):
+            self._pull_slots()              # mirror was stale
+        return True
+
+    async def release(self, user_id, expect=None):
+        self.refresh()
+        sql, args = "DELETE FROM slots WHERE user_id = ?", (user_id,)
+        if expect is not None:
+            sql, args = sql + " AND yard = ? AND slot = ?", args + tuple(expect)
+        row = await self._write(
+            lambda db: db.execute(sql + " RETURNING yard, slot, info", args).fetchone())
+        if row is None:
+            self.refresh()                  # stale mirror?
+            return None
+        left = self.occupancy.leave(user_id)
+        return left or (row[0], row[1], Occupant.from_dict(json.loads(row[2])))
+
+    async def claim_reminder(self, yard, slot, user_id):
+        row = await self._write(lambda db: db.execute(
+            "UPDATE slots SET reminded = 1 WHERE yard = ? AND slot = ? AND user_id = ? "
+            "AND reminded = 0 RETURNING 1", (yard, slot, user_id)).fetchone())
+        return row is not None
+
+    async def see_update(self, update_id, window):
+        def add(db):
+            if not db.execute("INSERT OR IGNORE INTO seen_updates VALUES (?)", (update_id,)).rowcount:
+                return False
+            # update_ids increase, so the window is the newest *window* of them
+            db.execute("DELETE FROM seen_updates WHERE update_id <= ?", (update_id - window,))
+            return True
+
+        return await self._write(add)
+
+    async def reset(self):
+        rows = await self._write(lambda db: db.execute(
+            "DELETE FROM slots RETURNING yard, slot, info").fetchall())
+        self.occupancy.clear()
+        return [(yard, slot, Occupant.from_dict(json.loads(info))) for yard, slot, info in rows]
+
+    async def book(self, b):
+        graphs = self.reservations.graphs
+
+        def add(db):
+            # re‑read under the write lock: no other worker can book in between
+            current = Reservations(graphs)
+            current.load(Booking(*row) for row in db.execute(
+                'SELECT yard, slot, start, "end", user_id, name FROM bookings '
+                'WHERE yard = ? OR user_id = ?', (b.yard, b.user_id)))
+            problem = current.conflict(b)
+            if problem is None:
+                db.execute("INSERT INTO bookings VALUES (?, ?, ?, ?, ?, ?)",
+                           (b.yard, b.slot, b.start, b.end, b.user_id, b.name))
+            return problem
+
+        problem = await self._write(add)
+        if problem is None:
+            self.reservations.remove(*b.key)
+            self.reservations.add(b)
+        else:
+            self.refresh()
+        return problem
+
+    async def unbook(self, yard, slot, start):
+        row = await self._write(lambda db: db.execute(
+            "DELETE FROM bookings WHERE yard = ? AND slot = ? AND start = ? RETURNING 1",
+            (yard, slot, start)).fetchone())
+        return self.reservations.remove(yard, slot, start) if row else None
+
+    async def prune_bookings(self, before):
+        await self._write(lambda db: db.execute('DELETE FROM bookings WHERE "end" <= ?', (before,)))
+        self.reservations.prune(before)
+
+    async def set_phone(self, user_id, phone):
+        await self._write(lambda db: db.execute(
+            "INSERT OR REPLACE INTO phones VALUES (?, ?)", (user_id, phone)))
+        self.phones[user_id] = phone
+
+    async def clear_phones(self):
+        await self._write(lambda db: db.execute("DELETE FROM phones"))
+        self.phones.clear()
+
+    async def allow(self, phone):
+        await self._write(lambda db: db.execute("INSERT OR IGNORE INTO allowed VALUES (?)", (phone,)))
+        self.allowed.add(phone)
+
+    async def allow_many(self, phones):
+        phones = set(phones)
+        await self._write(lambda db: db.executemany(
+            "INSERT OR IGNORE INTO allowed VALUES (?)", [(p,) for p in phones]))
+        self.allowed.update(phones)
+
+    async def disallow(self, phone):
+        await self._write(lambda db: db.execute("DELETE FROM allowed WHERE phone = ?", (phone,)))
+        self.allowed.discard(phone)
+
+    async def set_yard(self, user_id, yard):
+        await self._write(lambda db: db.execute(
+            "INSERT OR REPLACE INTO user_yard VALUES (?, ?)", (user_id, yard)))
+        self.user_yard[user_id] = yard
+
+    async def clear_yards(self):
+        await self._write(lambda db: db.execute("DELETE FROM user_yard"))
+        self.user_yard.clear()
+
+
+class _Immediate:
+    """``BEGIN IMMEDIATE`` … ``COMMIT`` / ``ROLLBACK`` as a context manager."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, *_):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def make_backend(kind: str, *mirrors, data_dir: str | Path,
+                 snapshot_every: int = 1000, db_path: str | Path | None = None) -> StateBackend:
+    """Build the backend named by *kind* (``memory`` or ``sqlite``)."""
+    if kind == "memory":
+        return MemoryBackend(*mirrors, data_dir=data_dir, snapshot_every=snapshot_every)
+    if kind == "sqlite":
+        return SQLiteBackend(*mirrors, path=db_path or Path(data_dir) / "state.db")
+    raise ValueError(f"unknown STATE_BACKEND {kind!r} (expected 'memory' or 'sqlite')")
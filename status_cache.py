@@ -0,0 +1,135 @@
+# status_cache.py – Incrementally maintained /status messages
+# -------------------------------------------------
+# /status is by far the most frequent command.  Instead of sorting
+# the yard, diffing free vs. taken and re‑parsing timestamps on every
+# call, each yard keeps a pre‑rendered view that park / leave patch in
+# place (one line each) and a version counter.  A repeat status
+# between mutations returns the cached string; charging durations are
+# rendered from stored epoch seconds and the cache expires exactly
+# when the next displayed minute rolls over.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import bisect
+import time
+
+from occupancy import Occupancy, Occupant, YardOccupancy
+
+# above this many characters the free list is shown as ranges ("1-40, 42")
+FREE_TXT_LIMIT = 1000
+
+
+def _ranges(slots: list[int]) -> str:
+    out, i = [], 0
+    while i < len(slots):
+        j = i
+        while j + 1 < len(slots) and slots[j + 1] == slots[j] + 1:
+            j += 1
+        out.append(str(slots[i]) if i == j else f"{slots[i]}-{slots[j]}")
+        i = j + 1
+    return ", ".join(out)
+
+
+class YardStatus:
+    """Pre‑rendered pieces of one yard's status message."""
+
+    def __init__(self, yard: YardOccupancy):
+        self.yard = yard
+        self.name = yard.name
+        self.version = 0
+        self.taken: list[int] = []
+        self.lines: dict[int, str] = {}          # slot -> "⚡ 3 - Name" (no duration)
+        self.since: dict[int, int] = {}          # charging slot -> epoch parked
+        self._free_txt: tuple[int, str] = (-1, "")
+        self._cached: tuple[int, float, str] = (-1, 0.0, "")  # version, valid_until, text
+        for slot, occ in yard.taken.items():
+            self.park(slot, occ)
+
+    # ── patches ────────────────────────────────────────────────────────────
+    def park(self, slot: int, occ: Occupant):
+        bisect.insort(self.taken, slot)
+        charging = self.yard.is_charging(slot)
+        prefix = "⚡ " if charging else ""
+        self.lines[slot] = f"{prefix}{slot} - {occ.name}"
+        if charging:
+            self.since[slot] = occ.since
+        self.version += 1
+
+    def leave(self, slot: int):
+        i = bisect.bisect_left(self.taken, slot)
+        if i < len(self.taken) and self.taken[i] == slot:
+            del self.taken[i]
+        self.lines.pop(slot, None)
+        self.since.pop(slot, None)
+        self.version += 1
+
+    def clear(self):
+        self.taken.clear()
+        self.lines.clear()
+        self.since.clear()
+        self.version += 1
+
+    # ── rendering ──────────────────────────────────────────────────────────
+    def free_txt(self) -> str:
+        """Free slot list for the current version (one bit scan per version)."""
+        if self._free_txt[0] != self.version:
+            free = self.yard.free_slots()
+            txt = ", ".join(map(str, free))
+            if len(txt) > FREE_TXT_LIMIT:
+                txt = _ranges(free)
+            self._free_txt = (self.version, txt or "None")
+        return self._free_txt[1]
+
+    def render(self, now: float | None = None) -> str:
+        now = time.time() if now is None else now
+        version, valid_until, text = self._cached
+        if version == self.version and now < valid_until:
+            return text
+
+        valid_until = float("inf")
+        lines: list[str] = []
+        for s in self.taken:
+            since = self.since.get(s)
+            if since is None:
+                lines.append(self.lines[s])
+                continue
+            minutes = int((now - since) // 60)
+            valid_until = min(valid_until, since + (minutes + 1) * 60)
+            lines.append(f"{self.lines[s]} ({minutes//60}h {minutes % 60}m)")
+
+        taken_txt = "\n".join(lines) or "None"
+        text = (f"📋 *{self.name} Parking Status:*\n\n"
+                f"🟢 Available slots: {self.free_txt()}\n\n"
+                f"🔴 Taken slots:\n{taken_txt}")
+        self._cached = (self.version, valid_until, text)
+        return text
+
+
+class StatusCache:
+    """One :class:`YardStatus` per yard, kept in sync with *occupancy*."""
+
+    def __init__(self, occupancy: Occupancy):
+        self.occupancy = occupancy
+        self.yards: dict[str, YardStatus] = {}
+        self.rebuild()
+        occupancy.listeners.append(self._on_change)
+
+    def rebuild(self):
+        """Recreate every view (after the yard config changed)."""
+        self.yards = {name: YardStatus(y) for name, y in self.occupancy.yards.items()}
+
+    def _on_change(self, event: str, yard: str, slot: int | None, occ: Occupant | None):
+        view = self.yards[yard]
+        if event == "park":
+            view.park(slot, occ)
+        elif event == "leave":
+            view.leave(slot)
+        else:
+            view.clear()
+
+    def render(self, yard: str) -> str:
+        return self.yards[yard].render()
+
+    def version(self, yard: str) -> int:
+        return self.yards[yard].version
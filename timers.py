@@ -0,0 +1,124 @@
+# timers.py – Cancellable, restart‑safe parking timers
+# -------------------------------------------------
+# Each parked car may carry two timers, driven by its yard's policy:
+# * reminder – charging slots only, "please free it if you're done"
+# * expire   – auto‑release a forgotten park after N minutes
+# Timers are keyed by (yard, slot, user) so leave cancels them in O(1).
+# They subscribe to the occupancy engine, so every park / leave path
+# (handlers, journal replay, other workers) arms and cancels them, and
+# since deadlines derive from the persisted ``since`` epoch of each
+# occupant, re‑arming after a restart is just replaying occupancy.
+# With several workers every one of them arms the timers; the callbacks
+# make the firing exactly‑once (a compare‑and‑set release, a claimed
+# reminder – see StateBackend.claim_reminder).
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import time
+from typing import Awaitable, Callable
+
+from telegram.ext import CallbackContext, Job, JobQueue
+
+from occupancy import Occupancy, Occupant
+
+Key = tuple[str, int, int]                  # (yard, slot, user_id)
+Handler = Callable[[str, int, int], Awaitable[None]]
+
+# overdue reminders older than this at re‑arm time were most likely sent
+# before the restart – skip them instead of nagging twice
+REMINDER_GRACE = 10 * 60
+
+
+class Timers:
+    """
+    Per‑(yard, slot, user) reminder / expiry jobs on a PTB JobQueue.
+
+    *policies* maps yard → ``{"reminder_after_min": int | None,
+    "expire_after_min": int | None}``; *on_reminder* and *on_expire* are
+    awaited as ``fn(yard, slot, user_id)`` when a timer fires.
+    """
+
+    def __init__(self, job_queue: JobQueue, policies: dict[str, dict],
+                 on_reminder: Handler, on_expire: Handler):
+        self.job_queue = job_queue
+        self.policies = policies
+        self.handlers = {"reminder": on_reminder, "expire": on_expire}
+        self._jobs: dict[Key, dict[str, Job]] = {}
+        self._by_yard: dict[str, set[Key]] = {}
+        self.occupancy: Occupancy | None = None
+
+    def __len__(self) -> int:
+        return sum(len(jobs) for jobs in self._jobs.values())
+
+    def counts(self) -> dict[str, int]:
+        """Pending jobs per kind (``reminder`` / ``expire``)."""
+        out = dict.fromkeys(self.handlers, 0)
+        for jobs in self._jobs.values():
+            for kind in jobs:
+                out[kind] += 1
+        return out
+
+    # ── arming / cancelling ────────────────────────────────────────────────
+    def arm(self, yard: str, slot: int, user_id: int, since: float):
+        """Schedule every timer the yard's policy asks for, relative to *since*."""
+        policy = self.policies.get(yard, {})
+        key = (yard, slot, user_id)
+        now = time.time()
+        due = {}
+        remind = policy.get("reminder_after_min")
+        if remind and self.occupancy and self.occupancy.is_charging(yard, slot):
+            at = since + remind * 60
+            if at > now - REMINDER_GRACE:
+                due["reminder"] = at
+        expire = policy.get("expire_after_min")
+        if expire:
+            due["expire"] = since + expire * 60
+        if not due:
+            return
+        self.cancel(yard, slot, user_id)
+        self._jobs[key] = {
+            kind: self.job_queue.run_once(self._fire, when=max(0.0, at - now),
+                                          data=(key, kind), name=f"{kind}:{yard}:{slot}:{user_id}")
+            for kind, at in due.items()
+        }
+        self._by_yard.setdefault(yard, set()).add(key)
+
+    def cancel(self, yard: str, slot: int, user_id: int):
+        key = (yard, slot, user_id)
+        for job in self._jobs.pop(key, {}).values():
+            job.schedule_removal()
+        keys = self._by_yard.get(yard)
+        if keys:
+            keys.discard(key)
+
+    def cancel_yard(self, yard: str):
+        for key in list(self._by_yard.get(yard, ())):
+            self.cancel(*key)
+
+    async def _fire(self, ctx: CallbackContext):
+        key, kind = ctx.job.data
+        jobs = self._jobs.get(key)
+        if jobs is not None:
+            jobs.pop(kind, None)
+            if not jobs:
+                del self._jobs[key]
+                self._by_yard[key[0]].discard(key)
+        await self.handlers[kind](*key)
+
+    # ── occupancy wiring ───────────────────────────────────────────────────
+    def track(self, occupancy: Occupancy):
+        """Arm timers for everyone already parked and follow future changes."""
+        self.occupancy = occupancy
+        for name in occupancy.yards:
+            for slot, occ in occupancy.taken(name).items():
+                self.arm(name, slot, occ.user_id, occ.since)
+        occupancy.listeners.append(self._on_change)
+
+    def _on_change(self, event: str, yard: str, slot: int | None, occ: Occupant | None):
+        if event == "park":
+            self.arm(yard, slot, occ.user_id, occ.since)
+        elif event == "leave":
+            self.cancel(yard, slot, occ.user_id)
+        else:
+            self.cancel_yard(yard)
@@ -0,0 +1,78 @@
+# transport.py – The process's Bot API connection pools
+# -------------------------------------------------
+# Every Bot API call goes through one of two HTTPX pools, both built
+# here from the same settings:
+#
+# * "interactive" – the Application's bot: replies, edits and callback
+#   answers made while a user waits;
+# * "background"  – a second Bot on the same token, used by the
+#   notifier and the live pickers, with its own (smaller) pool, so a
+#   burst of reminders can queue for a connection without taking one
+#   away from a reply.
+#
+# Connections are kept alive for ``keepalive`` seconds (httpx closes
+# idle ones after 5 s by default, so a quiet minute meant a new TLS
+# handshake per reply), and HTTP/2 is used when asked for and the
+# ``h2`` package is installed.  The pools share one TLS context,
+# which is the expensive part of building a client.  Calls are timed
+# per pool and method by InstrumentedRequest (see metrics.py).
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import importlib.util
+import ssl
+
+import httpx
+
+from metrics import InstrumentedRequest
+
+_SSL: dict[bool, ssl.SSLContext] = {}      # http2 → context (ALPN differs)
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class PooledRequest(InstrumentedRequest):
+    """InstrumentedRequest with a tunable keep‑alive and the shared TLS context."""
+
+    def __init__(self, pool: str, size: int, keepalive: float, http2: bool = False,
+                 timeout: float = 10.0, connect_timeout: float = 5.0, pool_timeout: float = 5.0):
+        self.size = size
+        self.keepalive = keepalive
+        self.http2 = http2
+        super().__init__(pool=pool, connection_pool_size=size,
+                         read_timeout=timeout, write_timeout=timeout,
+                         connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+                         http_version="2" if http2 else "1.1")
+
+    def _build_client(self) -> httpx.AsyncClient:
+        self._client_kwargs["limits"] = httpx.Limits(max_connections=self.size,
+                                                     max_keepalive_connections=self.size,
+                                                     keepalive_expiry=self.keepalive)
+        ctx = _SSL.get(self.http2)
+        if ctx is None:
+            ctx = _SSL[self.http2] = httpx.create_ssl_context(http2=self.http2)
+        self._client_kwargs["verify"] = ctx
+        return super()._build_client()
+
+    def connections(self) -> tuple[int, int]:
+        """(open, idle) connections in the pool right now."""
+        pool = getattr(self._client._transport, "_pool", None)
+        conns = getattr(pool, "connections", ())
+        return len(conns), sum(1 for c in conns if c.is_idle())
+
+
+def pools(interactive: int, background: int, keepalive: float, http2: bool,
+          timeout: float, connect_timeout: float, pool_timeout: float
+          ) -> tuple[PooledRequest, PooledRequest]:
+    """The interactive and background pools; HTTP/2 falls back to 1.1 without ``h2``."""
+    if http2 and not http2_available():
+        print("⚠️ API_HTTP2=1 but the h2 package is missing – using HTTP/1.1 "
+              "(pip install 'python-telegram-bot[http2]')")
+        http2 = False
+    common = dict(keepalive=keepalive, http2=http2, timeout=timeout,
+                  connect_timeout=connect_timeout, pool_timeout=pool_timeout)
+    return (PooledRequest("interactive", interactive, **common),
+            PooledRequest("background", background, **common))
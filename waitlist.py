@@ -0,0 +1,158 @@
+# waitlist.py – "Notify me" queue per yard with held claim offers
+# -------------------------------------------------
+# Instead of polling 📋 Status while a yard is full, users join a FIFO
+# per (yard, pool) – regular or charging slots.  The waitlist follows
+# the occupancy engine, so every path that frees a slot (leave, expiry,
+# admin reset, other workers) hands it to the head of the matching
+# queue: that user gets a one‑tap offer and the slot is held for them
+# for ``hold_seconds``.  A lapsed or declined hold moves the slot on
+# to the next in line.  Slots the bot keeps for someone else (a
+# booking) are not offered.  Joins are cancelled lazily (a sequence
+# number per join), so leaving the queue is O(1).
+# Waitlists live in process memory; a restart empties them.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Callable
+
+from telegram.ext import CallbackContext, Job, JobQueue
+
+from occupancy import Occupancy, Occupant
+
+Pool = tuple[str, bool]                      # (yard, charging)
+Offer = Callable[[int, str, int, int], None]  # fn(user_id, yard, slot, hold_seconds)
+Lapse = Callable[[int, str, int], None]       # fn(user_id, yard, slot)
+Kept = Callable[[str, int], bool]             # fn(yard, slot) -> not for the waitlist
+
+
+class Waitlist:
+    """FIFO of waiting users per yard and pool, plus the slots on hold for them."""
+
+    def __init__(self, job_queue: JobQueue, occupancy: Occupancy,
+                 on_offer: Offer, on_lapse: Lapse, hold_seconds: int = 120,
+                 kept: Kept | None = None):
+        self.job_queue = job_queue
+        self.occupancy = occupancy
+        self.on_offer = on_offer
+        self.on_lapse = on_lapse
+        self.kept = kept
+        self.hold_seconds = hold_seconds
+        self._queues: dict[Pool, deque[tuple[int, int]]] = {}  # pool -> (seq, user_id)
+        self._waiting: dict[int, tuple[str, bool, int]] = {}    # user_id -> (yard, charging, seq)
+        self._holds: dict[tuple[str, int], tuple[int, Job]] = {}  # (yard, slot) -> (user_id, job)
+        self._seq = 0
+        occupancy.listeners.append(self._on_change)
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+    # ── joining / leaving ──────────────────────────────────────────────────
+    def join(self, user_id: int, yard: str, charging: bool = False) -> int:
+        """Queue *user_id* (moving them if already waiting); returns their position."""
+        self._seq += 1
+        self._waiting[user_id] = (yard, charging, self._seq)
+        q = self._queues.setdefault((yard, charging), deque())
+        q.append((self._seq, user_id))
+        return sum(1 for seq, uid in q if self._valid(seq, uid))
+
+    def cancel(self, user_id: int) -> bool:
+        """Take *user_id* off the waitlist; False if they weren't on it."""
+        return self._waiting.pop(user_id, None) is not None
+
+    def waiting(self, user_id: int) -> tuple[str, bool] | None:
+        """``(yard, charging)`` the user is waiting for, or None."""
+        w = self._waiting.get(user_id)
+        return w and w[:2]
+
+    def _valid(self, seq: int, user_id: int) -> bool:
+        w = self._waiting.get(user_id)
+        return w is not None and w[2] == seq
+
+    # ── holds ──────────────────────────────────────────────────────────────
+    def holder(self, yard: str, slot: int) -> int | None:
+        """User the slot is currently held for, if any."""
+        hold = self._holds.get((yard, slot))
+        return hold[0] if hold else None
+
+    def held(self, yard: str) -> set[int]:
+        return {s for (y, s) in self._holds if y == yard}
+
+    def decline(self, yard: str, slot: int, user_id: int) -> bool:
+        """The holder passes; the slot goes to the next in line."""
+        if self.holder(yard, slot) != user_id:
+            return False
+        self._drop_hold(yard, slot)
+        self._offer(yard, slot)
+        return True
+
+    def _drop_hold(self, yard: str, slot: int):
+        _uid, job = self._holds.pop((yard, slot))
+        job.schedule_removal()
+
+    async def _lapse(self, ctx: CallbackContext):
+        yard, slot, user_id = ctx.job.data
+        if self.holder(yard, slot) != user_id:
+            return
+        del self._holds[(yard, slot)]
+        self.on_lapse(user_id, yard, slot)
+        self._offer(yard, slot)
+
+    # ── handing out freed slots ────────────────────────────────────────────
+    def _offer(self, yard: str, slot: int) -> bool:
+        """Hold *slot* for the first eligible waiter of its pool and tell them."""
+        y = self.occupancy.yards.get(yard)
+        if y is None or not y.is_free(slot) or (yard, slot) in self._holds:
+            return False
+        if self.kept is not None and self.kept(yard, slot):
+            return False
+        q = self._queues.get((yard, y.is_charging(slot)))
+        while q:
+            seq, uid = q.popleft()
+            if not self._valid(seq, uid):
+                continue                             # cancelled or re‑joined
+            del self._waiting[uid]
+            if self.occupancy.where(uid) is not None:
+                continue                             # parked by other means
+            job = self.job_queue.run_once(self._lapse, when=self.hold_seconds,
+                                          data=(yard, slot, uid), name=f"hold:{yard}:{slot}:{uid}")
+            self._holds[(yard, slot)] = (uid, job)
+            self.on_offer(uid, yard, slot, self.hold_seconds)
+            return True
+        return False
+
+    def _on_change(self, event: str, yard: str, slot: int | None, occ: Occupant | None):
+        if event == "park":
+            self._waiting.pop(occ.user_id, None)
+            if (yard, slot) in self._holds:          # taken by its holder (or another worker)
+                self._drop_hold(yard, slot)
+            for key in [k for k, (uid, _job) in self._holds.items() if uid == occ.user_id]:
+                self._drop_hold(*key)                # parked elsewhere – pass the offer on
+                self._offer(*key)
+        elif event == "leave":
+            self._offer(yard, slot)
+        else:                                        # "clear" – the whole yard is free
+            for (y, s) in [k for k in self._holds if k[0] == yard]:
+                self._drop_hold(y, s)
+            for s in self.occupancy.free_slots(yard):
+                if not any(self._queues.get((yard, c)) for c in (False, True)):
+                    break
+                self._offer(yard, s)
+
+    # ── housekeeping ───────────────────────────────────────────────────────
+    def clear(self):
+        """Forget every waiter and hold (nightly reset)."""
+        for y, s in list(self._holds):
+            self._drop_hold(y, s)
+        self._queues.clear()
+        self._waiting.clear()
+
+    def prune(self):
+        """Drop waiters and holds for yards / slots a config reload removed."""
+        for (y, s) in [k for k in self._holds if k[1] not in self.occupancy.yards.get(k[0], ())]:
+            self._drop_hold(y, s)
+        for uid in [u for u, w in self._waiting.items() if w[0] not in self.occupancy.yards]:
+            del self._waiting[uid]
+        for pool in [p for p in self._queues if p[0] not in self.occupancy.yards]:
+            del self._queues[pool]
@@ -0,0 +1,170 @@
+# webhook_reply.py – One Bot API call answered in the webhook response
+# -------------------------------------------------
+# Telegram accepts one Bot API method as the body of the webhook
+# response, which saves that call its own HTTPS round trip.  With
+# reply mode on, the webhook runs the update inline under a ReplySlot
+# (a context variable, so only that update's handler sees it) and
+# ReplyingRequest holds back the handler's first replyable call,
+# answering it with a stand‑in result:
+#
+# * the handler finishes with exactly that one call → it becomes the
+#   webhook response body and is never sent;
+# * a second call comes → the held one is sent first, then the new
+#   one, and the response stays empty – except that a callback answer
+#   (which only stops the button's spinner) is order‑free: it stays
+#   held, or goes out alongside, while the other call proceeds;
+# * the handler is still busy at the deadline → the held call is sent
+#   the normal way.
+#
+# A stand‑in ``sendMessage`` result has message_id 0; handlers that need
+# the real message call :func:`send_directly` first.
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable
+
+from telegram.request import BaseRequest, RequestData
+
+from metrics import REGISTRY
+
+# calls whose result a handler can do without (and that carry no files)
+REPLYABLE = frozenset({"sendMessage", "answerCallbackQuery", "editMessageText",
+                       "editMessageReplyMarkup"})
+REPLIES = REGISTRY.counter("webhook_replies_total",
+                           "Bot API calls returned in the webhook response instead of sent.",
+                           ("method",))
+
+_SLOT: ContextVar["ReplySlot | None"] = ContextVar("webhook_reply_slot", default=None)
+
+
+class _Call:
+    """A held Bot API call, sendable later exactly as it was made."""
+
+    __slots__ = ("request", "url", "method", "data", "kwargs")
+
+    def __init__(self, request: BaseRequest, url: str, method: str, data: RequestData, kwargs: dict):
+        self.request = request
+        self.url = url
+        self.method = method
+        self.data = data
+        self.kwargs = kwargs
+
+    @property
+    def api(self) -> str:
+        return self.url.rsplit("/", 1)[-1]
+
+    def body(self) -> dict:
+        return {"method": self.api, **self.data.parameters}
+
+    async def send(self):
+        try:
+            await self.request.do_request(self.url, self.method, self.data, **self.kwargs)
+        except Exception as exc:            # the handler already got its stand‑in result
+            print(f"⚠️ deferred {self.api} failed: {exc!r}")
+
+
+class ReplySlot:
+    """Room for one call in the response of the webhook request handling an update."""
+
+    __slots__ = ("open", "held", "flushing")
+
+    def __init__(self):
+        self.open = True
+        self.held: _Call | None = None
+        self.flushing: asyncio.Future | None = None   # held call being sent late
+
+    def close(self) -> _Call | None:
+        """Stop holding calls; returns the one held, if any."""
+        self.open = False
+        held, self.held = self.held, None
+        return held
+
+
+def send_directly():
+    """Calls made for the current update go out at once (the handler needs their results)."""
+    slot = _SLOT.get()
+    if slot is not None and slot.open:
+        held = slot.close()
+        if held is not None:
+            slot.flushing = asyncio.ensure_future(held.send())
+
+
+def _stand_in(api: str, params: dict) -> bytes:
+    """A successful Bot API response for a call that was held back."""
+    if api == "answerCallbackQuery" or "inline_message_id" in params:
+        result: object = True
+    else:
+        result = {"message_id": params.get("message_id", 0), "date": int(time.time()),
+                  "chat": {"id": params.get("chat_id"), "type": "private"},
+                  "text": params.get("text", "")}
+    return json.dumps({"ok": True, "result": result}).encode()
+
+
+class ReplyingRequest(BaseRequest):
+    """Wraps the bot's request object; holds back a call while a :class:`ReplySlot` is open."""
+
+    def __init__(self, inner: BaseRequest):
+        self.inner = inner
+
+    @property
+    def read_timeout(self) -> float | None:
+        return self.inner.read_timeout
+
+    async def initialize(self):
+        await self.inner.initialize()
+
+    async def shutdown(self):
+        await self.inner.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         **kwargs) -> tuple[int, bytes]:
+        slot = _SLOT.get()
+        if slot is not None:
+            api = url.rsplit("/", 1)[-1]
+            if (slot.open and slot.held is None and api in REPLYABLE
+                    and request_data is not None and not request_data.contains_files):
+                slot.held = _Call(self.inner, url, method, request_data, kwargs)
+                return 200, _stand_in(api, request_data.parameters)
+            if api == "answerCallbackQuery" or (slot.held is not None
+                                                and slot.held.api == "answerCallbackQuery"):
+                pass                        # order‑free: neither waits for the other
+            else:
+                if slot.open:
+                    send_directly()         # a second call – keep the order, send both
+                if slot.flushing is not None:
+                    await asyncio.shield(slot.flushing)
+        return await self.inner.do_request(url, method, request_data, **kwargs)
+
+
+async def handle_with_reply(process: Callable[[dict], Awaitable[None]], update: dict,
+                            timeout: float) -> dict | None:
+    """
+    Process *update* with reply capture on.  Returns the webhook response
+    body – the handler's one call – or None if there is nothing to return.
+    """
+    async def run():
+        try:
+            await process(update)
+        except Exception as exc:            # same as an ingest worker
+            print(f"❌ update {update.get('update_id')} failed: {exc!r}")
+
+    slot = ReplySlot()
+    token = _SLOT.set(slot)
+    try:
+        task = asyncio.ensure_future(run())   # the task copies the context, slot included
+    finally:
+        _SLOT.reset(token)
+    done, _pending = await asyncio.wait((task,), timeout=timeout)
+    held = slot.close()
+    if held is None:
+        return None
+    if not done:                            # too slow – send it after all
+        slot.flushing = asyncio.ensure_future(held.send())
+        return None
+    REPLIES.inc(held.api)
+    return held.body()
@@ -0,0 +1,69 @@
+# yards.py – File‑driven yard configuration
+# -------------------------------------------------
+# Yards live in a JSON file (``YARDS_FILE``, default yards.json next to
+# bot.py) instead of code, so new parking structures are onboarded
+# without a redeploy and picked up by a hot reload.  Format:
+#
+#   {
+#     "Hamasger50": {
+#       "slots": [[1, 31]],                 # ids and/or [first, last] ranges
+#       "blocks": {"2": [1], "11": [10, 9]},# sparse: only slots that block
+#       "charging_slots": [],
+#       "reminder_after_min": 90,           # optional per‑yard policies
+#       "expire_after_min": 840
+#     }
+#   }
+# -------------------------------------------------
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+# yard names ride in inline‑button callback data, which Telegram caps at
+# 64 bytes; the longest is "unbook:<yard>:<slot>:<start epoch>"
+MAX_NAME_BYTES = 40
+
+
+def _slot_ids(spec) -> range | list[int]:
+    """``[[1, 31]]`` / ``[1, 2, [5, 9]]`` → a range when contiguous, else a sorted list."""
+    if isinstance(spec, dict):                      # legacy: full blocks map
+        spec = list(spec)
+    if len(spec) == 1 and isinstance(spec[0], list):
+        first, last = spec[0]
+        return range(int(first), int(last) + 1)
+    ids: set[int] = set()
+    for item in spec:
+        if isinstance(item, list):
+            ids.update(range(int(item[0]), int(item[1]) + 1))
+        else:
+            ids.add(int(item))
+    return sorted(ids)
+
+
+def normalise(raw: dict[str, dict]) -> dict[str, dict]:
+    """Turn the JSON shape into the in‑memory ``PARKING_YARDS`` shape (int keys)."""
+    yards = {}
+    for name, cfg in raw.items():
+        if not name or len(name.encode("utf-8")) > MAX_NAME_BYTES:
+            raise ValueError(f"yard name {name!r} must be 1–{MAX_NAME_BYTES} bytes (UTF‑8)")
+        blocks = {int(s): [int(b) for b in bl]
+                  for s, bl in cfg.get("blocks", {}).items() if bl}
+        slots = _slot_ids(cfg["slots"]) if "slots" in cfg else _slot_ids(cfg.get("blocks", {}))
+        yards[name] = {
+            **{k: v for k, v in cfg.items() if k not in ("slots", "blocks", "charging_slots")},
+            "slots": slots,
+            "blocks": blocks,
+            "charging_slots": [int(s) for s in cfg.get("charging_slots", [])],
+        }
+    return yards
+
+
+def load_yards(path: str | Path) -> dict[str, dict]:
+    """Read and normalise *path*; raises ValueError on unreadable / malformed files."""
+    try:
+        with Path(path).open(encoding="utf-8") as f:
+            raw = json.load(f)
+        return normalise(raw)
+    except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"cannot load yards from {path}: {exc}") from exc